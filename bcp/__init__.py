@@ -1,6 +1,44 @@
-"""This is a python utility that allows users to import/export data to/from a database."""
+"""
+This is a python utility that allows users to import/export data to/from a database. Importing it does no filesystem
+work, and AsyncBCP, TransferLimiter and BCPBatch, which depend on asyncio and the scheduler, the mssql LoadHints,
+ResultCache and RetentionPolicy are imported on first use.
+"""
 __version__ = '0.4.0'
 
+import importlib
+import sys
+
 from .core import BCP
 from .connections import Connection
 from .files import DataFile
+from .results import TransferResult
+
+_LAZY_ATTRIBUTES = {
+    'AsyncBCP': '.aio',
+    'TransferLimiter': '.aio',
+    'BCPBatch': '.batch',
+    'LoadHints': '.dialects.mssql',
+    'ResultCache': '.cache',
+    'RetentionPolicy': '.artifacts',
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ (PEP 562) is not available, so these are imported eagerly
+    from .aio import AsyncBCP, TransferLimiter
+    from .artifacts import RetentionPolicy
+    from .batch import BCPBatch
+    from .cache import ResultCache
+    from .dialects.mssql import LoadHints
@@ -0,0 +1,296 @@
+"""
+This module contains an asyncio-native counterpart to the BCP object. Its load() and dump() methods are coroutines that
+run bcp through asyncio's subprocess support, so hundreds of transfers can be in flight without a thread per transfer.
+The number of concurrent bcp processes is bounded by a TransferLimiter, both globally and per database host. Cancelling
+a transfer kills its bcp process.
+
+Example:
+
+.. code-block:: python
+
+    import asyncio
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.AsyncBCP(conn, limiter=bcp.TransferLimiter(max_transfers=64, max_per_host=8))
+
+    async def main():
+        files = [bcp.DataFile(file_path=f'path/to/file_{i}.csv', delimiter=',') for i in range(100)]
+        await asyncio.gather(*[my_bcp.load(input_file=file, table='table_name') for file in files])
+
+    asyncio.run(main())
+"""
+import asyncio
+import time
+import weakref
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
+
+from . import jobs
+from .cache import ResultCache
+from .dialects import get_dialect
+from .dialects.base import BCPLoad
+from .exceptions import BCPExecutionException, ParallelTransferException
+from .files import DataFile
+from .pipes import NamedPipe, compress_from, decompress_into
+from .progress import Progress
+from .results import TransferResult
+
+if TYPE_CHECKING:
+    from .connections import Connection
+
+
+class TransferLimiter:
+    """
+    This bounds the number of concurrent bcp processes started by AsyncBCP objects. A single limiter can (and generally
+    should) be shared by every AsyncBCP object in an application, which is what happens when no limiter is supplied.
+    Semaphores are created per event loop, so a limiter can be reused across calls to asyncio.run().
+
+    Args:
+        max_transfers: the maximum number of concurrent transfers across all hosts
+        max_per_host: the maximum number of concurrent transfers against any one host
+    """
+    def __init__(self, max_transfers: int = 32, max_per_host: int = 8):
+        self.max_transfers = max_transfers
+        self.max_per_host = max_per_host
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self, host: tuple = None) -> asyncio.Semaphore:
+        loop = asyncio.get_event_loop()
+        transfers, hosts = self._semaphores.setdefault(loop, (asyncio.Semaphore(self.max_transfers), {}))
+        if host is None:
+            return transfers
+        if host not in hosts:
+            hosts[host] = asyncio.Semaphore(self.max_per_host)
+        return hosts[host]
+
+    def acquire(self, connection: 'Connection') -> '_TransferSlot':
+        """
+        This reserves a transfer slot for the connection's host, waiting for one to become available.
+
+        Args:
+            connection: the connection the transfer will use
+
+        Returns:
+            an async context manager that holds the slot until it exits
+        """
+        return _TransferSlot(self._semaphore(), self._semaphore((connection.host, connection.port)))
+
+    def __repr__(self):
+        return f'TransferLimiter(max_transfers={self.max_transfers}, max_per_host={self.max_per_host})'
+
+
+class _TransferSlot:
+    """This holds both the global and the per-host semaphore for the duration of a transfer."""
+    def __init__(self, transfers: asyncio.Semaphore, host: asyncio.Semaphore):
+        self._transfers = transfers
+        self._host = host
+
+    async def __aenter__(self):
+        await self._host.acquire()
+        try:
+            await self._transfers.acquire()
+        except BaseException:
+            self._host.release()
+            raise
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._transfers.release()
+        self._host.release()
+
+
+default_limiter = TransferLimiter()
+
+
+class AsyncBCP:
+    """
+    This is the asyncio counterpart of BCP. It accepts the same arguments on load() and dump(), but those methods are
+    coroutines and bcp processes are started with asyncio.create_subprocess_exec.
+
+    Args:
+        connection: a Connection object that contains authorization details and database details
+        limiter: the TransferLimiter that bounds concurrent transfers, defaulted to one shared by all AsyncBCP objects
+        hooks: callables that receive the TransferResult of every load and dump, including failed ones
+
+    Example:
+
+    .. code-block:: python
+
+        import bcp
+
+        conn = bcp.Connection('host', 'mssql', 'username', 'password')
+        my_bcp = bcp.AsyncBCP(conn)
+    """
+    def __init__(self, connection: 'Connection', limiter: TransferLimiter = None,
+                 hooks: List[Callable[[TransferResult], Any]] = None):
+        self.connection = connection
+        self.limiter = limiter or default_limiter
+        self.hooks = list(hooks or [])
+
+    @property
+    def dialect(self) -> ModuleType:
+        """
+        This is the dialect module for the connection's driver, see BCP.dialect.
+        """
+        return get_dialect(self.connection.driver)
+
+    async def load(self, input_file: DataFile, table: str, parallelism: int = 1, data_format: str = 'character',
+                   resume: bool = False, batch_size: int = None, packet_size: int = None, hints: Any = None,
+                   autotune: bool = False, max_errors: int = None, quarantine_file: DataFile = None,
+                   progress: Callable[[Progress], Any] = None, stall_timeout: float = None) -> TransferResult:
+        """
+        This coroutine loads a file into a table. See BCP.load() for details.
+
+        Args:
+            input_file: the file to be loaded into the database
+            table: the table in which to land the data
+            parallelism: the number of concurrent bcp processes to use, defaulted to 1, uncompressed character data
+                only
+            data_format: 'character', 'native' or 'unicode_native', defaulted to 'character'
+            resume: checkpoint the load, and continue a previous load of this file that failed, single process only, not
+                with hints that size the batches
+            batch_size: the number of rows committed per batch, defaulted to the dialect's default
+            packet_size: the network packet size in bytes, defaulted to the server's setting
+            hints: the dialect's bulk load hints, e.g. bcp.LoadHints for mssql
+            autotune: choose the batch size and packet size for the table, instead of batch_size, packet_size and
+                hints that size the batches
+            max_errors: the number of rows bcp may reject before the load fails, defaulted to the dialect's default
+            quarantine_file: the file to gather the rejected rows of every bcp process into, see RejectedRow
+            progress: the callable that receives the progress of the load after every batch, see bcp.progress
+            stall_timeout: the seconds a bcp process may go without completing a batch before it is stopped
+
+        Returns:
+            the result of the load, with the result of each part for a parallel or tuned load
+        """
+        return await self._execute_job(jobs.load(self.connection, self.dialect, input_file, table, parallelism,
+                                                 data_format, resume, batch_size, packet_size, hints, autotune,
+                                                 max_errors, quarantine_file, progress, stall_timeout))
+
+    async def dump(self, query: str, output_file: DataFile, partition_column: str = None, partitions: int = None,
+                   boundaries: list = None, keep_parts: bool = False, data_format: str = 'character',
+                   progress: Callable[[Progress], Any] = None, stall_timeout: float = None,
+                   cache: ResultCache = None) -> TransferResult:
+        """
+        This coroutine exports the results of a query to a file. See BCP.dump() for details.
+
+        Args:
+            query: the query whose results should be saved off to a file
+            output_file: the file to which the data should be saved
+            partition_column: the column on which to split the query into ranges
+            partitions: the number of equal-width ranges to create, the column must be numeric
+            boundaries: the sorted values at which each new range starts, takes precedence over partitions
+            keep_parts: leave the part files in place instead of concatenating them into the output file
+            data_format: 'character', 'native' or 'unicode_native', defaulted to 'character'
+            progress: the callable that receives the progress of the dump after every batch, see bcp.progress
+            stall_timeout: the seconds a bcp process may go without completing a batch before it is stopped
+            cache: the ResultCache to answer the dump from, and to keep its file in, not used with keep_parts
+
+        Returns:
+            the result of the dump, with the result of each range, which includes its part file, for a partitioned dump
+        """
+        return await self._execute_job(jobs.dump(self.connection, self.dialect, query, output_file, partition_column,
+                                                 partitions, boundaries, keep_parts, data_format, progress,
+                                                 stall_timeout, cache))
+
+    async def _execute_job(self, job: jobs.Job) -> TransferResult:
+        """
+        This coroutine drives a job, see bcp.jobs, and passes its result to the hooks, whether or not it succeeded.
+        The loop is that of jobs.run(), with each step awaited.
+        """
+        try:
+            value, error = None, None
+            while True:
+                try:
+                    step = job.send(value) if error is None else job.throw(error)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                value, error = None, None
+                try:
+                    value = await self._carry_out(step)
+                except BaseException as exception:
+                    error = exception
+        except (BCPExecutionException, ParallelTransferException) as error:
+            self._notify(error.result)
+            raise
+        self._notify(result)
+        return result
+
+    async def _carry_out(self, step) -> Any:
+        """
+        This coroutine carries out a step of a job. The load/dump objects of a RunAll run concurrently on the event
+        loop, and blocking calls run on the default executor.
+        """
+        if isinstance(step, jobs.Run):
+            return await self._run(step.operation)
+        if isinstance(step, jobs.RunAll):
+            return await asyncio.gather(*[self._run(operation) for operation in step.operations],
+                                        return_exceptions=True)
+        return await asyncio.get_event_loop().run_in_executor(None, step.function, *step.args)
+
+    async def _run(self, operation) -> TransferResult:
+        """
+        This coroutine runs a dialect-specific load/dump object, through a named pipe if its data file is compressed,
+        see BCP._run(). The decompression or compression runs on the default executor.
+        """
+        data_file = operation.file
+        if data_file is None or data_file.compression is None:
+            return await self._run_process(operation)
+        pump = decompress_into if isinstance(operation, BCPLoad) else compress_from
+        loop = asyncio.get_event_loop()
+        with NamedPipe() as pipe:
+            pumping = loop.run_in_executor(None, pump, pipe, data_file)
+            operation.file = DataFile(file_path=pipe.path, delimiter=data_file.delimiter,
+                                      row_terminator=data_file.row_terminator)
+            try:
+                result = await self._run_process(operation)
+            except BCPExecutionException as error:
+                error.result.data_file = data_file
+                raise
+            finally:
+                operation.file = data_file
+                pipe.release()
+                pump_error = None
+                try:
+                    await pumping
+                except Exception as exception:
+                    pump_error = exception
+            if pump_error is not None:
+                raise pump_error
+        result.data_file = data_file
+        return result
+
+    async def _run_process(self, operation) -> TransferResult:
+        """
+        This coroutine runs a dialect-specific load/dump object once a transfer slot is available. If the coroutine is
+        cancelled while bcp is running, the bcp process is killed and reaped before the cancellation propagates.
+        """
+        async with self.limiter.acquire(self.connection):
+            arguments = operation.arguments
+            operation.artifacts.create()
+            try:
+                started = time.monotonic()
+                if getattr(operation, 'progress', None) is not None:
+                    return_code = await operation.progress.run_async(operation, arguments, operation.log_file.path,
+                                                                     self.dialect.progress_rows)
+                else:
+                    process = await asyncio.create_subprocess_exec(*arguments)
+                    try:
+                        return_code = await process.wait()
+                    except asyncio.CancelledError:
+                        if process.returncode is None:
+                            process.kill()
+                            await process.wait()
+                        raise
+            finally:
+                operation.artifacts.release()
+        return operation.result(arguments, return_code, time.monotonic() - started)
+
+    def _notify(self, result: Optional[TransferResult]):
+        if result is None:
+            return
+        for hook in self.hooks:
+            hook(result)
+
+    def __repr__(self):
+        return f'AsyncBCP(connection={repr(self.connection)}, limiter={repr(self.limiter)})'
@@ -0,0 +1,268 @@
+"""
+This module manages the files that bcp leaves behind. Every load and dump gets its own artifact directory, holding its
+log file and, for loads, its error file. The directory name combines a timestamp with a random suffix, so concurrent
+jobs never collide, and directories are grouped by day under BCP_JOBS_DIR, so no single directory grows without bound:
+
+.. code-block:: text
+
+    BCP_JOBS_DIR/2019_05_01/2019_05_01_01_00_00_000000_1f2e3d4c/bcp.log
+    BCP_JOBS_DIR/2019_05_01/2019_05_01_01_00_00_000000_1f2e3d4c/bcp.err
+
+A RetentionPolicy removes old artifact directories, either on demand or periodically on a background thread. It also
+removes the scratch files, see DataFile.scratch(), that a process which died before removing them left in BCP_DATA_DIR.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    retention = bcp.RetentionPolicy(max_age=7 * 24 * 60 * 60, max_bytes=10 * 2 ** 30, max_files=100000)
+    retention.start(interval=15 * 60)
+"""
+import datetime
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+from .config import BCP_DATA_DIR, BCP_JOBS_DIR
+
+DAY_FORMAT = '%Y_%m_%d'
+JOB_FORMAT = '%Y_%m_%d_%H_%M_%S_%f'
+
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+
+
+class JobArtifacts:
+    """
+    This is the artifact directory of a single load or dump. The path is fixed when the object is created, but the
+    directory is only created when the job runs.
+
+    Args:
+        path: the directory to use, if not provided, a unique directory under BCP_JOBS_DIR will be used
+    """
+    def __init__(self, path: Path = None):
+        if path is None:
+            now = datetime.datetime.now()
+            job_name = f'{now.strftime(JOB_FORMAT)}_{uuid.uuid4().hex[:8]}'
+            path = BCP_JOBS_DIR / Path(now.strftime(DAY_FORMAT)) / Path(job_name)
+        self.path = path
+
+    def file(self, name: str) -> Path:
+        """
+        Args:
+            name: the file name of the artifact, e.g. 'bcp.log'
+
+        Returns:
+            the path of the artifact within the directory
+        """
+        return self.path / Path(name)
+
+    def create(self) -> Path:
+        """
+        This creates the directory and marks it as in use, so that a RetentionPolicy in this process leaves it alone
+        until release() is called.
+
+        Returns:
+            the directory
+        """
+        with _active_jobs_lock:
+            _active_jobs.add(self.path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        return self.path
+
+    def release(self):
+        """This marks the directory as no longer in use by a running job."""
+        with _active_jobs_lock:
+            _active_jobs.discard(self.path)
+
+    def __repr__(self):
+        return f'JobArtifacts(path={self.path})'
+
+
+class _Job:
+    """This is an artifact directory seen by RetentionPolicy.prune(), with its totals and timestamps."""
+    def __init__(self, path: Path, started: float):
+        self.path = path
+        self.started = started
+        self.files = 0
+        self.bytes = 0
+        self.modified = started
+
+    def measure(self):
+        for entry in os.scandir(str(self.path)):
+            if entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                self.files += 1
+                self.bytes += stat.st_size
+                self.modified = max(self.modified, stat.st_mtime)
+
+
+def _parse_time(name: str, time_format: str) -> Optional[float]:
+    try:
+        return datetime.datetime.strptime(name, time_format).timestamp()
+    except ValueError:
+        return None
+
+
+class RetentionPolicy:
+    """
+    This removes artifact directories, oldest first, that are older than max_age, or that push the artifacts over
+    max_bytes or max_files in total. A limit of None is not enforced. Jobs running in this process are never removed,
+    nor is any directory written to within the last min_age seconds, which protects jobs running in other processes.
+
+    Whole days older than max_age are removed without looking inside them, so pruning a large backlog is cheap. Sizes
+    are only measured when max_bytes or max_files is set.
+
+    Scratch files are removed once they have not been written to for min_age seconds, whatever the limits, since a
+    running job removes its own as soon as it has read them.
+
+    Args:
+        max_age: the number of seconds to keep artifacts for
+        max_bytes: the total size the artifacts may occupy
+        max_files: the total number of artifact files to keep
+        min_age: the number of seconds since its last write before a directory, or a scratch file, can be removed
+        directory: the directory holding the artifacts, defaulted to BCP_JOBS_DIR
+        data_directory: the directory holding the scratch files, defaulted to BCP_DATA_DIR
+    """
+    def __init__(self, max_age: float = None, max_bytes: int = None, max_files: int = None, min_age: float = 600.0,
+                 directory: Path = None, data_directory: Path = None):
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.min_age = min_age
+        self.directory = directory or BCP_JOBS_DIR
+        self.data_directory = data_directory or BCP_DATA_DIR
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def prune(self) -> int:
+        """
+        This removes the artifact directories that fall outside the policy, and the abandoned scratch files.
+
+        Returns:
+            the number of artifact directories removed
+        """
+        now = time.time()
+        self._remove_scratch_files(now)
+        if not self.directory.is_dir():
+            return 0
+        expired_before = now - self.max_age if self.max_age is not None else None
+        removed, jobs = 0, []
+        for day in sorted(os.scandir(str(self.directory)), key=lambda entry: entry.name):
+            if not day.is_dir(follow_symlinks=False):
+                continue
+            day_started = _parse_time(day.name, DAY_FORMAT)
+            if day_started is None:
+                continue
+            day_jobs = [Path(entry.path) for entry in os.scandir(day.path) if entry.is_dir(follow_symlinks=False)]
+            day_ended = day_started + 24 * 60 * 60
+            if expired_before is not None and day_ended < expired_before and day_ended < now - self.min_age \
+                    and not any(self._is_active(path) for path in day_jobs):
+                shutil.rmtree(day.path, ignore_errors=True)
+                removed += len(day_jobs)
+                continue
+            for path in sorted(day_jobs):
+                started = _parse_time(path.name[:len('2000_01_01_00_00_00_000000')], JOB_FORMAT)
+                jobs.append(_Job(path, day_started if started is None else started))
+        if self.max_bytes is not None or self.max_files is not None:
+            for job in jobs:
+                job.measure()
+        total_bytes = sum(job.bytes for job in jobs)
+        total_files = sum(job.files for job in jobs)
+        for job in jobs:
+            expired = expired_before is not None and job.started < expired_before
+            over_bytes = self.max_bytes is not None and total_bytes > self.max_bytes
+            over_files = self.max_files is not None and total_files > self.max_files
+            if not (expired or over_bytes or over_files):
+                continue
+            if self._is_active(job.path) or job.modified > now - self.min_age:
+                continue
+            shutil.rmtree(str(job.path), ignore_errors=True)
+            total_bytes -= job.bytes
+            total_files -= job.files
+            removed += 1
+        self._remove_empty_days()
+        return removed
+
+    def _remove_scratch_files(self, now: float):
+        if not self.data_directory.is_dir():
+            return
+        for entry in os.scandir(str(self.data_directory)):
+            if entry.name.startswith('scratch.') and entry.is_file(follow_symlinks=False) \
+                    and entry.stat(follow_symlinks=False).st_mtime < now - self.min_age:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def _is_active(self, path: Path) -> bool:
+        with _active_jobs_lock:
+            return path in _active_jobs
+
+    def _remove_empty_days(self):
+        today = datetime.datetime.now().strftime(DAY_FORMAT)
+        for day in os.scandir(str(self.directory)):
+            if day.is_dir(follow_symlinks=False) and day.name != today:
+                try:
+                    os.rmdir(day.path)
+                except OSError:
+                    pass
+
+    def start(self, interval: float = 3600.0) -> threading.Thread:
+        """
+        This prunes the artifacts now and then every interval seconds on a daemon thread, until stop() is called.
+
+        Args:
+            interval: the number of seconds between prunes
+
+        Returns:
+            the background thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._prune_periodically, args=(interval,), daemon=True,
+                                        name='bcp-retention')
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """This stops the background thread started by start(), waiting for a prune in progress to finish."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _prune_periodically(self, interval: float):
+        while not self._stopped.is_set():
+            try:
+                self.prune()
+            except OSError:
+                pass
+            self._stopped.wait(interval)
+
+    def __repr__(self):
+        return f'RetentionPolicy(max_age={self.max_age}, max_bytes={self.max_bytes}, max_files={self.max_files})'
+
+
+def job_directories(directory: Path = None) -> List[Path]:
+    """
+    This function lists the artifact directories, oldest first.
+
+    Args:
+        directory: the directory holding the artifacts, defaulted to BCP_JOBS_DIR
+
+    Returns:
+        the path of each job's artifact directory
+    """
+    directory = directory or BCP_JOBS_DIR
+    if not directory.is_dir():
+        return []
+    return sorted(Path(job.path) for day in os.scandir(str(directory)) if day.is_dir(follow_symlinks=False)
+                  for job in os.scandir(day.path) if job.is_dir(follow_symlinks=False))
@@ -0,0 +1,294 @@
+"""
+This module contains a scheduler for running many loads and dumps. Jobs are queued with a priority and executed on a
+bounded pool of worker threads, with a separate cap on the number of concurrent jobs against any one database host.
+Jobs that fail for a transient reason, as judged by bcp's return code and the contents of its log file, are retried with
+exponential backoff; a job waiting out its backoff does not occupy a worker.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    batch = bcp.BCPBatch(max_workers=8, max_per_host=4, retries=3)
+    for table in ['orders', 'customers', 'products']:
+        batch.add_dump(conn, query=f'select * from {table}', output_file=bcp.DataFile(delimiter='|~|'))
+    batch.add_load(conn, input_file=bcp.DataFile(file_path='path/to/file.csv', delimiter=','), table='audit',
+                   priority=10)
+    for result in batch.run():
+        print(result)
+
+.. note::
+    A load that fails after bcp has committed some batches has already written those rows. Retrying it loads them
+    again, so set retries=0 on loads into tables that cannot tolerate duplicates, or load into a staging table.
+"""
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Any, List
+
+from .core import BCP
+from .exceptions import BCPExecutionException, ParallelTransferException
+
+if TYPE_CHECKING:
+    from .connections import Connection
+    from .files import DataFile
+
+TRANSIENT_ERRORS = re.compile(
+    r'SQLState = (08001|08S01|08S02|HYT00|HYT01|40001)'
+    r'|TCP Provider|Communication link failure|Login timeout expired|deadlock victim|server is not currently available',
+    re.IGNORECASE
+)
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    This function decides whether a failed job is worth retrying. bcp must have exited with a non-zero return code and
+    written a connection, timeout or deadlock error to its log file. A parallel transfer is transient only if every
+    failed partition is.
+
+    Args:
+        error: the exception raised by the job
+
+    Returns:
+        True if the job should be retried
+    """
+    if isinstance(error, ParallelTransferException):
+        return all(is_transient(partition_error) for partition_error in error.errors.values())
+    if isinstance(error, BCPExecutionException):
+        return error.returncode > 0 and TRANSIENT_ERRORS.search(error.output_text) is not None
+    return False
+
+
+class Job:
+    """
+    This describes a single load or dump in a BCPBatch. Jobs are created by BCPBatch.add_load() and BCPBatch.add_dump().
+
+    Args:
+        operation: 'load' or 'dump', the name of the BCP method to call
+        connection: the Connection object the job runs against
+        arguments: the keyword arguments for the BCP method
+        priority: jobs with a higher priority are started first
+        retries: the number of times to retry a transient failure
+    """
+    def __init__(self, operation: str, connection: 'Connection', arguments: dict, priority: int = 0,
+                 retries: int = 0):
+        self.operation = operation
+        self.connection = connection
+        self.arguments = arguments
+        self.priority = priority
+        self.retries = retries
+        self.attempts = 0
+        self.ready_at = 0.0
+
+    @property
+    def host(self) -> tuple:
+        return self.connection.host, self.connection.port
+
+    def execute(self) -> Any:
+        return getattr(BCP(self.connection), self.operation)(**self.arguments)
+
+    def __repr__(self):
+        return f'Job(operation={self.operation}, host={self.connection.host}, priority={self.priority})'
+
+
+class JobResult:
+    """
+    This is the outcome of a Job.
+
+    Args:
+        job: the job that ran
+        value: the value returned by the BCP method
+        error: the exception raised by the final attempt, None if the job succeeded
+        elapsed: the seconds spent running the job, across all attempts
+    """
+    def __init__(self, job: Job, value: Any = None, error: BaseException = None, elapsed: float = 0.0):
+        self.job = job
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+    @property
+    def attempts(self) -> int:
+        return self.job.attempts
+
+    def __repr__(self):
+        return f'JobResult(job={repr(self.job)}, succeeded={self.succeeded}, attempts={self.attempts}, ' \
+               f'elapsed={self.elapsed:.3f})'
+
+
+class BCPBatch:
+    """
+    This runs load and dump jobs on a bounded pool of worker threads. Each worker spends its time waiting on a bcp
+    process, so the pool size is the number of concurrent bcp processes.
+
+    Args:
+        max_workers: the maximum number of concurrent jobs
+        max_per_host: the maximum number of concurrent jobs against any one host
+        retries: the default number of times to retry a transient failure
+        backoff: the delay, in seconds, before the first retry, doubled on every subsequent retry
+        max_backoff: the longest delay, in seconds, between retries
+    """
+    def __init__(self, max_workers: int = 4, max_per_host: int = 4, retries: int = 3, backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._jobs = []
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._host_jobs = {}
+        self._running = 0
+        self._results = {}
+        self._aborted = None
+
+    def add_load(self, connection: 'Connection', input_file: 'DataFile', table: str, priority: int = 0,
+                 retries: int = None, **options) -> Job:
+        """
+        This queues a load, see BCP.load() for the options.
+
+        Args:
+            connection: the Connection object to load into
+            input_file: the file to be loaded into the database
+            table: the table in which to land the data
+            priority: jobs with a higher priority are started first
+            retries: the number of times to retry a transient failure, defaulted to the batch's setting
+
+        Returns:
+            the queued job
+        """
+        arguments = dict(options, input_file=input_file, table=table)
+        return self._add(Job('load', connection, arguments, priority, self.retries if retries is None else retries))
+
+    def add_dump(self, connection: 'Connection', query: str, output_file: 'DataFile', priority: int = 0,
+                 retries: int = None, **options) -> Job:
+        """
+        This queues a dump, see BCP.dump() for the options.
+
+        Args:
+            connection: the Connection object to dump from
+            query: the query whose results should be saved off to a file
+            output_file: the file to which the data should be saved
+            priority: jobs with a higher priority are started first
+            retries: the number of times to retry a transient failure, defaulted to the batch's setting
+
+        Returns:
+            the queued job
+        """
+        arguments = dict(options, query=query, output_file=output_file)
+        return self._add(Job('dump', connection, arguments, priority, self.retries if retries is None else retries))
+
+    def _add(self, job: Job) -> Job:
+        self._jobs.append(job)
+        self._push(job)
+        return job
+
+    def _push(self, job: Job):
+        heapq.heappush(self._queue, (-job.priority, next(self._sequence), job))
+
+    def run(self) -> List[JobResult]:
+        """
+        This runs every queued job and waits for all of them to finish. A job that raises something other than an
+        Exception, e.g. SystemExit, stops the batch: the jobs still queued are dropped, the running ones are waited
+        for, and the exception is raised here.
+
+        Returns:
+            a JobResult per job, in the order the jobs were added
+        """
+        workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(self.max_workers, 1))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        jobs, self._jobs = self._jobs, []
+        aborted, self._aborted = self._aborted, None
+        if aborted is not None:
+            self._results.clear()
+            raise aborted
+        return [self._results.pop(id(job)) for job in jobs]
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            started = time.monotonic()
+            job.attempts += 1
+            value, error = None, None
+            try:
+                value = job.execute()
+            except Exception as exception:
+                error = exception
+            except BaseException as exception:
+                error = exception
+                return
+            finally:
+                self._finish(job, value, error, time.monotonic() - started)
+
+    def _finish(self, job: Job, value: Any, error: BaseException, elapsed: float):
+        """
+        This records the outcome of an attempt and frees its slots, whatever the job raised, so that run() never waits
+        on a job that is no longer running.
+        """
+        with self._condition:
+            self._running -= 1
+            self._host_jobs[job.host] -= 1
+            previous = self._results.get(id(job))
+            total_elapsed = elapsed + (previous.elapsed if previous else 0.0)
+            self._results[id(job)] = JobResult(job, value, error, total_elapsed)
+            if error is not None and not isinstance(error, Exception):
+                if self._aborted is None:
+                    self._aborted = error
+                self._queue.clear()
+            elif error is not None and job.attempts <= job.retries and is_transient(error):
+                job.ready_at = time.monotonic() + self._delay(job.attempts)
+                self._push(job)
+            self._condition.notify_all()
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _next_job(self) -> Job:
+        """
+        This waits for the highest priority job that is ready to run and whose host is below its cap. It returns None
+        once the queue is empty and no job is running, since a running job may still be queued again for a retry.
+        """
+        with self._condition:
+            while True:
+                if not self._queue and self._running == 0:
+                    return None
+                now = time.monotonic()
+                deferred, chosen, wake_at = [], None, None
+                while self._queue:
+                    entry = heapq.heappop(self._queue)
+                    job = entry[-1]
+                    if job.ready_at > now:
+                        wake_at = job.ready_at if wake_at is None else min(wake_at, job.ready_at)
+                        deferred.append(entry)
+                    elif self._host_jobs.get(job.host, 0) >= self.max_per_host:
+                        deferred.append(entry)
+                    else:
+                        chosen = job
+                        break
+                for entry in deferred:
+                    heapq.heappush(self._queue, entry)
+                if chosen is not None:
+                    self._running += 1
+                    self._host_jobs[chosen.host] = self._host_jobs.get(chosen.host, 0) + 1
+                    return chosen
+                self._condition.wait(None if wake_at is None else wake_at - now)
+
+    def __repr__(self):
+        return f'BCPBatch(max_workers={self.max_workers}, max_per_host={self.max_per_host}, retries={self.retries})'
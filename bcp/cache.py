@@ -0,0 +1,268 @@
+"""
+This module caches the results of dumps, see the cache option of BCP.dump(). Pipelines that export the same expensive
+query within minutes of each other can share one run of bcp: the first dump's file is kept under BCP_CACHE_DIR, and a
+later dump of the same query, from the same server and user, in the same format, is answered by cloning that file into
+its output file instead of querying again. Queries are compared after collapsing whitespace outside string literals and
+quoted identifiers.
+
+Files are cloned by reflink where the filesystem supports it, e.g. btrfs or XFS, which shares the data until either
+copy is modified, otherwise by hard link, and only copied when the cache is on a different filesystem. Every clone is
+written to a temporary name and renamed into place, and an entry is published by atomically replacing its index file, so
+concurrent readers see either the previous file or the complete new one, never a partial file.
+
+Entries expire after the cache's ttl, and when the cache outgrows max_bytes the least recently used entries are evicted
+first. An entry whose file has been modified since it was cached, e.g. through a hard link, is treated as a miss.
+
+.. note::
+    A hard-linked output file shares its data with the cache entry and with other files cloned from it. Dumps replace
+    such a file rather than overwrite it, see detach(); other programs should do the same instead of modifying it in
+    place.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn)
+    cache = bcp.ResultCache(ttl=15 * 60, max_bytes=50 * 2 ** 30)
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    result = my_bcp.dump(query='select * from sales', output_file=file, cache=cache)
+    print(result.cached)
+"""
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from .config import BCP_CACHE_DIR, ensure_directory
+from .results import TransferResult
+from .state import atomic_write, state_key, write_json_atomic
+
+if TYPE_CHECKING:
+    from .connections import Connection
+    from .files import DataFile
+
+FICLONE = 0x40049409
+ORPHAN_AGE = 600.0
+QUERY_TOKENS = re.compile(r"('(?:[^']|'')*'|\[(?:[^\]]|\]\])*\]|\"(?:[^\"]|\"\")*\")|\s+")
+
+
+class ResultCache:
+    """
+    This is a cache of dump results on disk, see the module documentation.
+
+    Args:
+        ttl: the number of seconds a dump's file is reused for
+        max_bytes: the total size the cached files may occupy, None for no limit
+        directory: the directory holding the cache, defaulted to BCP_CACHE_DIR
+    """
+    def __init__(self, ttl: float = 3600.0, max_bytes: int = None, directory: Path = None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = directory or BCP_CACHE_DIR
+
+    def key(self, connection: 'Connection', query: str, data_file: 'DataFile', data_format: str) -> str:
+        """
+        Args:
+            connection: the Connection object the dump runs against
+            query: the query being dumped
+            data_file: the output file, whose delimiter, row terminator and compression are part of the key
+            data_format: the data format of the dump
+
+        Returns:
+            the key of the dump's entry
+        """
+        parts = [connection.driver, connection.host, str(connection.port), str(connection.auth.username),
+                 normalize_query(query), data_format, data_file.delimiter, data_file.row_terminator,
+                 str(data_file.compression)]
+        return state_key(*parts)
+
+    def get(self, key: str, output_file: 'DataFile') -> Optional[TransferResult]:
+        """
+        This clones the cached file of an entry into the output file, replacing it atomically.
+
+        Args:
+            key: the key of the entry, see key()
+            output_file: the file to materialize
+
+        Returns:
+            the result of the cached dump, whose cached flag is set, or None on a miss
+        """
+        started = time.monotonic()
+        index_path = self._index_path(key)
+        entry = _read_entry(index_path)
+        if entry is None or time.time() - entry['created'] > self.ttl:
+            return None
+        data_path = self.directory / Path(entry['data'])
+        try:
+            stat = data_path.stat()
+            if (stat.st_size, stat.st_mtime_ns) != (entry['size'], entry['mtime_ns']):
+                return None
+            _clone(data_path, output_file.path)
+            os.utime(str(index_path))
+        except OSError:
+            # evicted or replaced since the index was read
+            return None
+        return TransferResult(rows_copied=entry['rows_copied'], elapsed=time.monotonic() - started,
+                              rows_per_second=entry['rows_per_second'], packet_size=entry['packet_size'],
+                              data_file=output_file, cached=True)
+
+    def put(self, key: str, data_file: 'DataFile', result: TransferResult) -> bool:
+        """
+        This caches the file written by a successful dump, then evicts the entries outside the cache's limits.
+
+        Args:
+            key: the key of the entry, see key()
+            data_file: the file the dump wrote
+            result: the result of the dump
+
+        Returns:
+            True if the file was cached, False if it is missing or larger than max_bytes
+        """
+        if not data_file.path.is_file():
+            return False
+        size = data_file.path.stat().st_size
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        data_path = ensure_directory(self.directory) / Path(f'{key}.{uuid.uuid4().hex}.data')
+        _clone(data_file.path, data_path)
+        stat = data_path.stat()
+        entry = {'data': data_path.name, 'created': time.time(), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                 'rows_copied': result.rows_copied, 'rows_per_second': result.rows_per_second,
+                 'packet_size': result.packet_size}
+        write_json_atomic(self._index_path(key), entry)
+        self.evict()
+        return True
+
+    def evict(self) -> int:
+        """
+        This removes expired entries, then the least recently used entries until the cache fits within max_bytes, and
+        the files of entries that have been replaced.
+
+        Returns:
+            the number of entries removed
+        """
+        if not self.directory.is_dir():
+            return 0
+        now = time.time()
+        removed, entries, referenced = 0, [], set()
+        for index_path in self.directory.glob('*.json'):
+            entry = _read_entry(index_path)
+            data_path = None if entry is None else self.directory / Path(entry['data'])
+            if data_path is not None and now - entry['created'] <= self.ttl:
+                try:
+                    entries.append((index_path.stat().st_mtime, data_path.stat().st_size, index_path, data_path))
+                    referenced.add(data_path.name)
+                    continue
+                except OSError:
+                    pass
+            _remove(index_path, data_path)
+            removed += 1
+        # files of replaced entries, and those left behind by interrupted writers, once no writer can still publish them
+        for path in itertools.chain(self.directory.glob('*.data'), self.directory.glob('*.tmp')):
+            try:
+                if path.name not in referenced and now - path.stat().st_ctime > ORPHAN_AGE:
+                    path.unlink()
+            except OSError:
+                pass
+        if self.max_bytes is not None:
+            total_bytes = sum(size for _, size, _, _ in entries)
+            for _, size, index_path, data_path in sorted(entries, key=lambda entry: entry[0]):
+                if total_bytes <= self.max_bytes:
+                    break
+                _remove(index_path, data_path)
+                removed += 1
+                total_bytes -= size
+        return removed
+
+    def clear(self):
+        """This removes every entry."""
+        if self.directory.is_dir():
+            shutil.rmtree(str(self.directory), ignore_errors=True)
+
+    def _index_path(self, key: str) -> Path:
+        return self.directory / Path(f'{key}.json')
+
+    def __repr__(self):
+        return f'ResultCache(ttl={self.ttl}, max_bytes={self.max_bytes}, directory={self.directory})'
+
+
+def normalize_query(query: str) -> str:
+    """
+    This function collapses runs of whitespace in a query into single spaces, except within string literals and quoted
+    identifiers, and drops trailing semicolons, so that formatting does not change the query's cache key.
+    """
+    return QUERY_TOKENS.sub(lambda match: match.group(1) or ' ', query).strip().rstrip(';').rstrip()
+
+
+def detach(data_file: 'DataFile'):
+    """
+    This function removes a file that is hard-linked to other files, e.g. by a cache hit, before it is written, so that
+    writing it does not modify the cache entry or the other files.
+    """
+    try:
+        if data_file.path.stat().st_nlink > 1:
+            data_file.path.unlink()
+    except OSError:
+        pass
+
+
+def _clone(source: Path, target: Path):
+    """
+    This function clones a file by reflink, hard link or copy, in that order of preference, into a temporary file that
+    then replaces the target atomically.
+    """
+    with atomic_write(target) as staging_path:
+        if not _reflink(source, staging_path):
+            try:
+                os.link(str(source), str(staging_path))
+            except OSError:
+                shutil.copyfile(str(source), str(staging_path))
+
+
+def _reflink(source: Path, target: Path) -> bool:
+    """
+    This function clones a file with the FICLONE ioctl, which only Linux provides.
+
+    Returns:
+        True if the target was created, False if the platform or filesystem cannot clone the source
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    with source.open('rb') as source_file, target.open('wb') as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+            return True
+        except OSError:
+            pass
+    target.unlink()
+    return False
+
+
+def _read_entry(index_path: Path) -> Optional[dict]:
+    try:
+        entry = json.loads(index_path.read_text())
+    except (OSError, ValueError):
+        return None
+    return entry if isinstance(entry, dict) and 'data' in entry else None
+
+
+def _remove(index_path: Path, data_path: Optional[Path]):
+    """
+    This function removes an entry, its index first, so that readers stop finding it before its file disappears.
+    """
+    for path in (index_path, data_path):
+        if path is not None:
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,101 @@
+"""
+This module persists the progress of resumable loads, see BCP.load(resume=True). A load commits its rows in batches, and
+bcp reports every batch it sends in its log file. Before bcp starts, a checkpoint recording the first row of the attempt
+and the location of its log file is written under BCP_CHECKPOINT_DIR. If the load fails, or the process running it
+dies, the next resumable load of the same file into the same table reads the committed batches back out of that log and
+starts bcp at the first uncommitted row. The checkpoint is removed once a load succeeds.
+
+A checkpoint is only used while the data file has the same size and modification time as when it was written; loading a
+changed file starts from the beginning.
+
+.. note::
+    Rows that bcp rejects into the error file are not sent, so they shift the row numbers of later batches. Resume only
+    loads that failed without rejecting rows, e.g. because of a connection failure.
+"""
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
+
+from .config import BCP_CHECKPOINT_DIR
+from .state import state_path, write_json_atomic
+
+if TYPE_CHECKING:
+    from .connections import Connection
+    from .files import DataFile
+
+
+class LoadCheckpoint:
+    """
+    This is the checkpoint of a resumable load of a data file into a table.
+
+    Args:
+        connection: the Connection object the load runs against
+        data_file: the file being loaded
+        table: the table being loaded
+    """
+    def __init__(self, connection: 'Connection', data_file: 'DataFile', table: str):
+        self.connection = connection
+        self.data_file = data_file
+        self.table = table
+        self.path = state_path(BCP_CHECKPOINT_DIR, connection.driver, connection.host, str(connection.port), table,
+                               str(data_file.path))
+
+    def _identity(self) -> dict:
+        stat = self.data_file.path.stat()
+        return {'table': self.table, 'data_file': str(self.data_file.path), 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns}
+
+    def read(self) -> Optional[dict]:
+        """
+        Returns:
+            the saved checkpoint, or None if there is none or the data file has changed since it was saved
+        """
+        try:
+            state = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return None
+        if any(state.get(name) != value for name, value in self._identity().items()):
+            return None
+        return state
+
+    def next_row(self, committed_rows: Callable[[str, int], int]) -> int:
+        """
+        This works out where a resumed load should start.
+
+        Args:
+            committed_rows: the dialect's function for reading the committed rows out of a log file
+
+        Returns:
+            the number of the first row that was not committed, 1 if there is no checkpoint
+        """
+        state = self.read()
+        if state is None:
+            return 1
+        first_row = state['first_row']
+        log_file = state.get('log_file')
+        if log_file is not None and Path(log_file).is_file():
+            output = Path(log_file).read_text(errors='replace')
+            first_row += committed_rows(output, state['batch_size'])
+        return first_row
+
+    def save(self, first_row: int, batch_size: int, log_file: Path = None):
+        """
+        This records the start of an attempt, or the progress of a finished one when log_file is None. The checkpoint is
+        replaced atomically, so a crash never leaves a partial checkpoint behind.
+
+        Args:
+            first_row: the first row of the attempt
+            batch_size: the number of rows per committed batch
+            log_file: the log file bcp writes its progress to
+        """
+        state = dict(self._identity(), first_row=first_row, batch_size=batch_size,
+                     log_file=None if log_file is None else str(log_file))
+        write_json_atomic(self.path, state)
+
+    def clear(self):
+        """This removes the checkpoint once the load has finished."""
+        if self.path.exists():
+            self.path.unlink()
+
+    def __repr__(self):
+        return f'LoadCheckpoint(table={self.table}, data_file={self.data_file.path})'
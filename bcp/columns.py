@@ -0,0 +1,235 @@
+"""
+This module decodes a character data file, e.g. the output of a dump, into compact typed columns, see
+DataFile.to_columns(). Integers and floats are stored in array.array, so each value takes 8 bytes instead of a python
+object, strings are stored as their encoded bytes in one buffer with an array of offsets, and NULLs are marked in a
+bitmap. The file is cut into record-aligned chunks, which are decoded a column at a time, on a process pool for large
+files, and the decoded chunks are appended to the columns in file order.
+
+The types of the columns come from a schema of names and types, either given or read from the format file of a table or
+query, see BCP.schema(). int, float and str are supported; anything else is decoded as str.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn)
+    file = bcp.DataFile(file_path='path/to/sales.tsv')
+    my_bcp.dump(query='select id, region, amount from sales', output_file=file)
+    columns = file.to_columns(schema=[('id', int), ('region', str), ('amount', float)])
+    print(sum(columns['amount'].values), columns['region'][0], columns['id'].null_count)
+"""
+import array
+import itertools
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .files import DataFile
+from .sorting import _runs
+
+CHUNK_SIZE = 1 << 20
+TYPE_CODES = {int: 'q', float: 'd'}
+
+
+class Column:
+    """
+    This is a column of values decoded from a data file, with a bitmap marking its NULLs. Indexing returns the value,
+    or None for NULL.
+
+    Args:
+        name: the name of the column
+        values: the storage of the values, in which NULLs hold a placeholder
+        nulls: the bitmap of NULLs, bit i of byte i // 8 is set for row i
+    """
+    def __init__(self, name: str, values: Any, nulls: bytearray):
+        self.name = name
+        self.values = values
+        self.nulls = nulls
+
+    def is_null(self, row: int) -> bool:
+        return bool(self.nulls[row >> 3] & (1 << (row & 7)))
+
+    @property
+    def null_count(self) -> int:
+        return sum(bin(byte).count('1') for byte in self.nulls if byte)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns:
+            the number of bytes that the values and the bitmap take up
+        """
+        return self.values.itemsize * len(self.values) + len(self.nulls)
+
+    def __getitem__(self, row: int) -> Any:
+        if row < 0:
+            row += len(self)
+        return None if self.is_null(row) else self.values[row]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[Any]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def __repr__(self):
+        return f'{type(self).__name__}(name={self.name}, rows={len(self)}, nulls={self.null_count})'
+
+
+class IntColumn(Column):
+    """This is a column of 64-bit integers, stored in an array.array('q')."""
+
+
+class FloatColumn(Column):
+    """This is a column of double precision floats, stored in an array.array('d')."""
+
+
+class StringColumn(Column):
+    """
+    This is a column of strings. The encoded values are concatenated into one buffer, and value i is the bytes between
+    offsets[i] and offsets[i + 1], decoded when it is read.
+
+    Args:
+        name: the name of the column
+        offsets: the array.array('q') of the start of every value in the buffer, followed by the end of the last one
+        buffer: the encoded values
+        nulls: the bitmap of NULLs
+        encoding: the encoding of the values
+    """
+    def __init__(self, name: str, offsets: array.array, buffer: bytearray, nulls: bytearray, encoding: str = 'utf-8'):
+        super().__init__(name, offsets, nulls)
+        self.offsets = offsets
+        self.buffer = buffer
+        self.encoding = encoding
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.itemsize * len(self.offsets) + len(self.buffer) + len(self.nulls)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        if row < 0:
+            row += len(self)
+        if self.is_null(row):
+            return None
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]].decode(self.encoding)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def to_columns(data_file: DataFile, schema: Sequence[Tuple[str, Any]], workers: int = None, encoding: str = 'utf-8',
+               chunk_size: int = CHUNK_SIZE) -> Dict[str, Column]:
+    """
+    This function decodes a character data file into typed columns, see the module documentation.
+
+    Args:
+        data_file: the file, which must not be compressed
+        schema: the name and type of every field of the file, in order
+        workers: the number of worker processes, defaulted to the number of processors, 1 decodes in this process
+        encoding: the encoding of the file
+        chunk_size: the approximate number of bytes decoded per task
+
+    Returns:
+        the columns by name, in the order of the schema
+
+    Raises:
+        ValueError: the file is compressed, or a record has the wrong number of fields or a value of the wrong type
+    """
+    if data_file.compression is not None:
+        raise ValueError(f'{data_file.path.name} is compressed and cannot be decoded in chunks')
+    types = tuple(column_type if column_type in TYPE_CODES else str for _, column_type in schema)
+    terminator = data_file.row_terminator.encode(encoding)
+    tasks = [(str(data_file.path), start, end, data_file.delimiter.encode(encoding), terminator, types)
+             for start, end in _runs(data_file, terminator, chunk_size)]
+    if workers == 1 or len(tasks) <= 1:
+        chunks = (_decode_chunk(*task) for task in tasks)
+        return _assemble(schema, types, chunks, encoding)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(tasks))) as executor:
+        return _assemble(schema, types, executor.map(_decode_chunk, *zip(*tasks)), encoding)
+
+
+def _decode_chunk(path: str, start: int, end: int, delimiter: bytes, terminator: bytes, types: Tuple[type, ...]) \
+        -> Tuple[int, list]:
+    """
+    This function decodes one chunk of a file a column at a time. It runs in a worker process, so it reads the chunk
+    itself, and returns arrays and bytes, which are cheap to send back. The chunk is split into one flat list of fields,
+    from which every column is a slice, so no list is built per record.
+
+    Returns:
+        the number of records, and for each column its values, as an array or as a buffer and the end offsets of its
+        values, and the rows of the chunk that are NULL
+    """
+    with open(path, 'rb') as source:
+        source.seek(start)
+        chunk = source.read(end - start)
+    if chunk.endswith(terminator):
+        chunk = chunk[:-len(terminator)]
+    if not chunk:
+        return 0, [(b'', array.array('q'), array.array('q')) if column_type is str else
+                   (array.array(TYPE_CODES[column_type]), array.array('q')) for column_type in types]
+    lines = chunk.split(terminator)
+    delimiters = set(map(bytes.count, lines, itertools.repeat(delimiter)))
+    if delimiters != {len(types) - 1}:
+        record = next(number for number, line in enumerate(lines) if line.count(delimiter) != len(types) - 1)
+        raise ValueError(f'the record at byte {start} + {record} lines has {lines[record].count(delimiter) + 1} '
+                         f'fields, expected {len(types)}')
+    records = len(lines)
+    del lines
+    fields = chunk.replace(terminator, delimiter).split(delimiter)
+    del chunk
+    decoded = []
+    for position, column_type in enumerate(types):
+        values = fields[position::len(types)]
+        nulls = array.array('q', [row for row, value in enumerate(values) if not value]) if b'' in values \
+            else array.array('q')
+        if column_type is str:
+            if b'\0' in values:
+                values = [b'' if value == b'\0' else value for value in values]
+            decoded.append((b''.join(values), array.array('q', itertools.accumulate(map(len, values))), nulls))
+            continue
+        if nulls:
+            values = [value or b'0' for value in values]
+        decoded.append((array.array(TYPE_CODES[column_type], map(column_type, values)), nulls))
+    return records, decoded
+
+
+def _assemble(schema: Sequence[Tuple[str, Any]], types: Tuple[type, ...], chunks, encoding: str) -> Dict[str, Column]:
+    """
+    This function appends decoded chunks to the columns in order, then marks the NULLs of every column in its bitmap.
+    """
+    storage = [(array.array('q', [0]), bytearray()) if column_type is str else array.array(TYPE_CODES[column_type])
+               for column_type in types]
+    nulls = [[] for _ in types]  # type: List[List[Tuple[int, array.array]]]
+    rows = 0
+    for records, decoded in chunks:
+        for position, column_type in enumerate(types):
+            if column_type is str:
+                buffer, ends, chunk_nulls = decoded[position]
+                offsets, column_buffer = storage[position]
+                base = len(column_buffer)
+                offsets.extend(map(base.__add__, ends) if base else ends)
+                column_buffer += buffer
+            else:
+                values, chunk_nulls = decoded[position]
+                storage[position].extend(values)
+            if chunk_nulls:
+                nulls[position].append((rows, chunk_nulls))
+        rows += records
+    columns = {}
+    for position, ((name, _), column_type) in enumerate(zip(schema, types)):
+        bitmap = bytearray((rows + 7) // 8)
+        for first_row, chunk_nulls in nulls[position]:
+            for row in chunk_nulls:
+                row += first_row
+                bitmap[row >> 3] |= 1 << (row & 7)
+        if column_type is str:
+            offsets, buffer = storage[position]
+            columns[name] = StringColumn(name, offsets, buffer, bitmap, encoding)
+        else:
+            column_class = IntColumn if column_type is int else FloatColumn
+            columns[name] = column_class(name, storage[position], bitmap)
+    return columns
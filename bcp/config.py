@@ -1,5 +1,6 @@
 """
-This module creates directories (or returns existing directories) to store logs, data and other artifacts.
+This module defines the directories used to store logs, data and other artifacts. Importing it does no filesystem work;
+each directory is created the first time a file is placed in it, see ensure_directory().
 
 .. note::
     This application defaults to creating a 'bcp' directory inside of the user's home directory. This would be the value
@@ -20,7 +21,27 @@ def get_bcp_root_dir() -> Path:
 BCP_ROOT_DIR = get_bcp_root_dir()
 BCP_DATA_DIR = BCP_ROOT_DIR / Path('data')
 BCP_LOGGING_DIR = BCP_ROOT_DIR / Path('logs')
+BCP_FORMAT_DIR = BCP_ROOT_DIR / Path('formats')
+BCP_JOBS_DIR = BCP_ROOT_DIR / Path('jobs')
+BCP_CHECKPOINT_DIR = BCP_ROOT_DIR / Path('checkpoints')
+BCP_TUNING_DIR = BCP_ROOT_DIR / Path('tuning')
+BCP_WATERMARK_DIR = BCP_ROOT_DIR / Path('watermarks')
+BCP_CACHE_DIR = BCP_ROOT_DIR / Path('cache')
 
-BCP_ROOT_DIR.mkdir(parents=True, exist_ok=True)
-BCP_DATA_DIR.mkdir(parents=True, exist_ok=True)
-BCP_LOGGING_DIR.mkdir(parents=True, exist_ok=True)
+_created_directories = set()
+
+
+def ensure_directory(directory: Path) -> Path:
+    """
+    This function creates a directory, and its parents, the first time it is needed in this process.
+
+    Args:
+        directory: the directory that is about to be written to
+
+    Returns:
+        the directory
+    """
+    if directory not in _created_directories:
+        directory.mkdir(parents=True, exist_ok=True)
+        _created_directories.add(directory)
+    return directory
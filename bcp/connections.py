@@ -19,6 +19,7 @@ Example:
     conn = bcp.Connection(host, 'mssql', username, password)
     my_bcp = bcp.BCP(conn)
 """
+from . import dialects
 from .exceptions import DriverNotSupportedException, InvalidCredentialException
 
 
@@ -86,7 +87,7 @@ class Connection:
 
     @driver.setter
     def driver(self, value: str = None):
-        if value not in ['mssql']:
+        if not dialects.is_supported(value):
             raise DriverNotSupportedException
         self._driver = value
 
@@ -103,13 +104,4 @@ class Connection:
         Returns:
              a BCP formatted, dialect-specific, connection string
         """
-        if self.driver == 'mssql':
-            if self.auth.type == 'Trusted':
-                auth_string = f'-T'
-            else:
-                auth_string = f'-U {self.auth.username} -P {self.auth.password}'
-            if self.port:
-                machine = f'{self.host},{self.port}'
-            else:
-                machine = self.host
-            return f'-S {machine} {auth_string}'
+        return dialects.get_dialect(self.driver).connection_string(self)
@@ -4,14 +4,24 @@ dependencies on Connection and DataFile, it serves as the entry point to the lib
 it in to the BCP object, and then use load() or dump() to read data into and out of a database. See the methods below
 for examples.
 """
-from typing import TYPE_CHECKING
+import functools
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Optional, Tuple
 
-from .exceptions import DriverNotSupportedException
-from .dialects import mssql
+from .exceptions import BCPExecutionException, ParallelTransferException
+from .dialects import get_dialect
+from .files import DataFile, FormatFile
+from .results import TransferResult
 
+# the jobs, pipes and the modules behind the less common transfers are imported by the methods that use them, so that
+# importing the library stays cheap
 if TYPE_CHECKING:
+    from . import jobs
+    from .cache import ResultCache
     from .connections import Connection
-    from .files import DataFile
+    from .pipes import NamedPipe
+    from .progress import Progress
 
 
 class BCP:
@@ -21,6 +31,7 @@ class BCP:
 
     Args:
         connection: a Connection object that contains authorization details and database details
+        hooks: callables that receive the TransferResult of every load and dump, including failed ones
 
     Example:
 
@@ -31,16 +42,56 @@ class BCP:
         conn = bcp.Connection('host', 'mssql', 'username', 'password')
         my_bcp = bcp.BCP(conn)
     """
-    def __init__(self, connection: 'Connection'):
+    def __init__(self, connection: 'Connection', hooks: List[Callable[[TransferResult], Any]] = None):
         self.connection = connection
+        self.hooks = list(hooks or [])
 
-    def load(self, input_file: 'DataFile', table: str):
+    @property
+    def dialect(self) -> ModuleType:
         """
-        This method provides an interface to the lower level dialect-specific BCP load classes
+        This is the dialect module for the connection's driver, which is imported the first time it is used.
+
+        Returns:
+            the dialect module, see bcp.dialects
+        """
+        return get_dialect(self.connection.driver)
+
+    def load(self, input_file: 'DataFile', table: str, parallelism: int = 1, data_format: str = 'character',
+             resume: bool = False, batch_size: int = None, packet_size: int = None, hints: Any = None,
+             autotune: bool = False, max_errors: int = None, quarantine_file: DataFile = None,
+             progress: Callable[['Progress'], Any] = None, stall_timeout: float = None) -> TransferResult:
+        """
+        This method provides an interface to the lower level dialect-specific BCP load classes. When parallelism is
+        greater than one, the file is split into that many record-aligned parts, which are loaded into the same table
+        concurrently, one bcp process per part. The parts are removed once all of them have finished. Native data is
+        loaded with a format file for the table, which is generated once per table schema and cached. A compressed file
+        (.gz, .bz2 or .xz) is decompressed into a named pipe as bcp reads it. A resumable load checkpoints the batches
+        bcp commits; if it fails, loading the same file into the same table again with resume set skips the rows that
+        were already committed, see bcp.checkpoints. A tuned load uses the batch size and packet size found to be
+        fastest for the table, calibrating them on the first tuned load of the table, see bcp.tuning; calibration
+        needs a single process, so parallel and resumable loads only use settings that are already known. A file sorted
+        by DataFile.sort() is loaded with a hint declaring its order, so the server does not sort it again.
 
         Args:
             input_file: the file to be loaded into the database
             table: the table in which to land the data
+            parallelism: the number of concurrent bcp processes to use, defaulted to 1, uncompressed character data
+                only
+            data_format: 'character', 'native' or 'unicode_native', defaulted to 'character'
+            resume: checkpoint the load, and continue a previous load of this file that failed, single process only, not
+                with hints that size the batches
+            batch_size: the number of rows committed per batch, defaulted to the dialect's default
+            packet_size: the network packet size in bytes, defaulted to the server's setting
+            hints: the dialect's bulk load hints, e.g. bcp.LoadHints for mssql, which receive the order of a sorted file
+            autotune: choose the batch size and packet size for the table, instead of batch_size, packet_size and
+                hints that size the batches
+            max_errors: the number of rows bcp may reject before the load fails, defaulted to the dialect's default
+            quarantine_file: the file to gather the rejected rows of every bcp process into, see RejectedRow
+            progress: the callable that receives the progress of the load after every batch, see bcp.progress
+            stall_timeout: the seconds a bcp process may go without completing a batch before it is stopped
+
+        Returns:
+            the result of the load, with the result of each part for a parallel or tuned load
 
         Example:
 
@@ -52,21 +103,142 @@ class BCP:
             my_bcp = bcp.BCP(conn)
             file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
             my_bcp.load(input_file=file, table='table_name')
+            my_bcp.load(input_file=file, table='table_name', parallelism=4)
+            my_bcp.load(input_file=file, table='table_name', resume=True)
+            my_bcp.load(input_file=file, table='table_name', hints=bcp.LoadHints(tablock=True), autotune=True)
+        """
+        from . import jobs
+        return self._execute_job(jobs.load(self.connection, self.dialect, input_file, table, parallelism, data_format,
+                                           resume, batch_size, packet_size, hints, autotune, max_errors,
+                                           quarantine_file, progress, stall_timeout))
+
+    def load_rows(self, rows: Iterable[tuple], table: str, delimiter: str = None, batch_rows: int = 10000,
+                  encoding: str = 'utf-8') -> TransferResult:
+        """
+        This method loads rows straight from python into a table. The rows are serialized in batches into a named pipe
+        that bcp reads while the rows are still being produced, so nothing is written to disk and memory use is bounded
+        by the batch size. Values are written in character mode: None is loaded as NULL, and '' as an empty string. If
+        the rows raise an exception, bcp is sent the rows produced so far and the exception is re-raised once bcp has
+        finished. Named pipes are only available on POSIX platforms.
+
+        Args:
+            rows: any iterable of tuples, e.g. a generator or a database cursor
+            table: the table in which to land the data
+            delimiter: the field delimiter, which must not appear in the data, defaulted to a tab
+            batch_rows: the number of rows serialized per write to the pipe
+            encoding: the encoding of the serialized text
+
+        Returns:
+            the result of the load
+
+        Example:
+
+        .. code-block:: python
+
+            import bcp
+
+            conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+            my_bcp = bcp.BCP(conn)
+            rows = ((i, f'name_{i}') for i in range(1000000))
+            my_bcp.load_rows(rows=rows, table='table_name', delimiter='|~|')
+        """
+        from .pipes import NamedPipe, write_rows
+        with NamedPipe() as pipe, _thread_pool(1) as executor:
+            data_file = DataFile(file_path=pipe.path, delimiter=delimiter)
+            writer = executor.submit(write_rows, pipe, rows, data_file.delimiter, encoding=encoding,
+                                     batch_rows=batch_rows)
+            try:
+                result = self._execute(self.dialect.Load(self.connection, data_file, table))
+            finally:
+                pipe.release()
+                # a failed bcp process takes precedence over an error raised by the rows
+                writer_error = writer.exception()
+            if writer_error is not None:
+                raise writer_error
+        return result
+
+    def load_csv(self, input_file: DataFile, table: str, header: bool = False, workers: int = None,
+                 encoding: str = 'utf-8', max_errors: int = None) -> TransferResult:
+        """
+        This method loads a quoted CSV file, whose fields may contain the delimiter, quotes and line breaks. The file is
+        rewritten into a form without quoting on a process pool, and streamed into bcp through a named pipe as it is
+        rewritten, so no intermediate file is written, see bcp.normalize. Named pipes are only available on POSIX
+        platforms.
+
+        Args:
+            input_file: the uncompressed CSV file, with a single character delimiter
+            table: the table in which to land the data
+            header: skip the first record, which holds the column names
+            workers: the number of processes rewriting the file, defaulted to the number of processors
+            encoding: the encoding of the file
+            max_errors: the number of rows bcp may reject before the load fails, defaulted to the dialect's default
+
+        Returns:
+            the result of the load
+
+        Example:
+
+        .. code-block:: python
+
+            import bcp
+
+            conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+            my_bcp = bcp.BCP(conn)
+            file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+            my_bcp.load_csv(input_file=file, table='table_name', header=True)
         """
-        if self.connection.driver == 'mssql':
-            load = mssql.MSSQLLoad(self.connection, input_file, table)
-        else:
-            raise DriverNotSupportedException
-        load.execute()
+        if input_file.compression is not None:
+            raise ValueError(f'{input_file.path.name} is compressed and cannot be normalized in parallel chunks')
+        from .jobs import _load_options
+        from .normalize import NORMALIZED_DELIMITER, NORMALIZED_ROW_TERMINATOR, normalize_into
+        from .pipes import NamedPipe
+        with NamedPipe() as pipe, _thread_pool(1) as executor:
+            data_file = DataFile(file_path=pipe.path, delimiter=NORMALIZED_DELIMITER,
+                                 row_terminator=NORMALIZED_ROW_TERMINATOR)
+            normalizing = executor.submit(normalize_into, pipe, input_file, workers=workers, header=header,
+                                          encoding=encoding)
+            load = self.dialect.Load(self.connection, data_file, table, **_load_options(max_errors=max_errors))
+            try:
+                result = self._execute(load)
+            finally:
+                pipe.release()
+                # a failed bcp process takes precedence over an error raised while normalizing
+                normalize_error = normalizing.exception()
+            if normalize_error is not None:
+                raise normalize_error
+        result.data_file = input_file
+        return result
 
-    def dump(self, query: str, output_file: 'DataFile'):
+    def dump(self, query: str, output_file: 'DataFile', partition_column: str = None, partitions: int = None,
+             boundaries: list = None, keep_parts: bool = False, data_format: str = 'character',
+             progress: Callable[['Progress'], Any] = None, stall_timeout: float = None,
+             cache: 'ResultCache' = None) -> TransferResult:
         """
-        This method provides an interface to the lower level dialect-specific BCP dump classes.
+        This method provides an interface to the lower level dialect-specific BCP dump classes. When a partition column
+        is supplied, the query is split into ranges on that column and each range is exported concurrently, one bcp
+        process per range. The ranges are either given explicitly as boundaries, or computed as equal-width numeric
+        ranges from the minimum and maximum of the column. The part files are written alongside the output file and
+        then concatenated into it, unless keep_parts is set. Native data is exported with a format file for the query,
+        which is generated once per query schema and cached. When the output file is compressed (.gz, .bz2 or .xz),
+        bcp writes into a named pipe and the data is compressed as it arrives; the parts of a partitioned dump are
+        compressed individually and concatenated. With a cache, a recent dump of the same query is reused instead of
+        running bcp, see bcp.cache; the hooks still receive its result, whose cached flag is set.
 
         Args:
             query: the query whose results should be saved off to a file
             output_file: the file to which the data should be saved, if no file is provided, one will be created in
                 the BCP_DATA_DIR
+            partition_column: the column on which to split the query into ranges
+            partitions: the number of equal-width ranges to create, the column must be numeric
+            boundaries: the sorted values at which each new range starts, takes precedence over partitions
+            keep_parts: leave the part files in place instead of concatenating them into the output file
+            data_format: 'character', 'native' or 'unicode_native', defaulted to 'character'
+            progress: the callable that receives the progress of the dump after every batch, see bcp.progress
+            stall_timeout: the seconds a bcp process may go without completing a batch before it is stopped
+            cache: the ResultCache to answer the dump from, and to keep its file in, not used with keep_parts
+
+        Returns:
+            the result of the dump, with the result of each range, which includes its part file, for a partitioned dump
 
         Example:
 
@@ -78,12 +250,360 @@ class BCP:
             my_bcp = bcp.BCP(conn)
             file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
             my_bcp.dump(query='select * from sys.tables', output_file=file)
+            my_bcp.dump(query='select * from sales', output_file=file, partition_column='sale_id', partitions=8)
+        """
+        from . import jobs
+        return self._execute_job(jobs.dump(self.connection, self.dialect, query, output_file, partition_column,
+                                           partitions, boundaries, keep_parts, data_format, progress, stall_timeout,
+                                           cache))
+
+    def dump_incremental(self, query: str, watermark_column: str, output_file: DataFile,
+                         data_format: str = 'character') -> TransferResult:
+        """
+        This method exports the rows of a query, or table, that are new since its previous incremental export, judged by
+        a watermark column such as a modification time or a rowversion. The current high-water mark of the column is
+        read first, and the rows above the previous mark, up to the current one, are exported into the next file of a
+        sequence named after the output file, e.g. orders.000001.csv, orders.000002.csv, ... The new mark is recorded
+        only once bcp has succeeded, see bcp.watermarks. When there are no new rows, nothing is exported.
+
+        Args:
+            query: the query, or table, to export
+            watermark_column: the column whose values increase as rows are written
+            output_file: the file naming the sequence, which is itself never written
+            data_format: 'character', 'native' or 'unicode_native', defaulted to 'character'
+
+        Returns:
+            the result of the dump, whose data_file is the file written, or None when there were no new rows
+
+        Example:
+
+        .. code-block:: python
+
+            import bcp
+
+            conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+            my_bcp = bcp.BCP(conn)
+            file = bcp.DataFile(file_path='path/to/orders.csv', delimiter=',')
+            my_bcp.dump_incremental(query='dbo.orders', watermark_column='modified_at', output_file=file)
+        """
+        from .watermarks import Watermark
+        watermark = Watermark(self.connection, query, watermark_column)
+        state = watermark.read()
+        high_water = self._high_water(query, watermark_column)
+        if high_water is None or high_water == state['high_water']:
+            return TransferResult(data_file=None)
+        data_file = watermark.next_file(output_file)
+        incremental_query = self.dialect.incremental_query(query, watermark_column, state['high_water'], high_water)
+        result = self._execute(self.dialect.Dump(self.connection, incremental_query, data_file,
+                                                 data_format=data_format,
+                                                 format_file=self._format_file(query, data_format)))
+        watermark.save(high_water, state['sequence'] + 1)
+        return result
+
+    def _high_water(self, query: str, column: str) -> Optional[str]:
+        """
+        This method queries the high-water mark of a watermark column. The type of the column is queried first, so that
+        the mark can be rendered as a literal of that type.
+
+        Returns:
+            the mark as a literal for the dialect's incremental_query(), or None if there are no rows
+
+        Raises:
+            ValueError: the column does not exist, or its type cannot be a watermark
+        """
+        watermark_file = DataFile.scratch()
+        try:
+            self._run(self.dialect.Dump(self.connection, self.dialect.column_type_query(query, column), watermark_file))
+            column_type = watermark_file.path.read_text().strip()
+            if not column_type:
+                raise ValueError(f'{column} is not a column of {query}')
+            self._run(self.dialect.Dump(self.connection, self.dialect.watermark_query(query, column, column_type),
+                                        watermark_file))
+            return watermark_file.path.read_text().strip() or None
+        finally:
+            if watermark_file.path.exists():
+                watermark_file.path.unlink()
+
+    def copy(self, query: str, target_connection: 'Connection', table: str, partition_column: str = None,
+             partitions: int = None, boundaries: list = None, data_format: str = 'native', batch_size: int = None,
+             packet_size: int = None, hints: Any = None, max_errors: int = None) -> TransferResult:
+        """
+        This method copies the results of a query into a table on another connection without landing them on disk. The
+        export and the load run at the same time, connected by a named pipe, so the copy takes about as long as the
+        slower of the two. When a partition column is supplied, the query is split into ranges as for dump(), and each
+        range is copied through its own pipe, concurrently. Data is copied in native format by default, described by the
+        format file of the query on both sides, so the target table's columns must be in the same order as the query's.
+        Named pipes are only available on POSIX platforms.
+
+        .. note::
+            The load commits its batches as it goes, so if the export fails part way through, the rows received up to
+            then remain in the table.
+
+        Args:
+            query: the query whose results should be copied
+            target_connection: the Connection object for the database holding the table
+            table: the table in which to land the data
+            partition_column: the column on which to split the query into ranges
+            partitions: the number of equal-width ranges to create, the column must be numeric
+            boundaries: the sorted values at which each new range starts, takes precedence over partitions
+            data_format: 'character', 'native' or 'unicode_native', defaulted to 'native'
+            batch_size: the number of rows committed per batch, defaulted to the dialect's default
+            packet_size: the network packet size in bytes for the load, defaulted to the server's setting
+            hints: the target dialect's bulk load hints, e.g. bcp.LoadHints for mssql
+            max_errors: the number of rows the load may reject before it fails, defaulted to the dialect's default
+
+        Returns:
+            the result of the load, with the result of each range for a partitioned copy
+
+        Example:
+
+        .. code-block:: python
+
+            import bcp
+
+            source = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+            target = bcp.Connection(host='OTHER_HOST', driver='mssql', username='USER', password='PASSWORD')
+            my_bcp = bcp.BCP(source)
+            my_bcp.copy(query='select * from sales', target_connection=target, table='sales')
+            my_bcp.copy(query='select * from sales', target_connection=target, table='sales',
+                        partition_column='sale_id', partitions=4, hints=bcp.LoadHints(tablock=True))
+        """
+        format_file = self._format_file(query, data_format)
+        queries = [query]
+        if partition_column is not None:
+            if boundaries is None:
+                boundaries = self._partition_boundaries(query, partition_column, partitions or 1)
+            queries = self.dialect.partition_queries(query, partition_column, boundaries)
+        from .jobs import _load_options
+        target = BCP(target_connection)
+        options = _load_options(batch_size=batch_size, packet_size=packet_size, hints=hints, max_errors=max_errors)
+        copy_query = functools.partial(self._copy_through_pipe, target, table, data_format, format_file, options)
+        if len(queries) == 1:
+            return self._execute(query, run=copy_query)
+        return self._execute_concurrently(queries, None, run=copy_query)
+
+    def _copy_through_pipe(self, target: 'BCP', table: str, data_format: str, format_file: Optional[FormatFile],
+                           options: dict, query: str) -> TransferResult:
+        """
+        This method runs a dump and a load connected by a named pipe, which both bcp processes open by path. Once either
+        process has exited, the pipe is unblocked until the other one has too, in case it is still waiting to open the
+        pipe. A failure of the process that exited first is reported in preference to the other, since it is usually
+        the cause of both.
+        """
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from .pipes import NamedPipe
+        with NamedPipe() as pipe, _thread_pool(2) as executor:
+            data_file = DataFile(file_path=pipe.path)
+            dump = self.dialect.Dump(self.connection, query, data_file, data_format=data_format,
+                                     format_file=format_file)
+            load = target.dialect.Load(target.connection, data_file, table, data_format=data_format,
+                                       format_file=format_file, **options)
+            sides = [executor.submit(self._run, dump), executor.submit(target._run, load)]
+            finished, running = wait(sides, return_when=FIRST_COMPLETED)
+            first = finished.pop()
+            while running:
+                pipe.unblock()
+                running = wait(running, timeout=0.05).not_done
+        for side in [first] + [side for side in sides if side is not first]:
+            if side.exception() is not None:
+                raise side.exception()
+        result = sides[1].result()
+        result.data_file = None
+        return result
+
+    def dump_iter(self, query: str, delimiter: str = None, batch_rows: int = None,
+                  encoding: str = 'utf-8') -> Iterator:
+        """
+        This method exports the results of a query through a named pipe and yields the rows as bcp writes them, so
+        processing can overlap with the export and memory use stays bounded. Rows are split on the delimiter and fields
+        are returned as strings, with NULL as None. If the generator is closed early, bcp is stopped. Named pipes are
+        only available on POSIX platforms.
+
+        Args:
+            query: the query whose results should be yielded
+            delimiter: the field delimiter, which must not appear in the data, defaulted to a tab
+            batch_rows: yield lists of up to this many rows instead of one row at a time
+            encoding: the encoding of the exported text
+
+        Returns:
+            a generator of tuples, or of lists of tuples when batch_rows is set
+
+        Example:
+
+        .. code-block:: python
+
+            import bcp
+
+            conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+            my_bcp = bcp.BCP(conn)
+            for schema_name, table_name in my_bcp.dump_iter(query='select s.name, t.name from sys.tables t ...'):
+                print(schema_name, table_name)
+        """
+        from .pipes import NamedPipe, read_rows
+        with NamedPipe() as pipe, _thread_pool(1) as executor:
+            data_file = DataFile(file_path=pipe.path, delimiter=delimiter)
+            dump_operation = self.dialect.Dump(self.connection, query, data_file)
+            dump = executor.submit(self._execute_and_release, dump_operation, pipe)
+            with pipe.open_reader() as reader:
+                rows = read_rows(reader, data_file.delimiter, encoding=encoding)
+                if batch_rows is None:
+                    yield from rows
+                else:
+                    batch = []
+                    for row in rows:
+                        batch.append(row)
+                        if len(batch) >= batch_rows:
+                            yield batch
+                            batch = []
+                    if batch:
+                        yield batch
+            dump.result()
+
+    def schema(self, source: str) -> List[Tuple[str, type]]:
+        """
+        This method reads the columns of a table or query from its cached format file, as the schema for decoding a
+        character dump of it into typed columns, see DataFile.to_columns().
+
+        Args:
+            source: the table, or the query, to describe
+
+        Returns:
+            the name and python type, int, float or str, of every column, in order
+        """
+        return self.dialect.column_types(self._format_file(source, 'native'))
+
+    def _format_file(self, source: str, data_format: str) -> Optional[FormatFile]:
+        from . import jobs
+        return jobs.run(jobs.cached_format_file(self.connection, self.dialect, source, data_format), self._carry_out)
+
+    def _execute_and_release(self, operation, pipe: 'NamedPipe') -> TransferResult:
+        try:
+            return self._execute(operation)
+        finally:
+            pipe.release()
+
+    def _partition_boundaries(self, query: str, column: str, partitions: int) -> list:
+        """
+        This method queries the minimum and maximum of a numeric column and splits that range into equal-width ranges.
+
+        Returns:
+            the values at which each range after the first starts, empty if the range cannot be split
+        """
+        from . import jobs
+        return jobs.run(jobs.partition_boundaries(self.connection, self.dialect, query, column, partitions),
+                        self._carry_out)
+
+    def _execute_job(self, job: 'jobs.Job') -> TransferResult:
+        """
+        This method drives a job, see bcp.jobs, and passes its result to the hooks, whether or not it succeeded.
+        """
+        from . import jobs
+        try:
+            result = jobs.run(job, self._carry_out)
+        except (BCPExecutionException, ParallelTransferException) as error:
+            self._notify(error.result)
+            raise
+        self._notify(result)
+        return result
+
+    def _carry_out(self, step) -> Any:
+        """
+        This method carries out a step of a job, running the load/dump objects of a RunAll on a thread each.
+        """
+        from . import jobs
+        if isinstance(step, jobs.Run):
+            return self._run(step.operation)
+        if isinstance(step, jobs.RunAll):
+            with _thread_pool(len(step.operations)) as executor:
+                futures = [executor.submit(self._run, operation) for operation in step.operations]
+                return [future.exception() or future.result() for future in futures]
+        return step.function(*step.args)
+
+    def _execute(self, operation, run: Callable[[Any], TransferResult] = None) -> TransferResult:
         """
-        if self.connection.driver == 'mssql':
-            dump = mssql.MSSQLDump(self.connection, query, output_file)
-        else:
-            raise DriverNotSupportedException
-        dump.execute()
+        This method executes a dialect-specific load/dump object, or whatever run() executes, defaulted to _run(), and
+        passes its result to the hooks, whether or not bcp succeeded.
+        """
+        try:
+            result = (run or self._run)(operation)
+        except BCPExecutionException as error:
+            self._notify(error.result)
+            raise
+        self._notify(result)
+        return result
+
+    def _run(self, operation) -> TransferResult:
+        """
+        This method executes a dialect-specific load/dump object. If its data file is compressed, bcp is pointed at a
+        named pipe instead, which a thread fills by decompressing the file, for a load, or drains into the compressed
+        file, for a dump. An error in that thread is raised once bcp has finished, unless bcp itself failed.
+        """
+        data_file = operation.file
+        if data_file is None or data_file.compression is None:
+            return operation.execute()
+        from .dialects.base import BCPLoad
+        from .pipes import NamedPipe, compress_from, decompress_into
+        pump = decompress_into if isinstance(operation, BCPLoad) else compress_from
+        with NamedPipe() as pipe, _thread_pool(1) as executor:
+            pumping = executor.submit(pump, pipe, data_file)
+            operation.file = DataFile(file_path=pipe.path, delimiter=data_file.delimiter,
+                                      row_terminator=data_file.row_terminator)
+            try:
+                result = operation.execute()
+            except BCPExecutionException as error:
+                error.result.data_file = data_file
+                raise
+            finally:
+                operation.file = data_file
+                pipe.release()
+                pump_error = pumping.exception()
+            if pump_error is not None:
+                raise pump_error
+        result.data_file = data_file
+        return result
+
+    def _execute_concurrently(self, operations: list, data_file: Optional[DataFile],
+                              run: Callable[[Any], TransferResult] = None) -> TransferResult:
+        """
+        This method executes dialect-specific load/dump objects, or whatever run() executes, defaulted to _run(), on a
+        thread per object and waits for all of them. Any failures are collected and reported together, by position,
+        once every operation has finished. The hooks receive the combined result rather than the result of each part.
+        """
+        from . import jobs
+        started = time.monotonic()
+        with _thread_pool(len(operations)) as executor:
+            futures = [executor.submit(run or self._run, operation) for operation in operations]
+            outcomes = [future.exception() or future.result() for future in futures]
+        try:
+            result = jobs.combine(outcomes, time.monotonic() - started, data_file)
+        except ParallelTransferException as error:
+            self._notify(error.result)
+            raise
+        self._notify(result)
+        return result
+
+    def _notify(self, result: Optional[TransferResult]):
+        if result is None:
+            return
+        for hook in self.hooks:
+            hook(result)
 
     def __repr__(self):
         return f'BCP(connection={repr(self.connection)})'
+
+
+def equal_width_boundaries(bounds_file: DataFile, column: str, partitions: int) -> list:
+    """
+    This function moved to bcp.jobs, see bcp.jobs.equal_width_boundaries(), and is kept here for existing imports.
+    """
+    from .jobs import equal_width_boundaries
+    return equal_width_boundaries(bounds_file, column, partitions)
+
+
+def _thread_pool(max_workers: int):
+    """
+    This function creates a thread pool. concurrent.futures imports logging, which would otherwise account for much of
+    the cost of importing this library, so it is only imported once a pool is needed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=max_workers)
@@ -0,0 +1,123 @@
+"""
+This package contains the database-specific implementations of the load and dump operations. Dialects are registered by
+driver name and imported the first time a connection uses them, so importing the library does not import every dialect.
+Other packages can provide a dialect by calling register(), or by declaring an entry point in the 'bcp.dialects' group
+whose name is the driver and whose value is the dialect module.
+
+A dialect module provides:
+
+    - Load: the BCPLoad implementation, accepting first_row and last_row to load part of its file, and the load
+      options batch_size, packet_size, hints and max_errors, which are only passed when they are given; its results
+      report the rows it rejected, as rows_rejected and a quarantine_file
+    - Dump: the BCPDump implementation
+    - Load and Dump both accept a progress option, a ProgressTracker to report their progress to, see bcp.progress
+    - connection_string(connection): the connection arguments for the dialect's bcp utility
+    - Format: the class that writes the format file of a table or query, like Load and Dump
+    - fingerprint_query(source) and format_file_for(connection, source, data_format, schema): the query describing the
+      schema of a table or query, and the cached format file for that schema, see bcp.jobs.cached_format_file()
+    - column_types(format_file): the name and python type of every column of a format file, for typed decoding
+    - bounds_query(query, column) and partition_queries(query, column, boundaries): the queries for partitioned dumps
+    - committed_rows(output, batch_size): the rows a load committed before it stopped, for resumable loads
+    - progress_rows(line): the running total in a line of bcp's output, for progress tracking
+    - order_hints(hints, columns): the load hints declaring the order of a sorted data file
+    - column_type_query(query, column), watermark_query(query, column, column_type) and incremental_query(query,
+      column, low, high): the queries for incremental dumps
+
+Example:
+
+.. code-block:: python
+
+    from bcp import dialects
+
+    dialects.register('my_database', 'my_package.my_dialect')
+    my_dialect = dialects.get_dialect('my_database')
+"""
+import importlib
+from types import ModuleType
+from typing import List
+
+from ..exceptions import DriverNotSupportedException
+
+ENTRY_POINT_GROUP = 'bcp.dialects'
+
+_registry = {'mssql': 'bcp.dialects.mssql'}
+_entry_points_loaded = False
+
+
+def register(driver: str, module: str):
+    """
+    This function registers a dialect module for a driver, replacing any dialect already registered for it. The module
+    is not imported until a connection uses the driver.
+
+    Args:
+        driver: the driver name used in Connection objects
+        module: the absolute name of the dialect module
+    """
+    _registry[driver] = module
+
+
+def drivers() -> List[str]:
+    """
+    This function lists the drivers with a registered dialect, including those declared through entry points.
+
+    Returns:
+        the driver names, sorted
+    """
+    _load_entry_points()
+    return sorted(_registry)
+
+
+def is_supported(driver: str) -> bool:
+    """
+    This function checks whether a dialect is registered for a driver, without importing it. Entry points are only
+    scanned for drivers that are not registered directly.
+
+    Args:
+        driver: the driver name
+
+    Returns:
+        True if the driver has a dialect
+    """
+    if driver not in _registry:
+        _load_entry_points()
+    return driver in _registry
+
+
+def get_dialect(driver: str) -> ModuleType:
+    """
+    This function imports, on first use, and returns the dialect module for a driver.
+
+    Args:
+        driver: the driver name
+
+    Returns:
+        the dialect module
+
+    Raises:
+        DriverNotSupportedException: no dialect is registered for the driver
+    """
+    if not is_supported(driver):
+        raise DriverNotSupportedException
+    return importlib.import_module(_registry[driver])
+
+
+def _load_entry_points():
+    """
+    This function registers the dialects declared by installed packages, once. Dialects registered directly take
+    precedence. Entry points require importlib.metadata, which is available from python 3.8.
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        from importlib import metadata
+    except ImportError:
+        return
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        declared = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        declared = entry_points.get(ENTRY_POINT_GROUP, [])
+    for entry_point in declared:
+        _registry.setdefault(entry_point.name, entry_point.value)
@@ -1,6 +1,8 @@
 import abc
 from typing import TYPE_CHECKING
 
+from ..artifacts import JobArtifacts
+
 if TYPE_CHECKING:
     from ..connections import Connection
     from ..files import DataFile
@@ -20,6 +22,7 @@ class BCPLoad(abc.ABC):
         self.connection = connection
         self.file = file
         self.table = table
+        self.artifacts = JobArtifacts()
 
     @abc.abstractmethod
     def execute(self):
@@ -27,7 +30,7 @@ class BCPLoad(abc.ABC):
         This will execute the the data import process.
 
         Returns:
-             the name of the table that contains the data
+             the TransferResult of the import
         """
         raise NotImplementedError
 
@@ -46,6 +49,7 @@ class BCPDump(abc.ABC):
         self.connection = connection
         self.query = query
         self.file = file
+        self.artifacts = JobArtifacts()
 
     @abc.abstractmethod
     def execute(self):
@@ -53,7 +57,7 @@ class BCPDump(abc.ABC):
         This will execute the data export process
 
         Returns:
-             the data file object, which is useful when it is defaulted
+             the TransferResult of the export, whose data_file is useful when it is defaulted
         """
         raise NotImplementedError
 
@@ -1,17 +1,98 @@
 """
 This module contains MS SQL Server specific logic that works with the BCP command line utility. None of these classes
-are relevant beyond the scope of this library, and should not be used outside of the library.
+are relevant beyond the scope of this library, and should not be used outside of the library. It is registered as the
+'mssql' dialect, see bcp.dialects.
 """
+import copy
+import datetime
+import functools
+import re
 import subprocess
-from typing import TYPE_CHECKING
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence, Tuple
 
-from ..exceptions import DriverNotSupportedException
-from ..files import LogFile, ErrorFile
+from ..artifacts import JobArtifacts
+from ..config import BCP_FORMAT_DIR, ensure_directory
+from ..exceptions import PASSWORD_MASK, BCPExecutionException, DriverNotSupportedException
+from ..files import DataFile, LogFile, ErrorFile, FormatFile
+from ..results import RejectedRow, TransferResult
+from ..state import state_key
 from .base import BCPLoad, BCPDump
 
 if TYPE_CHECKING:
     from ..connections import Connection
-    from ..files import DataFile
+    from ..progress import ProgressTracker
+
+
+DATA_FORMATS = {'character': '-c', 'native': '-n', 'unicode_native': '-N'}
+DEFAULT_BATCH_SIZE = 10000
+PACKET_SIZE_RANGE = (512, 65535)
+QUOTED_OPTIONS = frozenset(['-t', '-r', '-f', '-h', '-o', '-e'])
+TEMPLATE_CACHE_SIZE = 1024
+
+
+class LoadHints:
+    """
+    These are the bulk load hints passed to bcp with -h. Taking a table lock lets SQL Server minimally log a load into
+    a heap, or into an empty table, under the simple or bulk-logged recovery model, which is usually the largest single
+    improvement to load throughput. Declaring the order of a file that is sorted on the clustered index lets SQL Server
+    skip sorting it.
+
+    Args:
+        tablock: take a bulk update table lock for the duration of the load
+        order: the columns the data file is sorted on, each optionally followed by ASC or DESC
+        rows_per_batch: the approximate number of rows in the file, committed as a single batch, instead of -b
+        kilobytes_per_batch: the approximate number of kilobytes per batch, instead of -b
+        check_constraints: check the table's constraints during the load
+        fire_triggers: run the table's insert triggers during the load
+
+    Example:
+
+    .. code-block:: python
+
+        import bcp
+
+        hints = bcp.LoadHints(tablock=True, order=['id'])
+        my_bcp.load(input_file=file, table='table_name', hints=hints)
+    """
+    def __init__(self, tablock: bool = False, order: Sequence[str] = None, rows_per_batch: int = None,
+                 kilobytes_per_batch: int = None, check_constraints: bool = False, fire_triggers: bool = False):
+        if rows_per_batch is not None and kilobytes_per_batch is not None:
+            raise ValueError('rows_per_batch and kilobytes_per_batch cannot be combined')
+        self.tablock = tablock
+        self.order = list(order or [])
+        self.rows_per_batch = rows_per_batch
+        self.kilobytes_per_batch = kilobytes_per_batch
+        self.check_constraints = check_constraints
+        self.fire_triggers = fire_triggers
+
+    @property
+    def sizes_batches(self) -> bool:
+        """
+        Returns:
+            True if the hints size the batches, in which case bcp must not be given a batch size
+        """
+        return self.rows_per_batch is not None or self.kilobytes_per_batch is not None
+
+    def __str__(self):
+        hints = []
+        if self.tablock:
+            hints.append('TABLOCK')
+        if self.order:
+            hints.append(f'ORDER({", ".join(self.order)})')
+        if self.rows_per_batch is not None:
+            hints.append(f'ROWS_PER_BATCH={self.rows_per_batch}')
+        if self.kilobytes_per_batch is not None:
+            hints.append(f'KILOBYTES_PER_BATCH={self.kilobytes_per_batch}')
+        if self.check_constraints:
+            hints.append('CHECK_CONSTRAINTS')
+        if self.fire_triggers:
+            hints.append('FIRE_TRIGGERS')
+        return ', '.join(hints)
+
+    def __repr__(self):
+        return f'LoadHints({self})'
 
 
 class MSSQLBCP:
@@ -19,13 +100,19 @@ class MSSQLBCP:
     file = None
     batch_size = None
     character_data = None
+    data_format = 'character'
+    format_file = None
+    artifacts = None
+    log_file = None
+    error_file = None
+    progress = None
 
     @property
     def command(self) -> str:
         """
         This allows you to see the command that will be executed via bcp without executing the command, similar to
         how sqlalchemy can show you the generated query or execute the generated query. This makes debugging a little
-        easier.
+        easier. The password is masked; bcp is started with the argument vector, see arguments.
 
         Returns:
              the command that will be passed into the bcp command line utility
@@ -33,27 +120,149 @@ class MSSQLBCP:
         raise NotImplementedError
 
     @property
-    def config(self) -> str:
+    def head(self) -> Tuple[str, str, str]:
+        """
+        Returns:
+             the first three arguments of bcp: the table or query, the direction and the data file
+        """
+        raise NotImplementedError
+
+    @property
+    def arguments(self) -> List[str]:
+        """
+        This builds the argument vector that bcp is started with, directly and without a shell, by both subprocess and
+        asyncio, so tables, queries and paths are passed to bcp exactly as they are. Everything except the job's log and
+        error files comes from a template that is cached per connection, source and options, see argument_template().
+
+        Returns:
+             the bcp executable followed by its arguments
         """
-        This method will generate a configuration string. It supports the delimiter option.
+        template = argument_template(*self.head, _connection_key(self.connection), tuple(self.options))
+        arguments = ['bcp']
+        arguments.extend(template)
+        for flag, value in self.job_options:
+            arguments.extend((flag, value))
+        return arguments
+
+    @property
+    def options(self) -> List[Tuple[str, Optional[str]]]:
+        """
+        This method will generate the configuration options. It supports the delimiter and row terminator options for
+        character data, the latter only when it is not a newline, and format files or the native flags for native data.
 
         Returns:
-             a BCP formatted configuration string
+             the flags, each with its value or None
         """
+        if self.format_file is not None:
+            return [('-f', str(self.format_file.path))]
+        if self.data_format != 'character':
+            return [(DATA_FORMATS[self.data_format], None)]
+        options = [('-t', self.file.delimiter)]
+        if self.file.row_terminator != '\n':
+            options.append(('-r', self.file.row_terminator))
         if self.character_data:
-            return f'-c -t "{self.file.delimiter}"'
-        return f'-t "{self.file.delimiter}"'
+            options.insert(0, ('-c', None))
+        return options
+
+    @property
+    def config(self) -> str:
+        """
+        Returns:
+             a BCP formatted configuration string, see options
+        """
+        return render_options(self.options)
+
+    @property
+    def job_options(self) -> List[Tuple[str, str]]:
+        """
+        This method will generate the options that are unique to the job. The log file is chosen in the job's artifact
+        directory when the job is created, so the command is the same every time it is generated. When progress is
+        tracked, bcp writes its output to stdout instead, which is copied into the log file as it is read.
+
+        Returns:
+             the flags with their values
+        """
+        if self.progress is not None:
+            return []
+        return [('-o', str(self.log_file.path))]
 
     @property
     def logging(self) -> str:
         """
-        This method will generate a log file string that will write the log file to the BCP_LOGGING_DIR directory.
+        Returns:
+             a BCP formatted log file string, see job_options
+        """
+        return render_options([('-o', str(self.log_file.path))])
+
+    def _run(self) -> TransferResult:
+        """
+        This runs bcp with the instance's arguments and waits for it to exit.
+
+        Returns:
+            the result parsed from bcp's output
+
+        Raises:
+            BCPExecutionException: bcp exited with a non-zero return code, its output is in the log file
+        """
+        arguments = self.arguments
+        self.artifacts.create()
+        try:
+            started = time.monotonic()
+            if self.progress is None:
+                exit_code = subprocess.run(arguments).returncode
+            else:
+                exit_code = self.progress.run(self, arguments, self.log_file.path, progress_rows)
+        finally:
+            self.artifacts.release()
+        return self.result(arguments, exit_code, time.monotonic() - started)
+
+    def result(self, arguments: List[str], exit_code: int, elapsed: float) -> TransferResult:
+        """
+        This builds the result of a finished bcp process from the output in its log file.
+
+        Args:
+            arguments: the arguments bcp was started with
+            exit_code: the return code of the bcp process
+            elapsed: the measured run time, used when bcp does not report its clock time
+
+        Returns:
+            the result of the transfer
+
+        Raises:
+            BCPExecutionException: the exit code is non-zero, the result is attached to the exception
+        """
+        output = ''
+        if self.log_file is not None and self.log_file.path.is_file():
+            output = self.log_file.path.read_text(errors='replace')
+        values = dict(elapsed=elapsed)
+        values.update(parse_output(output))
+        if self.error_file is not None and self.error_file.path.is_file():
+            rejects = parse_errors(self.error_file.path.read_text(errors='replace'))
+            if rejects:
+                # bcp numbers the rows of the file it read, so the rows of a part file are renumbered within the whole
+                first_record = self.file.first_record
+                for reject in rejects:
+                    reject.row += first_record - 1
+                values.update(rows_rejected=len(rejects), quarantine_file=self._quarantine(rejects))
+        result = TransferResult(exit_code=exit_code, log_file=self.log_file, error_file=self.error_file,
+                                data_file=self.file, **values)
+        if exit_code != 0:
+            raise BCPExecutionException(exit_code, arguments, self.log_file, result)
+        return result
+
+    def _quarantine(self, rejects: List[RejectedRow]) -> DataFile:
+        """
+        This writes the rows bcp rejected to a quarantine file in the job's artifact directory, with the delimiter of
+        the data file.
 
         Returns:
-             a BCP formatted log file string
+            the quarantine file
         """
-        log_file = LogFile()
-        return f'-o "{log_file.path}"'
+        quarantine_file = DataFile(file_path=self.artifacts.file('quarantine.dat'), delimiter=self.file.delimiter)
+        with quarantine_file.path.open('w', encoding='utf-8', newline='') as quarantine:
+            for reject in rejects:
+                quarantine.write(reject.format(quarantine_file.delimiter) + '\n')
+        return quarantine_file
 
 
 class MSSQLLoad(MSSQLBCP, BCPLoad):
@@ -64,22 +273,54 @@ class MSSQLLoad(MSSQLBCP, BCPLoad):
         connection: the (mssql) Connection object that points to the database from which we want to export data
         file: the file whose data should be imported into the target database
         table: the into which the data will be written
-        batch_size: the number of records to read in one commit, defaulted to 10,000
+        batch_size: the number of records to read in one commit, defaulted to 10,000 unless the hints size the batches
         character_data: allows BCP to use character data, defaulted to True
+        data_format: 'character', 'native' or 'unicode_native', defaulted to 'character'
+        format_file: the format file describing the native data, see bcp.jobs.cached_format_file()
+        first_row: the number of the first record to load, starting at 1, see RecordIndex.ranges()
+        last_row: the number of the last record to load
+        packet_size: the network packet size in bytes, between 512 and 65535, defaulted to the server's setting
+        hints: the bulk load hints, see LoadHints
+        max_errors: the number of rows bcp may reject before the load fails, defaulted to bcp's default of 10
+        progress: the tracker to report the rows sent to, see bcp.progress
     """
-    def __init__(self, connection: 'Connection', file: 'DataFile', table: str, batch_size: int = 10000,
-                 character_data: bool = True):
+    def __init__(self, connection: 'Connection', file: 'DataFile', table: str, batch_size: int = None,
+                 character_data: bool = True, data_format: str = 'character', format_file: FormatFile = None,
+                 first_row: int = None, last_row: int = None, packet_size: int = None, hints: LoadHints = None,
+                 max_errors: int = None, progress: 'ProgressTracker' = None):
         if connection.driver != 'mssql':
             raise DriverNotSupportedException
+        if data_format not in DATA_FORMATS:
+            raise ValueError(f'data_format must be one of {", ".join(DATA_FORMATS)}')
+        if packet_size is not None and not PACKET_SIZE_RANGE[0] <= packet_size <= PACKET_SIZE_RANGE[1]:
+            raise ValueError(f'packet_size must be between {PACKET_SIZE_RANGE[0]} and {PACKET_SIZE_RANGE[1]}')
+        if hints is not None and hints.sizes_batches:
+            if batch_size is not None:
+                raise ValueError('batch_size cannot be combined with the rows_per_batch or kilobytes_per_batch hints')
+        elif batch_size is None:
+            batch_size = DEFAULT_BATCH_SIZE
         super().__init__(connection, file, table)
         self.batch_size = batch_size
+        self.packet_size = packet_size
+        self.hints = hints
+        self.max_errors = max_errors
         self.character_data = character_data
+        self.data_format = data_format
+        self.format_file = format_file
+        self.first_row = first_row
+        self.last_row = last_row
+        self.progress = progress
+        self.log_file = LogFile(file_path=self.artifacts.file('bcp.log'))
+        self.error_file = ErrorFile(file_path=self.artifacts.file('bcp.err'))
 
     def execute(self):
         """
         This will run the instance's command via the BCP utility
+
+        Returns:
+            the result parsed from bcp's output
         """
-        subprocess.run(f'bcp {self.command}', check=True)
+        return self._run()
 
     @property
     def command(self) -> str:
@@ -89,28 +330,54 @@ class MSSQLLoad(MSSQLBCP, BCPLoad):
         Returns:
              the command that will be passed into the BCP command line utility
         """
-        return f'{self.table} in "{self.file.path}" {self.connection} {self.config} {self.logging} {self.error}'
+        connection = connection_string(self.connection, hide_password=True)
+        return f'{self.table} in "{self.file.path}" {connection} {self.config} {self.logging} {self.error}'
 
     @property
-    def config(self) -> str:
+    def head(self) -> Tuple[str, str, str]:
+        return self.table, 'in', str(self.file.path)
+
+    @property
+    def options(self) -> List[Tuple[str, Optional[str]]]:
         """
-        This method will generate a configuration string. It supports the delimiter and batch size options.
+        This method will generate the configuration options. It supports the delimiter, batch size, row range, packet
+        size, hint and maximum error options.
 
         Returns:
-             a BCP formatted configuration string
+             the flags, each with its value or None
         """
-        return f'{super().config} -b {self.batch_size}'
+        options = super().options
+        if self.batch_size is not None:
+            options.append(('-b', str(self.batch_size)))
+        if self.first_row is not None:
+            options.append(('-F', str(self.first_row)))
+        if self.last_row is not None:
+            options.append(('-L', str(self.last_row)))
+        if self.packet_size is not None:
+            options.append(('-a', str(self.packet_size)))
+        if self.hints is not None and str(self.hints):
+            options.append(('-h', str(self.hints)))
+        if self.max_errors is not None:
+            options.append(('-m', str(self.max_errors)))
+        return options
 
     @property
-    def error(self) -> str:
+    def job_options(self) -> List[Tuple[str, str]]:
         """
-        This method will generate an error file string that will write the error file to the BCP_DATA_DIR directory.
+        This method adds the error file, which is also chosen in the job's artifact directory, to the job's options.
 
         Returns:
-             a BCP formatted error file string
+             the flags with their values
         """
-        error_file = ErrorFile()
-        return f'-e "{error_file.path}"'
+        return super().job_options + [('-e', str(self.error_file.path))]
+
+    @property
+    def error(self) -> str:
+        """
+        Returns:
+             a BCP formatted error file string, see job_options
+        """
+        return render_options([('-e', str(self.error_file.path))])
 
 
 class MSSQLDump(MSSQLBCP, BCPDump):
@@ -121,18 +388,32 @@ class MSSQLDump(MSSQLBCP, BCPDump):
         connection: the Connection object that points to the database from which we want to export data
         query: the query defining the data to be exported
         file: the file to which the data will be written
+        character_data: allows BCP to use character data, defaulted to True
+        data_format: 'character', 'native' or 'unicode_native', defaulted to 'character'
+        format_file: the format file describing the native data, see bcp.jobs.cached_format_file()
+        progress: the tracker to report the rows received to, see bcp.progress
     """
-    def __init__(self, connection: 'Connection', query: str, file: 'DataFile', character_data: bool = True):
+    def __init__(self, connection: 'Connection', query: str, file: 'DataFile', character_data: bool = True,
+                 data_format: str = 'character', format_file: FormatFile = None, progress: 'ProgressTracker' = None):
         if connection.driver != 'mssql':
             raise DriverNotSupportedException
+        if data_format not in DATA_FORMATS:
+            raise ValueError(f'data_format must be one of {", ".join(DATA_FORMATS)}')
         super().__init__(connection, query, file)
         self.character_data = character_data
+        self.data_format = data_format
+        self.format_file = format_file
+        self.progress = progress
+        self.log_file = LogFile(file_path=self.artifacts.file('bcp.log'))
 
     def execute(self):
         """
         This will run the instance's command via the BCP utility
+
+        Returns:
+            the result parsed from bcp's output
         """
-        subprocess.run(f'bcp {self.command}', check=True)
+        return self._run()
 
     @property
     def command(self) -> str:
@@ -142,4 +423,510 @@ class MSSQLDump(MSSQLBCP, BCPDump):
         Returns:
              the command that will be passed into the BCP command line utility
         """
-        return f'"{self.query}" queryout "{self.file.path}" {self.connection} {self.config} {self.logging}'
+        connection = connection_string(self.connection, hide_password=True)
+        return f'"{self.query}" queryout "{self.file.path}" {connection} {self.config} {self.logging}'
+
+    @property
+    def head(self) -> Tuple[str, str, str]:
+        return self.query, 'queryout', str(self.file.path)
+
+
+class MSSQLFormat(MSSQLBCP):
+    """
+    This class generates an XML format file for a table or query, via bcp's format nul option.
+
+    Args:
+        connection: the Connection object that points to the database containing the table
+        source: the table, or the query, that the format file describes
+        format_file: the format file to write
+        data_format: 'native' or 'unicode_native', defaulted to 'native'
+    """
+    def __init__(self, connection: 'Connection', source: str, format_file: FormatFile, data_format: str = 'native'):
+        if connection.driver != 'mssql':
+            raise DriverNotSupportedException
+        if data_format not in DATA_FORMATS:
+            raise ValueError(f'data_format must be one of {", ".join(DATA_FORMATS)}')
+        self.connection = connection
+        self.source = source
+        self.format_file = format_file
+        self.data_format = data_format
+        self.artifacts = JobArtifacts()
+        self.log_file = LogFile(file_path=self.artifacts.file('bcp.log'))
+
+    def execute(self):
+        """
+        This will run the instance's command via the BCP utility
+
+        Returns:
+            the result parsed from bcp's output
+        """
+        return self._run()
+
+    @property
+    def command(self) -> str:
+        """
+        This method will build the command that will write the format file.
+
+        Returns:
+             the command that will be passed into the BCP command line utility
+        """
+        source = f'"{self.source}"' if is_query(self.source) else self.source
+        connection = connection_string(self.connection, hide_password=True)
+        return f'{source} format nul {connection} {self.config} {self.logging}'
+
+    @property
+    def head(self) -> Tuple[str, str, str]:
+        return self.source, 'format', 'nul'
+
+    @property
+    def options(self) -> List[Tuple[str, Optional[str]]]:
+        return [(DATA_FORMATS[self.data_format], None), ('-f', str(self.format_file.path)), ('-x', None)]
+
+
+Load = MSSQLLoad
+Dump = MSSQLDump
+Format = MSSQLFormat
+
+
+def connection_string(connection: 'Connection', hide_password: bool = False) -> str:
+    """
+    This function generates the server and authentication arguments for bcp.
+
+    Args:
+        connection: the Connection object that points to the database
+        hide_password: mask the password, for commands that are displayed rather than run
+
+    Returns:
+        a BCP formatted connection string
+    """
+    host, port, username, password = _connection_key(connection)
+    if hide_password and password is not None:
+        password = PASSWORD_MASK
+    return ' '.join(connection_arguments(host, port, username, password))
+
+
+def connection_arguments(host: str, port: Optional[int], username: Optional[str], password: Optional[str]) -> List[str]:
+    """
+    This function generates the server and authentication arguments for bcp, as an argument vector. bcp only accepts a
+    password on its command line, so it is visible in process listings while bcp runs; use a trusted connection where
+    that matters.
+
+    Returns:
+        the arguments
+    """
+    arguments = ['-S', f'{host},{port}' if port else host]
+    if username is None and password is None:
+        arguments.append('-T')
+    else:
+        arguments.extend(('-U', username, '-P', password))
+    return arguments
+
+
+def _connection_key(connection: 'Connection') -> Tuple[str, Optional[int], Optional[str], Optional[str]]:
+    return connection.host, connection.port, connection.auth.username, connection.auth.password
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def argument_template(source: str, direction: str, target: str, connection: Tuple,
+                      options: Tuple[Tuple[str, Optional[str]], ...]) -> Tuple[str, ...]:
+    """
+    This function builds the arguments of bcp that are shared by the jobs of a connection, source and options, i.e. all
+    but the log and error files. Repeated jobs reuse the template, so only the job's own files are added to it.
+
+    Args:
+        source: the table or query
+        direction: in, queryout or format
+        target: the data file, or nul for format files
+        connection: the host, port, username and password
+        options: the flags, each with its value or None
+
+    Returns:
+        the arguments
+    """
+    arguments = [source, direction, target]
+    arguments.extend(connection_arguments(*connection))
+    for flag, value in options:
+        arguments.append(flag)
+        if value is not None:
+            arguments.append(value)
+    return tuple(arguments)
+
+
+def render_options(options: Sequence[Tuple[str, Optional[str]]]) -> str:
+    """
+    This function renders options for display, quoting the values that are paths or text.
+
+    Returns:
+        a BCP formatted option string
+    """
+    rendered = []
+    for flag, value in options:
+        if value is None:
+            rendered.append(flag)
+        elif flag in QUOTED_OPTIONS:
+            rendered.append(f'{flag} "{value}"')
+        else:
+            rendered.append(f'{flag} {value}')
+    return ' '.join(rendered)
+
+
+OUTPUT_PATTERNS = {
+    'rows_copied': (re.compile(r'^\s*(\d+) rows copied', re.MULTILINE), int),
+    'packet_size': (re.compile(r'Network packet size \(bytes\):\s*(\d+)'), int),
+    'elapsed': (re.compile(r'Clock Time \(ms\.\) Total\s*:\s*(\d+)'), lambda value: int(value) / 1000),
+    'rows_per_second': (re.compile(r'Average\s*:\s*\(([\d.]+) rows per sec'), float),
+}
+
+
+def parse_output(output: str) -> dict:
+    """
+    This function extracts the summary that bcp prints at the end of a transfer, e.g.
+
+    .. code-block:: text
+
+        1000 rows copied.
+        Network packet size (bytes): 4096
+        Clock Time (ms.) Total     : 15     Average : (66666.67 rows per sec.)
+
+    Args:
+        output: the text bcp wrote to its log file
+
+    Returns:
+        the values found, keyed by their TransferResult attribute name
+    """
+    values = {}
+    for name, (pattern, convert) in OUTPUT_PATTERNS.items():
+        match = pattern.search(output)
+        if match:
+            values[name] = convert(match.group(1))
+    return values
+
+
+ERROR_PATTERN = re.compile(r'^#@ Row (\d+)(?:, Column (\d+))?: (.*?) @#\r?$', re.MULTILINE)
+
+
+def parse_errors(output: str) -> List[RejectedRow]:
+    """
+    This function reads the rows rejected by a load out of its error file, in which bcp writes each rejected record
+    after a line describing the error, e.g.
+
+    .. code-block:: text
+
+        #@ Row 2, Column 3: Invalid character value for cast specification @#
+        2	second	not a number
+
+    Args:
+        output: the text bcp wrote to its error file
+
+    Returns:
+        the rejected rows, in the order bcp reported them
+    """
+    matches = list(ERROR_PATTERN.finditer(output))
+    rejects = []
+    for position, match in enumerate(matches):
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(output)
+        record = _strip_line_break(_strip_line_break(output[match.end():end], leading=True))
+        column = None if match.group(2) is None else int(match.group(2))
+        rejects.append(RejectedRow(int(match.group(1)), column, match.group(3), record))
+    return rejects
+
+
+def _strip_line_break(text: str, leading: bool = False) -> str:
+    """
+    This function removes a single line break from the end, or the start, of the text.
+    """
+    for line_break in ('\r\n', '\n'):
+        if leading and text.startswith(line_break):
+            return text[len(line_break):]
+        if not leading and text.endswith(line_break):
+            return text[:-len(line_break)]
+    return text
+
+
+SENT_PATTERN = re.compile(r'rows sent to SQL Server\. Total sent: (\d+)')
+PROGRESS_PATTERN = re.compile(r'rows (?:sent to SQL Server|successfully bulk-copied to host-file)\. '
+                              r'Total (?:sent|received): (\d+)')
+
+
+def committed_rows(output: str, batch_size: int) -> int:
+    """
+    This function works out how many rows a load committed before it stopped, from the progress messages bcp prints
+    as it sends rows, e.g.
+
+    .. code-block:: text
+
+        10000 rows sent to SQL Server. Total sent: 10000
+
+    Each batch of batch_size rows is committed separately, so only whole batches are counted; the rows of a partial
+    batch were rolled back.
+
+    Args:
+        output: the text bcp wrote to its log file
+        batch_size: the batch size the load ran with
+
+    Returns:
+        the number of rows committed, counted from the first row of the load
+    """
+    totals = SENT_PATTERN.findall(output)
+    if not totals or not batch_size:
+        return 0
+    return int(totals[-1]) // batch_size * batch_size
+
+
+def progress_rows(line: str) -> Optional[int]:
+    """
+    This function reads the running total out of a progress message that bcp prints after each batch, e.g.
+
+    .. code-block:: text
+
+        1000 rows sent to SQL Server. Total sent: 5000
+        1000 rows successfully bulk-copied to host-file. Total received: 5000
+
+    Args:
+        line: a line of bcp's output
+
+    Returns:
+        the rows sent or received so far, None if the line is not a progress message
+    """
+    match = PROGRESS_PATTERN.search(line)
+    return int(match.group(1)) if match else None
+
+
+def is_query(source: str) -> bool:
+    """
+    This function distinguishes a query from a (possibly qualified) table name.
+    """
+    return re.search(r'\s', source.strip()) is not None
+
+
+def fingerprint_query(source: str) -> str:
+    """
+    This function builds a query that describes the columns of a table or query, which identifies its schema.
+
+    Args:
+        source: the table, or the query, to describe
+
+    Returns:
+        a query returning one row per column, with its position, name, type and nullability
+    """
+    query = source if is_query(source) else f'select * from {source}'
+    query = query.replace("'", "''")
+    return (f"select column_ordinal, name, system_type_name, is_nullable "
+            f"from sys.dm_exec_describe_first_result_set(N'{query}', null, 0) order by column_ordinal")
+
+
+def format_file_for(connection: 'Connection', source: str, data_format: str, schema: bytes) -> FormatFile:
+    """
+    This function names the cached format file of a table or query in the BCP_FORMAT_DIR. The name includes a hash of
+    the target, source, data format and schema, so altering the table produces a new format file, see
+    bcp.jobs.cached_format_file().
+
+    Args:
+        connection: the Connection object that points to the database containing the table
+        source: the table, or the query, that the format file describes
+        data_format: 'native' or 'unicode_native'
+        schema: the output of fingerprint_query() for the source
+
+    Returns:
+        the format file, which has not been generated yet if it does not exist
+    """
+    fingerprint = state_key(connection.host, str(connection.port), source, data_format, schema)[:16]
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', 'query' if is_query(source) else source)[:64]
+    return FormatFile(file_path=ensure_directory(BCP_FORMAT_DIR) / Path(f'{name}.{data_format}.{fingerprint}.xml'))
+
+
+FORMAT_NAMESPACE = '{http://schemas.microsoft.com/sqlserver/2004/bulkload/format}'
+XSI_TYPE = '{http://www.w3.org/2001/XMLSchema-instance}type'
+INTEGER_TYPES = frozenset(['SQLBIT', 'SQLTINYINT', 'SQLSMALLINT', 'SQLINT', 'SQLBIGINT'])
+FLOAT_TYPES = frozenset(['SQLFLT4', 'SQLFLT8', 'SQLDECIMAL', 'SQLNUMERIC', 'SQLMONEY', 'SQLMONEY4'])
+
+
+def column_types(format_file: FormatFile) -> List[Tuple[str, type]]:
+    """
+    This function reads the python type of every column of an XML format file, for decoding a character dump into
+    typed columns. Integer and bit columns are int, floating point, decimal and money columns are float, and all others,
+    e.g. strings and dates, are str.
+
+    Args:
+        format_file: the format file, see bcp.jobs.cached_format_file()
+
+    Returns:
+        the name and type of every column, in order
+    """
+    from xml.etree import ElementTree
+    root = ElementTree.parse(str(format_file.path)).getroot()
+    schema = []
+    for column in root.iter(f'{FORMAT_NAMESPACE}COLUMN'):
+        sql_type = column.get(XSI_TYPE, '')
+        python_type = int if sql_type in INTEGER_TYPES else float if sql_type in FLOAT_TYPES else str
+        schema.append((column.get('NAME'), python_type))
+    return schema
+
+
+def literal(value: Any) -> str:
+    """
+    This function renders a python value as a T-SQL literal so that it can be embedded in a generated query.
+
+    Args:
+        value: a number, string, date or datetime
+
+    Returns:
+        the T-SQL literal for the value
+    """
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    value = str(value).replace("'", "''")
+    return f"'{value}'"
+
+
+def bounds_query(query: str, column: str) -> str:
+    """
+    This function builds a query that returns the minimum and maximum value of a column in the results of a query.
+
+    Args:
+        query: the query whose results will be partitioned
+        column: the column whose range is needed
+
+    Returns:
+        a query returning one row with the minimum and maximum values, in that order
+    """
+    return f'select min({column}), max({column}) from ({query}) as bcp_bounds'
+
+
+def partition_queries(query: str, column: str, boundaries: List[Any]) -> List[str]:
+    """
+    This function splits a query into non-overlapping range queries on a column. The first range is open below and also
+    picks up null values, and the last range is open above, so no rows are lost. Because the original query becomes a
+    derived table, it cannot contain an ORDER BY clause without TOP.
+
+    Args:
+        query: the query to be partitioned
+        column: the column on which to partition the results
+        boundaries: the sorted values at which a new range starts
+
+    Returns:
+        one query per range, len(boundaries) + 1 in total
+    """
+    if not boundaries:
+        return [query]
+    literals = [literal(boundary) for boundary in boundaries]
+    predicates = [f'{column} < {literals[0]} or {column} is null']
+    for lower, upper in zip(literals, literals[1:]):
+        predicates.append(f'{column} >= {lower} and {column} < {upper}')
+    predicates.append(f'{column} >= {literals[-1]}')
+    return [f'select * from ({query}) as bcp_partition where {predicate}' for predicate in predicates]
+
+
+# the types that cannot be compared, or ordered, so cannot be watermarks
+UNSUPPORTED_WATERMARK_TYPES = frozenset(['text', 'ntext', 'image', 'xml', 'sql_variant', 'geography', 'geometry',
+                                         'hierarchyid'])
+# the base types of watermark columns, and the expressions rendering a value of each as a literal of its own type
+WATERMARK_LITERALS = (
+    (('binary', 'varbinary', 'timestamp'), "convert(varchar(max), convert(varbinary(max), high_water), 1)"),
+    (('date', 'smalldatetime', 'datetime', 'datetime2', 'datetimeoffset', 'time'),
+     "'''' + convert(varchar(max), convert({base_type}, high_water), 126) + ''''"),
+    (('uniqueidentifier',), "'''' + convert(varchar(max), high_water) + ''''"),
+    (('float', 'real'), "convert(varchar(max), convert(float, high_water), 3)"),
+    (('money', 'smallmoney'), "convert(varchar(max), convert(money, high_water), 2)"),
+    (('char', 'varchar', 'nchar', 'nvarchar'),
+     "'N''' + replace(convert(nvarchar(max), high_water), '''', '''''') + ''''"),
+)
+
+
+def column_type_query(query: str, column: str) -> str:
+    """
+    This function builds a query that returns the type of a column of a table or query, for watermark_query().
+
+    Args:
+        query: the table, or the query, with the column
+        column: the column, optionally in square brackets
+
+    Returns:
+        a query returning one row with the system type name of the column, e.g. 'timestamp' or 'datetime2(7)', or no
+        rows if there is no such column
+    """
+    source = (query if is_query(query) else f'select * from {query}').replace("'", "''")
+    name = column.strip('[]').replace("'", "''")
+    return (f"select system_type_name from sys.dm_exec_describe_first_result_set(N'{source}', null, 0) "
+            f"where name = N'{name}'")
+
+
+def watermark_query(query: str, column: str, column_type: str) -> str:
+    """
+    This function builds a query that returns the maximum value of a watermark column, e.g. a modification time or a
+    rowversion, in the results of a query or the rows of a table. The value is returned as a T-SQL literal of the
+    column's own type, so that it can be embedded in the next incremental query without losing precision: binary
+    values, such as rowversions, as hexadecimal, dates and times as quoted ISO 8601 strings that keep their fractional
+    seconds and time zone offset, uniqueidentifiers and strings quoted, floating point numbers with full precision,
+    money with four decimal places, and integers and decimals as they are.
+
+    Args:
+        query: the query, or the table, whose rows are exported incrementally
+        column: the watermark column
+        column_type: the system type name of the column, see column_type_query()
+
+    Returns:
+        a query returning one row with the literal, which is empty if there are no rows
+
+    Raises:
+        ValueError: values of the column's type cannot be compared, e.g. xml or varchar(max)
+    """
+    base_type = column_type.split('(')[0].strip().lower()
+    if base_type in UNSUPPORTED_WATERMARK_TYPES or column_type.replace(' ', '').lower().endswith('(max)'):
+        raise ValueError(f'{column} is of type {column_type}, which cannot be a watermark')
+    literal = next((literal for base_types, literal in WATERMARK_LITERALS if base_type in base_types),
+                   'convert(varchar(max), high_water)')
+    source = query if is_query(query) else f'select * from {query}'
+    return (f"select {literal.format(base_type=base_type)} "
+            f"from (select max({column}) as high_water from ({source}) as bcp_watermark) as bcp_high_water")
+
+
+def incremental_query(query: str, column: str, low: str = None, high: str = None) -> str:
+    """
+    This function restricts a query, or a table, to the rows whose watermark is above the previous high-water mark and
+    at most the current one. Bounding the range above means rows written while the export runs are left for the next
+    export, rather than being exported twice.
+
+    Args:
+        query: the query, or the table, whose rows are exported incrementally
+        column: the watermark column
+        low: the literal of the previous high-water mark, None for the first export
+        high: the literal of the current high-water mark, see watermark_query()
+
+    Returns:
+        the query for the new rows
+    """
+    source = query if is_query(query) else f'select * from {query}'
+    predicates = []
+    if low is not None:
+        predicates.append(f'{column} > {low}')
+    if high is not None:
+        predicates.append(f'{column} <= {high}')
+    if not predicates:
+        return source
+    return f'select * from ({source}) as bcp_incremental where {" and ".join(predicates)}'
+
+
+def order_hints(hints: Optional[LoadHints], columns: Sequence[str]) -> LoadHints:
+    """
+    This function declares the order of a sorted data file in a load's hints, see DataFile.sort(). An order given
+    explicitly in the hints takes precedence.
+
+    Args:
+        hints: the hints of the load, if any
+        columns: the table columns the data file is sorted on
+
+    Returns:
+        the hints with an ORDER hint, a copy if they had to be changed
+    """
+    if hints is None:
+        return LoadHints(order=columns)
+    if hints.order:
+        return hints
+    ordered = copy.copy(hints)
+    ordered.order = list(columns)
+    return ordered
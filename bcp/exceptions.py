@@ -1,4 +1,7 @@
 """This module contains exceptions for this application."""
+import subprocess
+
+PASSWORD_MASK = '*' * 8
 
 
 class DriverNotSupportedException(Exception):
@@ -9,3 +12,61 @@ class DriverNotSupportedException(Exception):
 class InvalidCredentialException(Exception):
     """This exception occurs when a username is provided without a password, or vice versa, for an Auth or BCP object"""
     pass
+
+
+class ParallelTransferException(Exception):
+    """
+    This exception occurs when one or more partitions of a parallel load or dump fail. The remaining partitions are
+    allowed to finish before this is raised.
+
+    Args:
+        errors: a mapping of partition number to the exception raised by that partition
+        result: the combined TransferResult of all partitions, if one was collected
+    """
+    def __init__(self, errors: dict, result=None):
+        self.errors = errors
+        self.result = result
+        failed = ', '.join(str(partition) for partition in sorted(errors))
+        super().__init__(f'{len(errors)} partition(s) failed: {failed}')
+
+
+class BCPExecutionException(subprocess.CalledProcessError):
+    """
+    This exception occurs when the bcp utility exits with a non-zero return code. It is a CalledProcessError, so it
+    carries the return code, and it also points to the log file that holds bcp's output. The password that follows -P
+    is masked in cmd, so it does not end up in logs and tracebacks.
+
+    Args:
+        returncode: the return code of the bcp process
+        cmd: the arguments bcp was started with
+        log_file: the LogFile that bcp wrote its output to
+        result: the TransferResult parsed from bcp's output
+    """
+    def __init__(self, returncode: int, cmd: list, log_file=None, result=None):
+        super().__init__(returncode, mask_password(cmd))
+        self.log_file = log_file
+        self.result = result
+
+    @property
+    def output_text(self) -> str:
+        """
+        Returns:
+            the contents of the log file, or an empty string if bcp did not write one
+        """
+        if self.log_file is None or not self.log_file.path.is_file():
+            return ''
+        return self.log_file.path.read_text(errors='replace')
+
+
+def mask_password(arguments: list) -> list:
+    """
+    This function masks the password in the arguments of bcp, which follows -P.
+
+    Returns:
+        a copy of the arguments, with the password replaced by asterisks
+    """
+    masked = list(arguments)
+    for position, argument in enumerate(masked[:-1]):
+        if argument == '-P':
+            masked[position + 1] = PASSWORD_MASK
+    return masked
@@ -1,6 +1,6 @@
 """
 This module contains data structures required to create and access files. Users will generally only need to use
-DataFile directly. LogFile and ErrorFile are used indirectly by the BCP classes.
+DataFile directly. LogFile, ErrorFile and FormatFile are used indirectly by the BCP classes.
 
 Example:
 
@@ -11,12 +11,29 @@ Example:
     # create a csv to write out my data
     my_file = DataFile(delimiter=',')
     print(my_file.path)  # %HOME%/bcp/data/<timestamp>.csv
+
+    # a compressed file is decompressed or compressed on the fly by loads and dumps
+    my_compressed_file = DataFile(file_path='path/to/file.csv.gz', delimiter=',')
 """
 import abc
 import datetime
+import importlib
+import os
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterator, List, Optional, Sequence, Union
+
+from .config import BCP_LOGGING_DIR, BCP_DATA_DIR, BCP_FORMAT_DIR, ensure_directory
 
-from .config import BCP_LOGGING_DIR, BCP_DATA_DIR
+# the reader and the scanner are imported by the methods that use them, so that importing the library stays cheap
+if TYPE_CHECKING:
+    from .scan import RecordIndex, ScanResult
+
+# the codec modules are imported when a compressed file is first opened
+COMPRESSION_CODECS = {
+    '.gz': ('gzip', {'compresslevel': 6}),
+    '.bz2': ('bz2', {}),
+    '.xz': ('lzma', {}),
+}
 
 
 class File(abc.ABC):
@@ -25,7 +42,7 @@ class File(abc.ABC):
     If the file path is not provided:
 
         - the current timestamp is used so that unique error, log, and data files can be created
-        - the file will be created in the BCP_ROOT_DIR directory specified in config.py
+        - the file will be created in the BCP_ROOT_DIR directory specified in config.py, which is created if needed
     """
     _default_extension = None
     _default_directory = None
@@ -36,20 +53,21 @@ class File(abc.ABC):
         return self._file
 
     @file.setter
-    def file(self, value: Path = None):
+    def file(self, value: Union[Path, str] = None):
         """
-        This method generates a default file path object if none is provided
+        This method generates a default file path object if none is provided, and converts a path given as a string
+        into a Path object
 
         Returns:
              a Path object that points to the file
         """
         if value is not None:
-            self._file = value
+            self._file = Path(value)
         else:
             timestamp_format: str = '%Y_%m_%d_%H_%M_%S_%f'
             timestamp = datetime.datetime.now()
             file_name: str = '.'.join([timestamp.strftime(timestamp_format), self._default_extension])
-            self._file = self._default_directory / Path(file_name)
+            self._file = ensure_directory(self._default_directory) / Path(file_name)
 
     @property
     def path(self) -> Path:
@@ -58,15 +76,25 @@ class File(abc.ABC):
 
 class DataFile(File):
     """
-    This is a handle to a data file.
+    This is a handle to a data file. Files ending in .gz, .bz2 or .xz are compressed: loads decompress them, and dumps
+    compress into them, on the fly through a named pipe, so the uncompressed data never lands on disk.
 
     Args:
-        file_path: the path object to the file, if not provided, a default using the current timestamp will be created
+        file_path: the path to the file, as a Path or a str, if not provided, a default using the current timestamp will
+            be created
         delimiter: the field delimiter for the data file
+        row_terminator: the row terminator for the data file, defaulted to a newline
+        order: the table columns the file is sorted on, which loads pass to bcp as an ORDER hint, see sort()
     """
-    def __init__(self, file_path: Path = None, delimiter: str = None):
+    def __init__(self, file_path: Union[Path, str] = None, delimiter: str = None, row_terminator: str = None,
+                 order: List[str] = None):
         self._default_directory = BCP_DATA_DIR
         self.delimiter = delimiter or '\t'
+        self.row_terminator = row_terminator or '\n'
+        self.order = order
+        # the file this file was split from, and the offset within it at which this file starts, see split()
+        self.parent = None
+        self.parent_offset = 0
         if self.delimiter == '\t':
             self._default_extension = 'tsv'
         elif self.delimiter == ',':
@@ -75,15 +103,355 @@ class DataFile(File):
             self._default_extension = 'dat'
         self.file = file_path
 
+    @classmethod
+    def scratch(cls, delimiter: str = None) -> 'DataFile':
+        """
+        This method creates an empty data file with a unique name in the BCP_DATA_DIR directory, for a short-lived
+        intermediate result such as a query's metadata. Unlike the timestamp default, the name cannot collide with
+        another job's. Remove the file once it has been read.
+
+        Args:
+            delimiter: the field delimiter for the data file
+
+        Returns:
+            a DataFile for the new, empty file
+        """
+        import tempfile
+        handle, file_path = tempfile.mkstemp(prefix='scratch.', suffix='.dat', dir=str(ensure_directory(BCP_DATA_DIR)))
+        os.close(handle)
+        return cls(file_path=file_path, delimiter=delimiter)
+
+    @property
+    def compression(self) -> str:
+        """
+        Returns:
+            the compression suffix of the file, e.g. '.gz', or None if the file is not compressed
+        """
+        suffix = self.file.suffix.lower()
+        return suffix if suffix in COMPRESSION_CODECS else None
+
+    def open(self, mode: str = 'rb') -> BinaryIO:
+        """
+        This method opens the file in binary mode, through the codec for its compression if it has one.
+
+        Args:
+            mode: 'rb', 'wb' or 'ab'
+
+        Returns:
+            a binary file object that reads or writes the uncompressed data
+        """
+        if self.compression is None:
+            return self.path.open(mode)
+        module, options = COMPRESSION_CODECS[self.compression]
+        return importlib.import_module(module).open(str(self.path), mode, **options)
+
+    def scan(self, fields: int = None, row_terminator: str = None, workers: int = None, stride: int = 65536,
+             save_index: bool = True) -> 'ScanResult':
+        """
+        This method validates the file before it is loaded. The file is memory-mapped and scanned in parallel chunks by
+        a process pool, counting records, checking the number of fields in each record and tracking the widest value of
+        each column. The resulting record index is saved alongside the file (e.g. data.csv.idx) for split() and for
+        -F/-L ranges, see bcp.scan.
+
+        Args:
+            fields: the number of fields expected per record, defaulted to the number in the first record
+            row_terminator: the row terminator, defaulted to the file's row terminator
+            workers: the number of worker processes, defaulted to the number of processors, 1 scans in this process
+            stride: the number of records between entries in the index
+            save_index: write the index alongside the file
+
+        Returns:
+            the record count, malformed records, column widths and record index of the file
+        """
+        from .scan import scan
+        return scan(self, fields=fields, row_terminator=row_terminator, workers=workers, stride=stride,
+                    save_index=save_index)
+
+    @property
+    def index(self) -> Optional['RecordIndex']:
+        """
+        Returns:
+            the record index saved by scan(), or None if there is none or the file has changed since
+        """
+        from .scan import RecordIndex
+        return RecordIndex.for_file(self, self.row_terminator)
+
+    @property
+    def first_record(self) -> int:
+        """
+        This is the number of the file's first record within the file it was split from, so that a record of a part
+        file can be reported by its place in the whole file. It is counted on demand, through the record index when
+        scan() has saved a current one, otherwise by reading up to the start of the part.
+
+        Returns:
+            the record number, starting at 1, which is 1 for a file that was not split from another
+        """
+        if self.parent is None or self.parent_offset == 0:
+            return 1
+        record_index = self.parent.index
+        if record_index is not None:
+            return record_index.record(self.parent, self.parent_offset)
+        with self.parent.path.open('rb') as source:
+            return _count_records(source, self.parent_offset, self.parent.row_terminator.encode()) + 1
+
+    def rows(self, columns: Sequence[int] = None, raw: bool = False, encoding: str = 'utf-8') -> Iterator[tuple]:
+        """
+        This method reads the rows of the file through a memory map, so memory use stays flat whatever the size of the
+        file, see bcp.reader.
+
+        Args:
+            columns: the positions of the fields to return, starting at 0, defaulted to all of them
+            raw: return memoryview slices of the file instead of strings, which copies nothing but is no faster
+            encoding: the encoding of the file
+
+        Returns:
+            a generator of tuples of the requested fields, with NULL as None unless raw
+        """
+        from .reader import rows
+        return rows(self, columns=columns, raw=raw, encoding=encoding)
+
+    def batches(self, size: int, columns: Sequence[int] = None, raw: bool = False,
+                encoding: str = 'utf-8') -> Iterator[List[tuple]]:
+        """
+        This method reads the rows of the file through a memory map in lists of up to size rows, see rows().
+
+        Returns:
+            a generator of lists of tuples
+        """
+        from .reader import batches
+        return batches(self, size, columns=columns, raw=raw, encoding=encoding)
+
+    def sort(self, keys: Sequence[int], columns: Sequence[str] = None, key_types: Sequence[Any] = None,
+             target: 'DataFile' = None, workers: int = None, run_size: int = None) -> 'DataFile':
+        """
+        This method sorts the file on some of its fields, in bounded memory, with an external merge sort whose runs are
+        sorted by a process pool, see bcp.sorting. When the table columns of the key fields are given, loading the
+        sorted file declares its order to bcp with an ORDER hint, so the server does not sort it again.
+
+        Args:
+            keys: the positions of the fields to sort on, starting at 0, most significant first
+            columns: the table columns that the key fields are loaded into, each optionally followed by ASC or DESC
+            key_types: a picklable callable per key, e.g. int, that converts the field's bytes into a comparable value,
+                or None to compare the bytes, required for every key when the columns are given, see bcp.sorting
+            target: the file to write, defaulted to a file alongside this one, e.g. data.sorted.csv
+            workers: the number of worker processes, defaulted to the number of processors, 1 sorts in this process
+            run_size: the approximate number of bytes sorted in memory per run, defaulted to 64 MiB
+
+        Returns:
+            the sorted file
+        """
+        from .sorting import RUN_SIZE, sort
+        if target is None:
+            target = DataFile(file_path=self.path.with_name(f'{self.path.stem}.sorted{self.path.suffix}'),
+                              delimiter=self.delimiter, row_terminator=self.row_terminator)
+        return sort(self, target, keys, columns=columns, key_types=key_types, workers=workers,
+                    run_size=run_size or RUN_SIZE)
+
+    def to_columns(self, schema: Sequence[Any], workers: int = None, encoding: str = 'utf-8',
+                   chunk_size: int = None) -> dict:
+        """
+        This method decodes the file into typed columns: integers and floats in arrays of 8-byte values, strings in one
+        buffer with an array of offsets, and NULLs in a bitmap per column. Chunks of the file are decoded by a process
+        pool, see bcp.columns.
+
+        Args:
+            schema: the name and type, int, float or str, of every field, in order, e.g. from BCP.schema()
+            workers: the number of worker processes, defaulted to the number of processors, 1 decodes in this process
+            encoding: the encoding of the file
+            chunk_size: the approximate number of bytes decoded per task, defaulted to 1 MiB
+
+        Returns:
+            a dictionary of Column objects by name, in the order of the schema
+        """
+        from .columns import CHUNK_SIZE, to_columns
+        return to_columns(self, schema, workers=workers, encoding=encoding, chunk_size=chunk_size or CHUNK_SIZE)
+
+    def split(self, parts: int) -> List['DataFile']:
+        """
+        This method splits the data file into record-aligned part files, in a directory of their own under the
+        BCP_DATA_DIR directory, so concurrent splits of files with the same name do not collide. Remove them with
+        remove_parts() once they have been loaded. Boundaries are placed on row terminators, so multi-character field
+        delimiters (e.g. '|~|') are never cut in half. They are taken from the record index when scan() has saved a
+        current one, otherwise found by reading around each split point. The bytes are copied in the kernel where the
+        platform supports it. Each part remembers where in this file it starts, so its records can be numbered within
+        the whole file, see first_record.
+
+        Args:
+            parts: the number of part files to create, fewer are returned if the file has fewer records
+
+        Returns:
+            a list of DataFile objects, in file order, with the same delimiter and row terminator as this file
+        """
+        if self.compression is not None:
+            raise ValueError(f'{self.path.name} is compressed and cannot be split into record-aligned parts')
+        import shutil
+        import tempfile
+        size = self.path.stat().st_size
+        if parts <= 1 or size == 0:
+            return [self]
+        record_index = self.index
+        with self.path.open('rb') as source:
+            boundaries = [0]
+            for part in range(1, parts):
+                position = max(size * part // parts, boundaries[-1])
+                if record_index is not None:
+                    boundary = record_index.boundary(self, position)
+                else:
+                    boundary = _next_record_boundary(source, position, self.row_terminator.encode())
+                if boundary >= size:
+                    break
+                if boundary > boundaries[-1]:
+                    boundaries.append(boundary)
+            boundaries.append(size)
+            directory = Path(tempfile.mkdtemp(prefix=f'{self.path.stem}.', dir=str(ensure_directory(BCP_DATA_DIR))))
+            data_files = []
+            try:
+                for number, (start, end) in enumerate(zip(boundaries, boundaries[1:])):
+                    file_name = f'{self.path.stem}.part{number:04d}{self.path.suffix}'
+                    data_file = DataFile(file_path=directory / Path(file_name), delimiter=self.delimiter,
+                                         row_terminator=self.row_terminator)
+                    data_file.parent, data_file.parent_offset = self, start
+                    with data_file.path.open('wb') as target:
+                        _copy_range(source.fileno(), target.fileno(), start, end - start)
+                    data_files.append(data_file)
+            except BaseException:
+                shutil.rmtree(str(directory), ignore_errors=True)
+                raise
+        return data_files
+
+    def remove_parts(self, parts: List['DataFile']):
+        """
+        This method removes the part files that split() created from this file, then their directory once it is
+        empty. The file itself, which split() returns when it is not worth splitting, is left in place.
+
+        Args:
+            parts: the part files returned by split()
+        """
+        directories = set()
+        for part in parts:
+            if part.path != self.path:
+                if part.path.exists():
+                    part.path.unlink()
+                directories.add(part.path.parent)
+        for directory in directories:
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+
+    def merge(self, parts: List['DataFile']):
+        """
+        This method overwrites the data file with the concatenation of the supplied part files, in order. The bytes are
+        copied in the kernel where the platform supports it. Compressed parts are concatenated as they are, since gzip,
+        bzip2 and xz all read concatenated streams as a single stream.
+
+        Args:
+            parts: the files to be concatenated into this file
+        """
+        with self.path.open('wb') as target:
+            for part in parts:
+                with part.path.open('rb') as source:
+                    _copy_range(source.fileno(), target.fileno(), 0, os.fstat(source.fileno()).st_size)
+
+    def part(self, index: int) -> 'DataFile':
+        """
+        This method creates a handle to a part file that sits alongside this file, e.g. output.part0003.csv, or
+        output.csv.part0003.gz for a compressed file
+
+        Args:
+            index: the position of the part
+
+        Returns:
+            a DataFile with the same delimiter and row terminator as this file
+        """
+        file_name = f'{self.path.stem}.part{index:04d}{self.path.suffix}'
+        return DataFile(file_path=self.path.with_name(file_name), delimiter=self.delimiter,
+                        row_terminator=self.row_terminator)
+
+
+def _next_record_boundary(source, position: int, row_terminator: bytes = b'\n', chunk_size: int = 1 << 16) -> int:
+    """
+    This function finds the offset just past the first row terminator at or after position, or the end of the file.
+    """
+    if position == 0:
+        return 0
+    # back up so that a terminator straddling the requested position is still found
+    offset = max(position - len(row_terminator) + 1, 0)
+    source.seek(offset)
+    tail = b''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return offset + len(tail)
+        buffer = tail + chunk
+        found = buffer.find(row_terminator)
+        if found != -1:
+            return offset + found + len(row_terminator)
+        keep = len(row_terminator) - 1
+        offset += len(buffer) - keep
+        tail = buffer[len(buffer) - keep:] if keep else b''
+
+
+def _count_records(source, end: int, row_terminator: bytes = b'\n', chunk_size: int = 1 << 20) -> int:
+    """
+    This function counts the row terminators in the first end bytes of a file, i.e. the records that end before it.
+    """
+    source.seek(0)
+    count, remaining, tail = 0, end, b''
+    while remaining > 0:
+        chunk = source.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        # a terminator straddling two chunks is counted once, with the end of the earlier chunk carried over
+        buffer = tail + chunk
+        count += buffer.count(row_terminator)
+        keep = len(row_terminator) - 1
+        tail = buffer[len(buffer) - keep:] if keep else b''
+    return count
+
+
+def _copy_range(source_fd: int, target_fd: int, offset: int, count: int):
+    """
+    This function copies count bytes starting at offset from one file descriptor to the current position of another.
+    It prefers os.copy_file_range and os.sendfile, which keep the data in the kernel, and falls back to reading through
+    python on platforms that offer neither. It raises OSError if the source ends before count bytes are copied, e.g.
+    because the file was truncated while it was being copied, rather than leaving the target short.
+    """
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    while count > 0:
+        copied = 0
+        if copy_file_range is not None:
+            try:
+                copied = copy_file_range(source_fd, target_fd, count, offset)
+            except OSError:
+                copy_file_range = None
+                continue
+        elif sendfile is not None:
+            try:
+                copied = sendfile(target_fd, source_fd, offset, count)
+            except OSError:
+                sendfile = None
+                continue
+        else:
+            os.lseek(source_fd, offset, os.SEEK_SET)
+            copied = os.write(target_fd, os.read(source_fd, min(count, 1 << 20)))
+        if copied == 0:
+            raise OSError(f'the source file ended at byte {offset} with {count} bytes still to be copied')
+        offset += copied
+        count -= copied
+
 
 class LogFile(File):
     """
     This is a handle to a log file.
 
     Args:
-        file_path: the path object to the file, if not provided, a default using the current timestamp will be created
+        file_path: the path to the file, as a Path or a str, if not provided, a default using the current timestamp will
+            be created
     """
-    def __init__(self, file_path: Path = None):
+    def __init__(self, file_path: Union[Path, str] = None):
         self._default_directory = BCP_LOGGING_DIR
         self._default_extension = 'log'
         self.file = file_path
@@ -94,9 +462,24 @@ class ErrorFile(File):
     This is a handle to an error file.
 
     Args:
-        file_path: the path object to the file, if not provided, a default using the current timestamp will be created
+        file_path: the path to the file, as a Path or a str, if not provided, a default using the current timestamp will
+            be created
     """
-    def __init__(self, file_path: Path = None):
+    def __init__(self, file_path: Union[Path, str] = None):
         self._default_directory = BCP_DATA_DIR
         self._default_extension = 'err'
         self.file = file_path
+
+
+class FormatFile(File):
+    """
+    This is a handle to an XML format file, which describes the columns of a table or query for native transfers.
+
+    Args:
+        file_path: the path to the file, as a Path or a str, if not provided, a default using the current timestamp will
+            be created
+    """
+    def __init__(self, file_path: Union[Path, str] = None):
+        self._default_directory = BCP_FORMAT_DIR
+        self._default_extension = 'xml'
+        self.file = file_path
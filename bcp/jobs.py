@@ -0,0 +1,387 @@
+"""
+This module holds the orchestration of loads and dumps that BCP and AsyncBCP share. A job is a generator that decides
+which bcp processes to run and in what order: it yields steps, which its runner carries out, and returns the result of
+the whole transfer. A step is one of:
+
+    - Run: run a load or dump object, which sends back its TransferResult or throws its exception into the job
+    - RunAll: run load or dump objects concurrently, which sends back the TransferResult or exception of each, in order
+    - Call: call a blocking function, e.g. one that reads or writes files, which sends back what it returns, but never
+      one that starts bcp, which AsyncBCP only runs through Run and RunAll, within its transfer limits
+
+BCP carries the steps out on threads and AsyncBCP on the event loop, so the checkpoints of resumable loads, the
+calibration of tuned loads, part files, the result cache and the combining of results are written once.
+"""
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Callable, Generator, List, Optional
+
+from .cache import ResultCache, detach
+from .checkpoints import LoadCheckpoint
+from .exceptions import BCPExecutionException, ParallelTransferException
+from .files import DataFile, FormatFile
+from .progress import Progress, ProgressTracker, estimate_rows
+from .results import TransferResult
+from .state import atomic_write
+from .tuning import LoadTuner
+
+if TYPE_CHECKING:
+    from .connections import Connection
+
+Job = Generator[Any, Any, Any]
+
+
+class Run:
+    """This step runs one load or dump object."""
+    def __init__(self, operation: Any):
+        self.operation = operation
+
+
+class RunAll:
+    """This step runs load or dump objects concurrently, and waits for all of them."""
+    def __init__(self, operations: list):
+        self.operations = operations
+
+
+class Call:
+    """This step calls a blocking function."""
+    def __init__(self, function: Callable, *args):
+        self.function = function
+        self.args = args
+
+
+def run(job: Job, carry_out: Callable[[Any], Any]) -> Any:
+    """
+    This function drives a job to completion, synchronously. AsyncBCP drives jobs with the same loop, awaiting each
+    step instead.
+
+    Args:
+        job: the job
+        carry_out: the function that carries out a step and returns its outcome
+
+    Returns:
+        what the job returns
+    """
+    value, error = None, None
+    while True:
+        try:
+            step = job.send(value) if error is None else job.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        try:
+            value = carry_out(step)
+        except BaseException as exception:
+            error = exception
+
+
+def load(connection: 'Connection', dialect: ModuleType, input_file: DataFile, table: str, parallelism: int,
+         data_format: str, resume: bool, batch_size: Optional[int], packet_size: Optional[int], hints: Any,
+         autotune: bool, max_errors: Optional[int], quarantine_file: Optional[DataFile],
+         progress: Optional[Callable[[Progress], Any]], stall_timeout: Optional[float]) -> Job:
+    """
+    This job loads a file into a table, see BCP.load().
+    """
+    if autotune and (batch_size is not None or packet_size is not None):
+        raise ValueError('autotune chooses the batch_size and packet_size itself')
+    if autotune and getattr(hints, 'sizes_batches', False):
+        raise ValueError('autotune chooses the batch size itself, it cannot be combined with hints that size batches')
+    if parallelism > 1 and resume:
+        raise ValueError('resumable loads run a single bcp process')
+    if resume and getattr(hints, 'sizes_batches', False):
+        # the committed rows are counted in whole batches, so a resumable load needs a fixed batch size
+        raise ValueError('resumable loads cannot be combined with hints that size the batches')
+    if parallelism > 1 and data_format != 'character':
+        raise ValueError('native data files have no row terminators and cannot be split for a parallel load')
+    if parallelism > 1 and input_file.compression is not None:
+        raise ValueError('compressed data files cannot be split for a parallel load')
+    format_file = yield from cached_format_file(connection, dialect, table, data_format)
+    # estimating the rows reads a sample of the file
+    tracker = yield Call(_progress_tracker, progress, stall_timeout,
+                         input_file if data_format == 'character' else None)
+    if input_file.order:
+        hints = dialect.order_hints(hints, input_file.order)
+    options = _load_options(batch_size=batch_size, packet_size=packet_size, hints=hints, max_errors=max_errors,
+                            progress=tracker)
+    try:
+        result = yield from _load(connection, dialect, input_file, table, parallelism, data_format, format_file,
+                                  options, resume, autotune)
+    except (BCPExecutionException, ParallelTransferException) as error:
+        _gather_rejects(error.result, quarantine_file)
+        raise
+    return _gather_rejects(result, quarantine_file)
+
+
+def _load(connection: 'Connection', dialect: ModuleType, input_file: DataFile, table: str, parallelism: int,
+          data_format: str, format_file: Optional[FormatFile], options: dict, resume: bool, autotune: bool) -> Job:
+    """
+    This job runs a load with its options resolved, see load().
+    """
+    if autotune:
+        tuner = LoadTuner(connection, table)
+        remembered = tuner.remembered()
+        if remembered is None and parallelism <= 1 and not resume:
+            return (yield from _load_tuned(connection, dialect, tuner, input_file, table, data_format, format_file,
+                                           options))
+        options.update(remembered or {})
+    if resume:
+        return (yield from _load_resumable(connection, dialect, input_file, table, data_format, format_file, options))
+    if parallelism <= 1:
+        return (yield Run(dialect.Load(connection, input_file, table, data_format=data_format, format_file=format_file,
+                                       **options)))
+    parts = yield Call(input_file.split, parallelism)
+    try:
+        started = time.monotonic()
+        outcomes = yield RunAll([dialect.Load(connection, part, table, **options) for part in parts])
+        return combine(outcomes, time.monotonic() - started, input_file)
+    finally:
+        input_file.remove_parts(parts)
+
+
+def _load_resumable(connection: 'Connection', dialect: ModuleType, input_file: DataFile, table: str,
+                    data_format: str, format_file: Optional[FormatFile], options: dict) -> Job:
+    """
+    This job loads a file from the first row its checkpoint has not seen committed. The checkpoint points at the
+    attempt's log file while bcp runs, so progress survives this process dying, and records the rows committed by a
+    failed attempt once bcp has exited. It is removed when the load succeeds.
+    """
+    checkpoint = LoadCheckpoint(connection, input_file, table)
+    committed_rows = dialect.committed_rows
+    first_row = checkpoint.next_row(committed_rows)
+    _skip_rows(options.get('progress'), first_row - 1)
+    load_operation = dialect.Load(connection, input_file, table, data_format=data_format, format_file=format_file,
+                                  first_row=first_row if first_row > 1 else None, **options)
+    checkpoint.save(first_row, load_operation.batch_size, load_operation.log_file.path)
+    try:
+        result = yield Run(load_operation)
+    except Exception:
+        checkpoint.save(checkpoint.next_row(committed_rows), load_operation.batch_size)
+        raise
+    checkpoint.clear()
+    return result
+
+
+def _load_tuned(connection: 'Connection', dialect: ModuleType, tuner: LoadTuner, input_file: DataFile, table: str,
+                data_format: str, format_file: Optional[FormatFile], options: dict) -> Job:
+    """
+    This job calibrates a table's load settings on the first chunks of a file, then loads the rest of the file with
+    the fastest settings. It returns the combined result rather than the result of each chunk.
+    """
+    started = time.monotonic()
+    results = []
+    for trial in tuner.trials():
+        result = yield Run(dialect.Load(connection, input_file, table, data_format=data_format,
+                                        format_file=format_file, **options, **trial))
+        tuner.record(trial, result)
+        results.append(result)
+    tuner.save()
+    if not tuner.exhausted:
+        results.append((yield Run(dialect.Load(connection, input_file, table, data_format=data_format,
+                                               format_file=format_file, first_row=tuner.next_row, **options,
+                                               **tuner.best()))))
+    return TransferResult.combine(results, time.monotonic() - started, input_file)
+
+
+def dump(connection: 'Connection', dialect: ModuleType, query: str, output_file: DataFile,
+         partition_column: Optional[str], partitions: Optional[int], boundaries: Optional[list], keep_parts: bool,
+         data_format: str, progress: Optional[Callable[[Progress], Any]], stall_timeout: Optional[float],
+         cache: Optional[ResultCache]) -> Job:
+    """
+    This job exports the results of a query to a file, or clones them from the cache, see BCP.dump().
+    """
+    key = None
+    if cache is not None and not keep_parts:
+        key = cache.key(connection, query, output_file, data_format)
+        cached = yield Call(cache.get, key, output_file)
+        if cached is not None:
+            return cached
+    detach(output_file)
+    result = yield from _dump(connection, dialect, query, output_file, partition_column, partitions, boundaries,
+                              keep_parts, data_format, progress, stall_timeout)
+    if key is not None and result.succeeded:
+        yield Call(cache.put, key, output_file, result)
+    return result
+
+
+def _dump(connection: 'Connection', dialect: ModuleType, query: str, output_file: DataFile,
+          partition_column: Optional[str], partitions: Optional[int], boundaries: Optional[list], keep_parts: bool,
+          data_format: str, progress: Optional[Callable[[Progress], Any]], stall_timeout: Optional[float]) -> Job:
+    """
+    This job runs a dump, see dump().
+    """
+    format_file = yield from cached_format_file(connection, dialect, query, data_format)
+    tracker = _progress_tracker(progress, stall_timeout)
+    options = {} if tracker is None else {'progress': tracker}
+    if partition_column is None:
+        return (yield Run(dialect.Dump(connection, query, output_file, data_format=data_format,
+                                       format_file=format_file, **options)))
+    if boundaries is None:
+        boundaries = yield from partition_boundaries(connection, dialect, query, partition_column, partitions or 1)
+    queries = dialect.partition_queries(query, partition_column, boundaries)
+    parts = [output_file.part(index) for index in range(len(queries))]
+    try:
+        started = time.monotonic()
+        outcomes = yield RunAll([dialect.Dump(connection, part_query, part, data_format=data_format,
+                                              format_file=format_file, **options)
+                                 for part_query, part in zip(queries, parts)])
+        result = combine(outcomes, time.monotonic() - started, output_file)
+        if not keep_parts:
+            yield Call(output_file.merge, parts)
+        return result
+    finally:
+        if not keep_parts:
+            for part in parts:
+                if part.path.exists():
+                    part.path.unlink()
+
+
+def partition_boundaries(connection: 'Connection', dialect: ModuleType, query: str, column: str,
+                         partitions: int) -> Job:
+    """
+    This job queries the minimum and maximum of a numeric column and splits that range into equal-width ranges.
+
+    Returns:
+        the values at which each range after the first starts, empty if the range cannot be split
+    """
+    if partitions <= 1:
+        return []
+    bounds_file = DataFile.scratch()
+    try:
+        yield Run(dialect.Dump(connection, dialect.bounds_query(query, column), bounds_file))
+        return equal_width_boundaries(bounds_file, column, partitions)
+    finally:
+        if bounds_file.path.exists():
+            bounds_file.path.unlink()
+
+
+def cached_format_file(connection: 'Connection', dialect: ModuleType, source: str, data_format: str) -> Job:
+    """
+    This job returns the format file for a native transfer of a table or query, or None for a character transfer. A
+    format file is only generated when none exists in the BCP_FORMAT_DIR for the same target, source, data format and
+    schema. The schema is read first, by dumping the dialect's fingerprint_query(), and is hashed into the name of the
+    format file, see the dialect's format_file_for(), so altering the table produces a new format file. Format files are
+    published atomically, so concurrent jobs can share the cache.
+
+    The schema is read on every call, even when a format file is already cached, because the schema is part of the
+    cache key: a cached file can only be known to be fresh once the current schema has been read. The query only reads
+    catalog metadata, so it is much cheaper than generating the format file, which it saves whenever the schema is
+    unchanged. Both bcp processes are Run steps, so AsyncBCP runs them within its transfer limits like any other.
+
+    Returns:
+        the cached format file, or None
+    """
+    if data_format == 'character':
+        return None
+    schema_file = DataFile.scratch()
+    try:
+        yield Run(dialect.Dump(connection, dialect.fingerprint_query(source), schema_file))
+        schema = schema_file.path.read_bytes()
+    finally:
+        if schema_file.path.exists():
+            schema_file.path.unlink()
+    format_file = dialect.format_file_for(connection, source, data_format, schema)
+    if not format_file.path.exists():
+        with atomic_write(format_file.path) as staging_path:
+            yield Run(dialect.Format(connection, source, FormatFile(file_path=staging_path), data_format))
+    return format_file
+
+
+def combine(outcomes: List[Any], elapsed: float, data_file: Optional[DataFile]) -> TransferResult:
+    """
+    This function totals the outcomes of concurrent transfers. Any failures are reported together, by position, along
+    with the combined result of every transfer that produced one.
+
+    Args:
+        outcomes: the TransferResult, or the exception, of each transfer
+        elapsed: the clock time of the transfers, in seconds
+        data_file: the file that was loaded or written as a whole
+
+    Returns:
+        the combined result
+
+    Raises:
+        ParallelTransferException: one or more of the transfers failed
+    """
+    errors, results = {}, []
+    for partition, outcome in enumerate(outcomes):
+        if isinstance(outcome, BaseException):
+            errors[partition] = outcome
+            outcome = getattr(outcome, 'result', None)
+        if outcome is not None:
+            results.append(outcome)
+    result = TransferResult.combine(results, elapsed, data_file)
+    if errors:
+        raise ParallelTransferException(errors, result)
+    return result
+
+
+def _load_options(**options) -> dict:
+    """
+    This function drops the load options that were not given, so a dialect's Load only receives the options that were
+    asked for and otherwise applies its own defaults.
+    """
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def _progress_tracker(callback: Optional[Callable[[Progress], Any]], stall_timeout: Optional[float],
+                      data_file: DataFile = None) -> Optional[ProgressTracker]:
+    """
+    This function creates the tracker for a transfer that reports its progress or has a stall timeout. The rows of a
+    load are estimated from its character data file, so that the progress has an ETA.
+    """
+    if callback is None and stall_timeout is None:
+        return None
+    return ProgressTracker(callback, None if data_file is None else estimate_rows(data_file), stall_timeout)
+
+
+def _skip_rows(tracker: Optional[ProgressTracker], rows: int):
+    """
+    This function takes the rows a resumed load skips off the rows its tracker expects.
+    """
+    if tracker is not None and tracker.total_rows is not None:
+        tracker.total_rows = max(tracker.total_rows - rows, 0)
+
+
+def _gather_rejects(result: Optional[TransferResult], quarantine_file: Optional[DataFile]) \
+        -> Optional[TransferResult]:
+    """
+    This function concatenates the quarantine files of a load, one per bcp process, into the requested quarantine
+    file. The file is written even if no rows were rejected, so it never holds the rejects of an earlier load.
+    """
+    if result is None or quarantine_file is None:
+        return result
+    quarantine_file.merge([part.quarantine_file for part in result.parts or [result] if part.quarantine_file])
+    result.quarantine_file = quarantine_file
+    return result
+
+
+def equal_width_boundaries(bounds_file: DataFile, column: str, partitions: int) -> list:
+    """
+    This function reads the minimum and maximum written by a bounds query and splits that range into equal-width
+    ranges. Integer columns produce integer boundaries.
+
+    Args:
+        bounds_file: the file containing the output of the bounds query
+        column: the column being partitioned, used for error reporting
+        partitions: the number of ranges to create
+
+    Returns:
+        the values at which each range after the first starts, empty if the range cannot be split
+    """
+    with bounds_file.path.open() as bounds:
+        fields = bounds.readline().rstrip('\r\n').split(bounds_file.delimiter)
+    if len(fields) != 2 or not all(fields):
+        return []
+    try:
+        lower, upper = (int(field) for field in fields)
+    except ValueError:
+        try:
+            lower, upper = (float(field) for field in fields)
+        except ValueError:
+            raise ValueError(f'{column} is not numeric, supply explicit boundaries to partition on it')
+    step = (upper - lower) / partitions
+    if step <= 0:
+        return []
+    boundaries = [lower + step * partition for partition in range(1, partitions)]
+    if isinstance(lower, int):
+        boundaries = sorted(set(int(boundary) for boundary in boundaries) - {lower})
+    return boundaries
@@ -0,0 +1,185 @@
+"""
+This module rewrites quoted CSV (RFC 4180) into a form that bcp's character mode can load. bcp splits fields on the
+delimiter and records on the row terminator wherever they appear, so a quoted field containing a comma or a line break
+is loaded incorrectly. The normalized form has no quoting: fields are separated by the ASCII unit separator and records
+end with the ASCII record separator, neither of which appears in text data, so every field can hold any other character.
+
+The file is cut into chunks on line breaks that fall outside quoted fields, found by counting quotes, and the chunks are
+rewritten on a process pool. The rewritten chunks are written out in file order as they complete, so the output can be
+streamed into bcp through a named pipe without an intermediate file, see BCP.load_csv(). Chunks without any quotes are
+rewritten by replacing bytes, without parsing them.
+
+.. note::
+    Quotes must follow RFC 4180: a field containing a quote is quoted and its quotes are doubled. Empty fields, quoted
+    or not, are loaded as NULL.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn)
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    my_bcp.load_csv(input_file=file, table='table_name', header=True)
+"""
+import collections
+import csv
+import io
+import os
+from typing import TYPE_CHECKING, BinaryIO, Iterator, Tuple
+
+if TYPE_CHECKING:
+    from .files import DataFile
+    from .pipes import NamedPipe
+
+NORMALIZED_DELIMITER = '\x1f'
+NORMALIZED_ROW_TERMINATOR = '\x1e'
+CHUNK_SIZE = 1 << 24
+
+
+def normalize(data_file: 'DataFile', target: BinaryIO, workers: int = None, header: bool = False,
+              encoding: str = 'utf-8', quote: str = '"', chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    This function rewrites a CSV file into the normalized form, see the module documentation.
+
+    Args:
+        data_file: the CSV file, whose delimiter must be a single character
+        target: the binary file object to write the normalized data to
+        workers: the number of worker processes, defaulted to the number of processors, 1 rewrites in this process
+        header: skip the first record, which holds the column names
+        encoding: the encoding of the file, which is also used for the output
+        quote: the quote character
+        chunk_size: the approximate number of bytes rewritten per task
+
+    Returns:
+        the number of records written
+
+    Raises:
+        ValueError: the file is compressed, or contains a unit or record separator
+    """
+    if data_file.compression is not None:
+        raise ValueError(f'{data_file.path.name} is compressed and cannot be normalized in parallel chunks')
+    if len(data_file.delimiter) != 1:
+        raise ValueError('CSV files must have a single character delimiter')
+    tasks = ((str(data_file.path), start, end, data_file.delimiter, quote, encoding, header and start == 0)
+             for start, end in _chunks(data_file, quote, chunk_size))
+    records = 0
+    if workers == 1:
+        for task in tasks:
+            chunk_records, normalized = _normalize_chunk(*task)
+            target.write(normalized)
+            records += chunk_records
+        return records
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # chunks are rewritten ahead of the writer, but only a few at a time, so memory use stays bounded
+        pending = collections.deque()
+        try:
+            for task in tasks:
+                pending.append(executor.submit(_normalize_chunk, *task))
+                if len(pending) > 2 * workers:
+                    chunk_records, normalized = pending.popleft().result()
+                    target.write(normalized)
+                    records += chunk_records
+            while pending:
+                chunk_records, normalized = pending.popleft().result()
+                target.write(normalized)
+                records += chunk_records
+        finally:
+            for future in pending:
+                future.cancel()
+    return records
+
+
+def normalize_into(pipe: 'NamedPipe', data_file: 'DataFile', **options):
+    """
+    This function streams the normalized form of a CSV file into a pipe that bcp is loading from. If bcp stops reading,
+    normalizing stops quietly; bcp's exit code reports why.
+
+    Args:
+        pipe: the pipe that bcp is reading
+        data_file: the CSV file to be loaded
+        options: the options for normalize()
+    """
+    try:
+        with pipe.open_writer() as writer:
+            normalize(data_file, writer, **options)
+    except BrokenPipeError:
+        pass
+
+
+def _chunks(data_file: 'DataFile', quote: str, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    This function yields the byte ranges of the chunks of a CSV file. Each chunk ends on a line break after which an
+    even number of quotes has been seen since the start of the chunk, so the line break is not inside a quoted field.
+    """
+    quote = quote.encode()
+    with data_file.path.open('rb') as source:
+        size = source.seek(0, io.SEEK_END)
+        start = 0
+        while start < size:
+            source.seek(start)
+            block = source.read(chunk_size)
+            end = block.rfind(b'\n') + 1 if start + len(block) < size else len(block)
+            quoted = block.count(quote, 0, end) % 2 == 1
+            while (quoted or end == 0) and start + end < size:
+                # the line break is inside a quoted field, or there was none, so move on to the next line break
+                search = end
+                line_end = block.find(b'\n', search)
+                while line_end == -1 and start + len(block) < size:
+                    search = len(block)
+                    block += source.read(chunk_size)
+                    line_end = block.find(b'\n', search)
+                line_end = len(block) if line_end == -1 else line_end + 1
+                quoted ^= block.count(quote, end, line_end) % 2 == 1
+                end = line_end
+            yield start, start + end
+            start += end
+
+
+def _normalize_chunk(path: str, start: int, end: int, delimiter: str, quote: str, encoding: str,
+                     skip_first: bool) -> Tuple[int, bytes]:
+    """
+    This function rewrites one chunk of a CSV file. It runs in a worker process, so it reads the chunk itself.
+
+    Returns:
+        the number of records in the chunk, and the normalized records
+    """
+    with open(path, 'rb') as source:
+        source.seek(start)
+        chunk = source.read(end - start)
+    separators = (NORMALIZED_DELIMITER.encode(encoding), NORMALIZED_ROW_TERMINATOR.encode(encoding))
+    if any(separator in chunk for separator in separators):
+        raise ValueError(f'{path} contains unit or record separators between bytes {start} and {end}')
+    if skip_first:
+        chunk = chunk[_position_after_first_record(chunk, quote.encode(encoding)):]
+    if not chunk:
+        return 0, b''
+    if quote.encode(encoding) not in chunk:
+        if not chunk.endswith(b'\n'):
+            chunk += b'\n'
+        chunk = chunk.replace(b'\r\n', b'\n')
+        records = chunk.count(b'\n')
+        chunk = chunk.replace(delimiter.encode(encoding), separators[0]).replace(b'\n', separators[1])
+        return records, chunk
+    rows = list(csv.reader(io.StringIO(chunk.decode(encoding), newline=''), delimiter=delimiter, quotechar=quote))
+    normalized = NORMALIZED_ROW_TERMINATOR.join(NORMALIZED_DELIMITER.join(row) for row in rows)
+    return len(rows), (normalized + NORMALIZED_ROW_TERMINATOR).encode(encoding)
+
+
+def _position_after_first_record(chunk: bytes, quote: bytes) -> int:
+    """
+    This function finds the end of the first record of a chunk, skipping line breaks inside quoted fields.
+    """
+    position, quoted = 0, False
+    while True:
+        line_end = chunk.find(b'\n', position)
+        if line_end == -1:
+            return len(chunk)
+        quoted ^= chunk.count(quote, position, line_end) % 2 == 1
+        position = line_end + 1
+        if not quoted:
+            return position
@@ -0,0 +1,216 @@
+"""
+This module contains a handle to a named pipe (FIFO), which lets bcp read data that python produces, or write data that
+python consumes, without the data ever landing on disk. Named pipes are only available on POSIX platforms.
+
+bcp opens the pipe by path, just like a regular data file, while python opens the other end. Opening one end of a FIFO
+blocks until the other end is opened, so if bcp fails before it gets to the pipe, python would wait forever. To prevent
+this, release() should be called once the bcp process has exited; it unblocks python's end of the pipe.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterable, Iterator, Optional
+
+if TYPE_CHECKING:
+    from .files import DataFile
+
+COPY_BUFFER_SIZE = 1 << 20
+
+
+class NamedPipe:
+    """
+    This creates a FIFO in a private temporary directory, which is removed along with the FIFO when the pipe is closed.
+    It is used as a context manager.
+
+    Args:
+        name: the file name of the FIFO, which is visible to bcp and in its log messages
+    """
+    def __init__(self, name: str = 'bcp.fifo'):
+        if not hasattr(os, 'mkfifo'):
+            raise NotImplementedError('named pipes are only supported on POSIX platforms')
+        self._directory = Path(tempfile.mkdtemp(prefix='bcp_'))
+        self.path = self._directory / Path(name)
+        os.mkfifo(str(self.path), 0o600)
+        self._opened = threading.Event()
+        self._released = threading.Event()
+
+    def open_reader(self) -> BinaryIO:
+        """
+        This opens the pipe for reading, blocking until bcp opens it for writing or the pipe is released.
+
+        Returns:
+            a binary file object, which reaches end of file once bcp closes its end
+        """
+        return self._open('rb')
+
+    def open_writer(self) -> BinaryIO:
+        """
+        This opens the pipe for writing, blocking until bcp opens it for reading or the pipe is released.
+
+        Returns:
+            a binary file object, writes raise BrokenPipeError once bcp closes its end
+        """
+        return self._open('wb')
+
+    def _open(self, mode: str) -> BinaryIO:
+        try:
+            if self._released.is_set():
+                raise BrokenPipeError(f'{self.path} was released before it was opened')
+            return open(str(self.path), mode)
+        finally:
+            self._opened.set()
+
+    def release(self):
+        """
+        This unblocks a pending open_reader() or open_writer() call by briefly opening the opposite end of the pipe
+        without blocking. It should be called once the bcp process has exited, and returns immediately if python's end
+        has already been opened.
+        """
+        self._released.set()
+        while not self._opened.is_set():
+            self.unblock()
+            self._opened.wait(0.01)
+
+    def unblock(self):
+        """
+        This briefly opens and closes each end of the pipe without blocking, so a process blocked opening either end
+        continues: a reader sees end of file, and a writer's writes fail. It is used when two bcp processes share the
+        pipe and one of them exits, possibly before opening it, while the other is still waiting for it.
+        """
+        for flags in (os.O_RDONLY | os.O_NONBLOCK, os.O_WRONLY | os.O_NONBLOCK):
+            try:
+                os.close(os.open(str(self.path), flags))
+            except OSError:
+                pass
+
+    def close(self):
+        """This removes the FIFO and its temporary directory."""
+        shutil.rmtree(str(self._directory), ignore_errors=True)
+
+    def __enter__(self) -> 'NamedPipe':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return f'NamedPipe(path={self.path})'
+
+
+def format_field(value: Any) -> str:
+    """
+    This function renders a python value as a bcp character-mode field, the reverse of parse_field(). None becomes an
+    empty field, which bcp loads as NULL, an empty string becomes a single NUL character, which bcp loads as an empty
+    string, and booleans become 1/0.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex() or '\0'
+    return str(value) or '\0'
+
+
+def write_rows(pipe: NamedPipe, rows: Iterable[tuple], delimiter: str, row_terminator: str = '\n',
+               encoding: str = 'utf-8', batch_rows: int = 10000):
+    """
+    This function serializes rows into a pipe, batch_rows at a time, so that memory use is bounded by the batch size
+    no matter how many rows are produced. If bcp stops reading, writing stops quietly; bcp's exit code reports why.
+
+    Args:
+        pipe: the pipe that bcp is reading
+        rows: any iterable of tuples, e.g. a generator
+        delimiter: the field delimiter
+        row_terminator: the row terminator
+        encoding: the encoding of the serialized text
+        batch_rows: the number of rows to serialize per write
+    """
+    try:
+        with pipe.open_writer() as writer:
+            batch = []
+            for row in rows:
+                batch.append(delimiter.join(format_field(value) for value in row))
+                if len(batch) >= batch_rows:
+                    writer.write((row_terminator.join(batch) + row_terminator).encode(encoding))
+                    batch.clear()
+            if batch:
+                writer.write((row_terminator.join(batch) + row_terminator).encode(encoding))
+    except BrokenPipeError:
+        pass
+
+
+def decompress_into(pipe: NamedPipe, data_file: 'DataFile'):
+    """
+    This function streams the uncompressed contents of a compressed data file into a pipe that bcp is loading from. If
+    bcp stops reading, decompression stops quietly; bcp's exit code reports why.
+
+    Args:
+        pipe: the pipe that bcp is reading
+        data_file: the compressed file to be loaded
+    """
+    with data_file.open('rb') as source:
+        try:
+            with pipe.open_writer() as writer:
+                shutil.copyfileobj(source, writer, COPY_BUFFER_SIZE)
+        except BrokenPipeError:
+            pass
+
+
+def compress_from(pipe: NamedPipe, data_file: 'DataFile'):
+    """
+    This function compresses the data that bcp writes into a pipe into a compressed data file, as it is written.
+
+    Args:
+        pipe: the pipe that bcp is writing
+        data_file: the compressed file to be written
+    """
+    try:
+        with pipe.open_reader() as reader, data_file.open('wb') as target:
+            shutil.copyfileobj(reader, target, COPY_BUFFER_SIZE)
+    except BrokenPipeError:
+        pass
+
+
+def parse_field(value: str) -> Optional[str]:
+    """
+    This function reverses bcp's character-mode rendering of a field: an empty field is NULL and a field holding a
+    single NUL character is an empty string.
+    """
+    if value == '':
+        return None
+    if value == '\0':
+        return ''
+    return value
+
+
+def read_rows(reader: BinaryIO, delimiter: str, row_terminator: str = '\n', encoding: str = 'utf-8',
+              chunk_size: int = 1 << 16) -> Iterator[tuple]:
+    """
+    This function parses rows out of a stream as the bytes arrive. Only one chunk and one partial row are held in memory
+    at a time.
+
+    Args:
+        reader: a binary file object, e.g. the read end of a pipe
+        delimiter: the field delimiter, which can be more than one character
+        row_terminator: the row terminator
+        encoding: the encoding of the text
+        chunk_size: the number of bytes to read at a time
+
+    Returns:
+        a generator of tuples of field values, see parse_field()
+    """
+    terminator = row_terminator.encode(encoding)
+    remainder = b''
+    while True:
+        chunk = reader.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split(terminator)
+        remainder = lines.pop()
+        for line in lines:
+            yield tuple(parse_field(field) for field in line.decode(encoding).split(delimiter))
+    if remainder:
+        yield tuple(parse_field(field) for field in remainder.decode(encoding).split(delimiter))
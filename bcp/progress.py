@@ -0,0 +1,296 @@
+"""
+This module reports the progress of running transfers, see the progress option of BCP.load() and BCP.dump(). Instead of
+writing its output to the log file, bcp writes it to a pipe that is read line by line and copied into the log file as it
+arrives. Each of bcp's batch messages, e.g. '1000 rows sent to SQL Server. Total sent: 5000', updates a ProgressTracker,
+which passes a Progress snapshot to the callback: the rows done, the current and average rows per second, and the
+estimated time remaining when the number of rows is known, from the file's record index or estimated from its size.
+
+A tracker given a stall timeout stops bcp when no batch has completed within it, so a stalled transfer fails early
+instead of waiting out a much longer timeout. A callback can stop the transfer too, by raising an exception: bcp is
+killed and the exception is raised by the load or dump.
+
+.. note::
+    Callbacks are called on the thread reading bcp's output, one of several for a parallel transfer, so they should be
+    quick and thread-safe. The rows of every bcp process of a transfer are added together.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn)
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    my_bcp.load(input_file=file, table='table_name', progress=lambda progress: print(progress.rows, progress.eta),
+                stall_timeout=600)
+"""
+import collections
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .files import DataFile
+
+POLL_INTERVAL = 1.0
+RATE_WINDOW = 5.0
+SAMPLE_SIZE = 1 << 20
+
+
+class Progress:
+    """
+    This is a snapshot of the progress of a transfer.
+
+    Args:
+        rows: the rows bcp has sent or received so far
+        total_rows: the rows expected, None if unknown
+        elapsed: the seconds since the transfer started
+        rows_per_second: the throughput over the last RATE_WINDOW seconds
+        average_rows_per_second: the throughput since the transfer started
+    """
+    def __init__(self, rows: int, total_rows: Optional[int], elapsed: float, rows_per_second: float,
+                 average_rows_per_second: float):
+        self.rows = rows
+        self.total_rows = total_rows
+        self.elapsed = elapsed
+        self.rows_per_second = rows_per_second
+        self.average_rows_per_second = average_rows_per_second
+
+    @property
+    def fraction(self) -> Optional[float]:
+        """
+        Returns:
+            the fraction of the rows done, between 0 and 1, None if the number of rows is unknown
+        """
+        if self.total_rows is None:
+            return None
+        if self.total_rows == 0:
+            return 1.0
+        return min(self.rows / self.total_rows, 1.0)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """
+        Returns:
+            the estimated seconds remaining at the average throughput, None if the number of rows is unknown
+        """
+        if self.total_rows is None or self.average_rows_per_second <= 0:
+            return None
+        return max(self.total_rows - self.rows, 0) / self.average_rows_per_second
+
+    def __repr__(self):
+        return f'Progress(rows={self.rows}, total_rows={self.total_rows}, elapsed={self.elapsed:.1f}, ' \
+               f'rows_per_second={self.rows_per_second:.1f}, eta={self.eta})'
+
+
+class ProgressTracker:
+    """
+    This follows the bcp processes of a transfer, see the module documentation.
+
+    Args:
+        callback: the callable that receives a Progress after every batch, optional
+        total_rows: the rows the transfer is expected to copy, see estimate_rows()
+        stall_timeout: the seconds a bcp process may go without completing a batch before it is stopped
+    """
+    def __init__(self, callback: Callable[[Progress], Any] = None, total_rows: int = None,
+                 stall_timeout: float = None):
+        self.callback = callback
+        self.total_rows = total_rows
+        self.stall_timeout = stall_timeout
+        self.started = time.monotonic()
+        self._rows = {}  # type: Dict[Any, int]
+        self._updated = {}  # type: Dict[Any, float]
+        self._history = collections.deque([(self.started, 0)])
+        self._lock = threading.Lock()
+
+    @property
+    def rows(self) -> int:
+        """
+        Returns:
+            the rows reported so far by every bcp process
+        """
+        with self._lock:
+            return sum(self._rows.values())
+
+    def update(self, process: Any, total: int) -> Progress:
+        """
+        This records the running total that a bcp process reported, and passes the progress to the callback.
+
+        Args:
+            process: identifies the bcp process, e.g. its load or dump object
+            total: the rows the process has sent or received so far
+
+        Returns:
+            the progress of the whole transfer
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._rows[process] = total
+            rows = sum(self._rows.values())
+            # the current throughput is measured from the last update at least RATE_WINDOW seconds old, so updates
+            # from several bcp processes arriving together do not distort it
+            while len(self._history) > 1 and now - self._history[1][0] >= RATE_WINDOW:
+                self._history.popleft()
+            then, rows_then = self._history[0]
+            progress = Progress(rows, self.total_rows, now - self.started,
+                                (rows - rows_then) / (now - then) if now > then else 0.0,
+                                rows / (now - self.started) if now > self.started else 0.0)
+            self._history.append((now, rows))
+            self._updated[process] = now
+        if self.callback is not None:
+            self.callback(progress)
+        return progress
+
+    def remaining(self, process: Any, since: float) -> Optional[float]:
+        """
+        Args:
+            process: identifies the bcp process, see update()
+            since: when the bcp process started, which counts as progress
+
+        Returns:
+            the seconds until the process stalls, negative once it has, None without a stall timeout
+        """
+        if self.stall_timeout is None:
+            return None
+        return self.stall_timeout - (time.monotonic() - max(self._updated.get(process, since), since))
+
+    def run(self, process: Any, arguments: List[str], log_path: Path, parse: Callable[[str], Optional[int]]) -> int:
+        """
+        This runs bcp with its output piped to a thread that copies it into the log file and updates the tracker. The
+        process is killed if it stalls, or if the callback raises an exception, which is then raised here.
+
+        Args:
+            process: identifies the bcp process, see update()
+            arguments: the arguments bcp is started with, which must not redirect its output
+            log_path: the log file to copy bcp's output into
+            parse: the dialect's function for reading the running total out of a line, see progress_rows()
+
+        Returns:
+            the return code of bcp
+        """
+        started = time.monotonic()
+        child = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 universal_newlines=True, errors='replace')
+        failures, stalled = [], False
+
+        def read():
+            try:
+                with log_path.open('w') as log:
+                    for line in child.stdout:
+                        self._record(process, line, log, parse)
+            except BaseException as failure:
+                failures.append(failure)
+                child.kill()
+
+        reader = threading.Thread(target=read, name='bcp-progress', daemon=True)
+        reader.start()
+        try:
+            while True:
+                remaining = self.remaining(process, started)
+                if remaining is not None and remaining < 0 and not stalled:
+                    stalled = True
+                    child.kill()
+                try:
+                    return_code = child.wait(POLL_INTERVAL if remaining is None else
+                                             min(max(remaining, 0.0) + 0.01, POLL_INTERVAL))
+                    break
+                except subprocess.TimeoutExpired:
+                    continue
+        finally:
+            if child.returncode is None:
+                child.kill()
+                child.wait()
+            reader.join()
+            child.stdout.close()
+        if failures:
+            raise failures[0]
+        if stalled:
+            self._note_stall(log_path)
+        return return_code
+
+    async def run_async(self, process: Any, arguments: List[str], log_path: Path,
+                        parse: Callable[[str], Optional[int]]) -> int:
+        """
+        This is the asyncio counterpart of run(), which reads bcp's output on the event loop. If the coroutine is
+        cancelled, bcp is killed and reaped before the cancellation propagates.
+        """
+        import asyncio
+        started = time.monotonic()
+        child = await asyncio.create_subprocess_exec(*arguments, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        stalled = False
+        try:
+            with log_path.open('w') as log:
+                while True:
+                    remaining = self.remaining(process, started)
+                    try:
+                        line = await asyncio.wait_for(child.stdout.readline(),
+                                                      None if remaining is None else max(remaining, 0.0) + 0.01)
+                    except asyncio.TimeoutError:
+                        if self.remaining(process, started) < 0:
+                            stalled = True
+                            child.kill()
+                            break
+                        continue
+                    if not line:
+                        break
+                    self._record(process, line.decode(errors='replace'), log, parse)
+            return_code = await child.wait()
+        except BaseException:
+            if child.returncode is None:
+                child.kill()
+                await child.wait()
+            raise
+        if stalled:
+            self._note_stall(log_path)
+        return return_code
+
+    def _record(self, process: Any, line: str, log, parse: Callable[[str], Optional[int]]):
+        """
+        This copies a line of bcp's output into the log file, flushing it so that checkpoints can read it, and updates
+        the tracker if the line reports a running total.
+        """
+        log.write(line)
+        log.flush()
+        total = parse(line)
+        if total is not None:
+            self.update(process, total)
+
+    def _note_stall(self, log_path: Path):
+        with log_path.open('a') as log:
+            log.write(f'\nbcp completed no batch for {self.stall_timeout} seconds and was stopped\n')
+
+    def __repr__(self):
+        return f'ProgressTracker(rows={self.rows}, total_rows={self.total_rows}, stall_timeout={self.stall_timeout})'
+
+
+def estimate_rows(data_file: 'DataFile', sample_size: int = SAMPLE_SIZE) -> Optional[int]:
+    """
+    This function estimates the number of records in a character data file without reading all of it. The record index
+    saved by DataFile.scan() is exact; otherwise the records in the first sample_size bytes are counted and scaled up to
+    the size of the file.
+
+    Args:
+        data_file: the file
+        sample_size: the number of bytes to sample
+
+    Returns:
+        the number of records, None if the file is compressed, missing, or has no record in the sample
+    """
+    if data_file.compression is not None or not data_file.path.is_file():
+        return None
+    index = data_file.index
+    if index is not None:
+        return index.records
+    size = data_file.path.stat().st_size
+    terminator = data_file.row_terminator.encode()
+    with data_file.path.open('rb') as source:
+        sample = source.read(sample_size)
+    records = sample.count(terminator)
+    if len(sample) == size:
+        return records + (0 < size and not sample.endswith(terminator))
+    if records == 0:
+        return None
+    return round(records * size / len(sample))
@@ -0,0 +1,171 @@
+"""
+This module reads the rows of a character data file through a memory map, see DataFile.rows() and DataFile.batches().
+The file is not read into memory: the operating system pages it in as the rows are parsed and can drop the pages again,
+so memory use stays flat whatever the size of the file, e.g. when processing the output of a dump.
+
+Rows are tuples of the requested columns only. By default fields are decoded into strings, with NULL as None like
+BCP.dump_iter(). Raw rows hold memoryview slices of the mapped file instead, which copy nothing, so reading them holds
+a few kilobytes in memory rather than a few megabytes. They are not faster: creating a view costs as much as decoding
+a field, so raw rows take somewhat longer than decoded ones. They pay off when memory is tight, or when fields are
+passed on as bytes, e.g. written to a socket.
+
+.. note::
+    The memory map is closed when iteration finishes, unless raw rows still reference it, in which case it is released
+    once they are. Copy the views with bytes() to keep fields beyond that, and do not modify the file while its rows are
+    being read.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    for name, amount in file.rows(columns=[1, 3]):
+        print(name, amount)
+    for batch in file.batches(10000, columns=[0], raw=True):
+        print(len(batch), bytes(batch[0][0]))
+"""
+import itertools
+import mmap
+from typing import TYPE_CHECKING, Iterator, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from .files import DataFile
+
+BLOCK_SIZE = 1 << 20
+# raw rows copy nothing but their block, which is kept small so that it is all they hold in memory
+RAW_BLOCK_SIZE = 1 << 14
+# bcp writes NULL as an empty field and an empty string as a NUL character, see parse_field()
+NULL_FIELDS = {'': None, '\0': ''}
+
+
+def rows(data_file: 'DataFile', columns: Sequence[int] = None, raw: bool = False, encoding: str = 'utf-8',
+         block_size: int = None) -> Iterator[tuple]:
+    """
+    This function yields the rows of a data file, see the module documentation.
+
+    Args:
+        data_file: the file, which must not be compressed
+        columns: the positions of the fields to return, starting at 0, defaulted to all of them
+        raw: return memoryview slices of the file instead of decoded strings
+        encoding: the encoding of the file
+        block_size: the approximate number of bytes split into rows at a time, defaulted to BLOCK_SIZE, or to
+            RAW_BLOCK_SIZE for raw rows
+
+    Returns:
+        a generator of tuples, in which a field missing from a short row is None
+    """
+    if data_file.compression is not None:
+        raise ValueError(f'{data_file.path.name} is compressed and cannot be memory-mapped')
+    if columns is not None and not columns:
+        raise ValueError('at least one column is required')
+    with data_file.path.open('rb') as source:
+        if source.seek(0, 2) == 0:
+            return
+        data = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    if block_size is None:
+        block_size = RAW_BLOCK_SIZE if raw else BLOCK_SIZE
+    delimiter = data_file.delimiter.encode(encoding)
+    terminator = data_file.row_terminator.encode(encoding)
+    try:
+        if raw:
+            yield from _raw_rows(data, delimiter, terminator, columns, block_size)
+        else:
+            yield from _decoded_rows(data, data_file.delimiter, terminator, columns, encoding, block_size)
+    finally:
+        try:
+            data.close()
+        except BufferError:
+            # raw rows still reference the map, which is closed once they are released
+            pass
+
+
+def batches(data_file: 'DataFile', size: int, columns: Sequence[int] = None, raw: bool = False,
+            encoding: str = 'utf-8') -> Iterator[List[tuple]]:
+    """
+    This function yields the rows of a data file in lists of up to size rows, see rows().
+
+    Returns:
+        a generator of lists of tuples
+    """
+    if size < 1:
+        raise ValueError('batches must hold at least one row')
+    iterator = rows(data_file, columns=columns, raw=raw, encoding=encoding)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _blocks(data: mmap.mmap, terminator: bytes, block_size: int) -> Iterator[Tuple[int, List[bytes]]]:
+    """
+    This function cuts the map into blocks of whole rows and splits each with bytes.split(), which finds the rows of a
+    block in a single call. A row longer than a block gets a block of its own.
+
+    Returns:
+        a generator of the offset of each block and its rows, without their terminators
+    """
+    size = len(data)
+    position = 0
+    while position < size:
+        end = min(position + block_size, size)
+        if end < size:
+            cut = data.rfind(terminator, position, end)
+            if cut == -1:
+                # the row is longer than a block
+                cut = data.find(terminator, end)
+            end = size if cut == -1 else cut + len(terminator)
+        lines = data[position:end].split(terminator)
+        if not lines[-1]:
+            lines.pop()
+        yield position, lines
+        position = end
+
+
+def _raw_rows(data: mmap.mmap, delimiter: bytes, terminator: bytes, columns: Optional[Sequence[int]],
+              block_size: int) -> Iterator[tuple]:
+    """
+    This function yields rows of memoryview slices. The rows of a block are split into fields by bytes.split(), up to
+    the last requested column, and the lengths of the fields give the offsets of their views. Only the block is copied,
+    and no view is created after the last requested column.
+    """
+    view = memoryview(data)
+    width, length = len(delimiter), len(terminator)
+    maxsplit = -1 if columns is None else max(columns) + 1
+    last = None if columns is None else maxsplit
+    for position, lines in _blocks(data, terminator, block_size):
+        for line in lines:
+            fields = []
+            start = position
+            for field in line.split(delimiter, maxsplit)[:last]:
+                stop = start + len(field)
+                fields.append(view[start:stop])
+                start = stop + width
+            if columns is None:
+                yield tuple(fields)
+            else:
+                count = len(fields)
+                yield tuple([fields[column] if column < count else None for column in columns])
+            position += len(line) + length
+
+
+def _decoded_rows(data: mmap.mmap, delimiter: str, terminator: bytes, columns: Optional[Sequence[int]],
+                  encoding: str, block_size: int) -> Iterator[tuple]:
+    """
+    This function yields rows of decoded fields. The rows of a block are decoded one at a time, and only the fields up
+    to the last requested column are split off. Fields are mapped through a dictionary lookup, the conversion of
+    parse_field() without a function call per field.
+    """
+    maxsplit = -1 if columns is None else max(columns) + 1
+    convert = NULL_FIELDS.get
+    for _, lines in _blocks(data, terminator, block_size):
+        for line in lines:
+            fields = line.decode(encoding).split(delimiter, maxsplit)
+            if columns is None:
+                yield tuple(map(convert, fields, fields))
+            else:
+                count = len(fields)
+                yield tuple([convert(fields[column], fields[column]) if column < count else None
+                             for column in columns])
@@ -0,0 +1,133 @@
+"""
+This module contains the data structure returned by loads and dumps. The figures are parsed from the output that bcp
+writes to its log file, so they are the same figures bcp reports.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn, hooks=[lambda result: print(result.rows_per_second)])
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    result = my_bcp.load(input_file=file, table='table_name')
+    print(result.rows_copied, result.elapsed)
+
+Loads report the rows bcp rejected, and write them to a quarantine file so that only those rows need reprocessing:
+
+.. code-block:: python
+
+    result = my_bcp.load(input_file=file, table='table_name', max_errors=1000)
+    print(result.rows_rejected, result.quarantine_file)
+"""
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    from .files import DataFile, ErrorFile, LogFile
+
+
+class TransferResult:
+    """
+    This describes a completed (or failed) load or dump. A parallel transfer reports the totals of its parts, which are
+    available individually as parts.
+
+    Args:
+        rows_copied: the number of rows bcp copied
+        elapsed: the clock time of the transfer, in seconds
+        rows_per_second: the average throughput of the transfer
+        packet_size: the network packet size bcp used, in bytes
+        exit_code: the return code of the bcp process
+        log_file: the log file holding bcp's output
+        error_file: the error file holding rows bcp rejected, for loads
+        data_file: the file that was loaded or written
+        parts: the results of the individual parts of a parallel transfer
+        rows_rejected: the number of rows bcp rejected into the error file, for loads
+        quarantine_file: the file holding the rejected rows, see RejectedRow
+        cached: the dump was answered from a ResultCache, without running bcp, see bcp.cache
+    """
+    def __init__(self, rows_copied: int = 0, elapsed: float = 0.0, rows_per_second: float = None,
+                 packet_size: int = None, exit_code: int = 0, log_file: 'LogFile' = None,
+                 error_file: 'ErrorFile' = None, data_file: 'DataFile' = None, parts: List['TransferResult'] = None,
+                 rows_rejected: int = 0, quarantine_file: 'DataFile' = None, cached: bool = False):
+        self.rows_copied = rows_copied
+        self.elapsed = elapsed
+        if rows_per_second is None:
+            rows_per_second = rows_copied / elapsed if elapsed > 0 else 0.0
+        self.rows_per_second = rows_per_second
+        self.packet_size = packet_size
+        self.exit_code = exit_code
+        self.log_file = log_file
+        self.error_file = error_file
+        self.data_file = data_file
+        self.parts = parts or []
+        self.rows_rejected = rows_rejected
+        self.quarantine_file = quarantine_file
+        self.cached = cached
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exit_code == 0
+
+    @classmethod
+    def combine(cls, results: List['TransferResult'], elapsed: float, data_file: 'DataFile' = None) \
+            -> 'TransferResult':
+        """
+        This totals the results of the parts of a parallel transfer.
+
+        Args:
+            results: the result of each part
+            elapsed: the clock time of the whole transfer, in seconds, since the parts overlap
+            data_file: the file that was loaded or written as a whole
+
+        Returns:
+            a result whose exit code is the worst of the parts
+        """
+        packet_sizes = [result.packet_size for result in results if result.packet_size]
+        exit_codes = [result.exit_code for result in results if result.exit_code != 0]
+        return cls(
+            rows_copied=sum(result.rows_copied for result in results),
+            elapsed=elapsed,
+            packet_size=packet_sizes[0] if packet_sizes else None,
+            exit_code=exit_codes[0] if exit_codes else 0,
+            data_file=data_file,
+            parts=results,
+            rows_rejected=sum(result.rows_rejected for result in results),
+        )
+
+    def __repr__(self):
+        return f'TransferResult(rows_copied={self.rows_copied}, elapsed={self.elapsed:.3f}, ' \
+               f'rows_per_second={self.rows_per_second:.2f}, exit_code={self.exit_code})'
+
+
+class RejectedRow:
+    """
+    This is a row that bcp rejected during a load, as recorded in its error file. A quarantine file holds one line per
+    rejected row: the row number, the column number and the reason, followed by the fields of the rejected record, all
+    separated by the data file's delimiter. Any delimiter in the reason is replaced with a space.
+
+    Args:
+        row: the number of the row within the file that was loaded, even when a parallel load read it from a part
+        column: the number of the column that could not be loaded, or None if bcp did not report one
+        reason: the error bcp reported for the row
+        record: the rejected record, without its row terminator
+    """
+    def __init__(self, row: int, column: int, reason: str, record: str):
+        self.row = row
+        self.column = column
+        self.reason = reason
+        self.record = record
+
+    def format(self, delimiter: str) -> str:
+        """
+        Args:
+            delimiter: the field delimiter of the quarantine file
+
+        Returns:
+            the line of the quarantine file for this row, without a row terminator
+        """
+        column = '' if self.column is None else str(self.column)
+        return delimiter.join([str(self.row), column, self.reason.replace(delimiter, ' '), self.record])
+
+    def __repr__(self):
+        return f'RejectedRow(row={self.row}, column={self.column}, reason={self.reason})'
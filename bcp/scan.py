@@ -0,0 +1,353 @@
+"""
+This module validates a character data file before it is handed to bcp, and builds an index of its records. The file is
+memory-mapped and divided into record-aligned chunks that are scanned in parallel by a process pool. Each chunk counts
+its records, checks the number of fields in every record against the delimiter, and tracks the widest value of each
+column. A malformed record is reported with its record number instead of surfacing hours into a load.
+
+The index records the byte offset of every stride-th record and is saved alongside the data file, e.g. data.csv.idx. It
+is only trusted while the size and modification time of the data file match, and it is reused to place split points
+(see DataFile.split()) and to translate record numbers into byte offsets and -F/-L ranges without scanning again.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    scan = file.scan()
+    if not scan.valid:
+        print(f'{scan.malformed} malformed records, e.g. {scan.samples[:5]}')
+    print(scan.records, scan.max_widths, scan.index.ranges(4))
+"""
+import array
+import bisect
+import mmap
+import struct
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from .state import atomic_write
+
+if TYPE_CHECKING:
+    from .files import DataFile
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'BCPIDX01'
+INDEX_HEADER = struct.Struct('<8sQqQQH')
+SUB_CHUNK_SIZE = 1 << 23
+
+
+class RecordIndex:
+    """
+    This is a sparse index of the records in a data file: the byte offset of the first record and of every stride-th
+    record after it. Record numbers start at 1, as they do for bcp's -F and -L options.
+
+    Args:
+        size: the size of the data file when it was indexed
+        mtime_ns: the modification time of the data file when it was indexed
+        records: the number of records in the data file
+        row_terminator: the row terminator the records were split on
+        checkpoints: the numbers of the indexed records
+        offsets: the byte offsets of the indexed records
+    """
+    def __init__(self, size: int, mtime_ns: int, records: int, row_terminator: bytes, checkpoints: array.array,
+                 offsets: array.array):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.records = records
+        self.row_terminator = row_terminator
+        self.checkpoints = checkpoints
+        self.offsets = offsets
+
+    @staticmethod
+    def path_for(data_file: 'DataFile') -> Path:
+        return data_file.path.with_name(data_file.path.name + INDEX_SUFFIX)
+
+    def is_current(self, data_file: 'DataFile') -> bool:
+        """
+        Returns:
+            True if the data file has not changed since it was indexed
+        """
+        stat = data_file.path.stat()
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    def save(self, path: Path):
+        """
+        This writes the index to a file, through a temporary file so that readers never see a partial index.
+
+        Args:
+            path: the index file
+        """
+        with atomic_write(path) as staging_path, staging_path.open('wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, self.size, self.mtime_ns, self.records,
+                                               len(self.checkpoints), len(self.row_terminator)))
+            index_file.write(self.row_terminator)
+            self.checkpoints.tofile(index_file)
+            self.offsets.tofile(index_file)
+
+    @classmethod
+    def load(cls, path: Path) -> 'RecordIndex':
+        """
+        This reads an index written by save().
+
+        Args:
+            path: the index file
+
+        Returns:
+            the index
+
+        Raises:
+            ValueError: the file is not an index
+        """
+        with path.open('rb') as index_file:
+            header = index_file.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                raise ValueError(f'{path} is not a record index')
+            magic, size, mtime_ns, records, count, terminator_length = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC:
+                raise ValueError(f'{path} is not a record index')
+            row_terminator = index_file.read(terminator_length)
+            checkpoints, offsets = array.array('Q'), array.array('Q')
+            checkpoints.fromfile(index_file, count)
+            offsets.fromfile(index_file, count)
+        return cls(size, mtime_ns, records, row_terminator, checkpoints, offsets)
+
+    @classmethod
+    def for_file(cls, data_file: 'DataFile', row_terminator: str = '\n') -> Optional['RecordIndex']:
+        """
+        This loads the sidecar index of a data file, if there is one and it is current.
+
+        Args:
+            data_file: the data file
+            row_terminator: the row terminator the index must have been built with
+
+        Returns:
+            the index, or None
+        """
+        path = cls.path_for(data_file)
+        try:
+            index = cls.load(path)
+        except (OSError, ValueError, EOFError):
+            return None
+        if index.row_terminator != row_terminator.encode() or not index.is_current(data_file):
+            return None
+        return index
+
+    def boundary(self, data_file: 'DataFile', position: int) -> int:
+        """
+        This finds the first record boundary at or after a byte offset, by reading forward from the nearest indexed
+        record at or before it.
+
+        Args:
+            data_file: the indexed data file
+            position: a byte offset in the data file
+
+        Returns:
+            the offset of the first record at or after the position, or the size of the file
+        """
+        if position >= self.size:
+            return self.size
+        found = bisect.bisect_right(self.offsets, position) - 1
+        start = self.offsets[found] if found >= 0 else 0
+        if start == position:
+            return position
+        with data_file.path.open('rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _record_boundary(data, max(position, start + len(self.row_terminator)), self.row_terminator)
+
+    def offset(self, data_file: 'DataFile', record: int) -> int:
+        """
+        This finds the byte offset of a record, by reading forward from the nearest indexed record before it.
+
+        Args:
+            data_file: the indexed data file
+            record: the record number, starting at 1
+
+        Returns:
+            the offset of the record, or the size of the file for records past the end
+        """
+        if record > self.records:
+            return self.size
+        found = bisect.bisect_right(self.checkpoints, record) - 1
+        position, remaining = self.offsets[found], record - self.checkpoints[found]
+        if remaining == 0:
+            return position
+        with data_file.path.open('rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            while remaining:
+                position = data.find(self.row_terminator, position) + len(self.row_terminator)
+                remaining -= 1
+        return position
+
+    def record(self, data_file: 'DataFile', position: int) -> int:
+        """
+        This finds the number of the record starting at a byte offset, by counting the records from the nearest indexed
+        record before it.
+
+        Args:
+            data_file: the indexed data file
+            position: the offset of a record in the data file
+
+        Returns:
+            the record number, starting at 1
+        """
+        found = bisect.bisect_right(self.offsets, position) - 1
+        if found < 0:
+            return 1
+        start = self.offsets[found]
+        if start == position:
+            return self.checkpoints[found]
+        with data_file.path.open('rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return self.checkpoints[found] + data[start:position].count(self.row_terminator)
+
+    def ranges(self, parts: int) -> List[Tuple[int, int]]:
+        """
+        This divides the records into contiguous ranges of nearly equal size, for bcp's -F and -L options.
+
+        Args:
+            parts: the number of ranges, fewer are returned if there are fewer records
+
+        Returns:
+            (first, last) record numbers, inclusive
+        """
+        parts = max(min(parts, self.records), 1)
+        bounds = [self.records * part // parts for part in range(parts + 1)]
+        return [(first + 1, last) for first, last in zip(bounds, bounds[1:]) if last > first]
+
+    def __repr__(self):
+        return f'RecordIndex(records={self.records}, size={self.size}, checkpoints={len(self.checkpoints)})'
+
+
+class ScanResult:
+    """
+    This is the outcome of DataFile.scan().
+
+    Args:
+        records: the number of records in the file
+        fields: the number of fields expected in each record
+        malformed: the number of records with a different number of fields
+        samples: (record number, number of fields) for the first malformed records
+        max_widths: the widest value, in bytes, of each column, over the well-formed records
+        index: the record index of the file
+        elapsed: the seconds the scan took
+    """
+    def __init__(self, records: int, fields: int, malformed: int, samples: List[Tuple[int, int]],
+                 max_widths: List[int], index: RecordIndex, elapsed: float):
+        self.records = records
+        self.fields = fields
+        self.malformed = malformed
+        self.samples = samples
+        self.max_widths = max_widths
+        self.index = index
+        self.elapsed = elapsed
+
+    @property
+    def valid(self) -> bool:
+        return self.malformed == 0
+
+    def __repr__(self):
+        return f'ScanResult(records={self.records}, fields={self.fields}, malformed={self.malformed}, ' \
+               f'elapsed={self.elapsed:.3f})'
+
+
+def scan(data_file: 'DataFile', fields: int = None, row_terminator: str = None, workers: int = None,
+         chunk_size: int = 1 << 26, stride: int = 65536, max_samples: int = 100, save_index: bool = True) \
+        -> ScanResult:
+    """
+    This function scans a character data file. See DataFile.scan().
+    """
+    if data_file.compression is not None:
+        raise ValueError(f'{data_file.path.name} is compressed and cannot be memory-mapped for a scan')
+    started = time.monotonic()
+    delimiter, terminator = data_file.delimiter.encode(), (row_terminator or data_file.row_terminator).encode()
+    stat = data_file.path.stat()
+    chunks = []
+    if stat.st_size > 0:
+        with data_file.path.open('rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if fields is None:
+                first_end = data.find(terminator)
+                fields = data[:first_end if first_end != -1 else stat.st_size].count(delimiter) + 1
+            boundaries = [0]
+            while boundaries[-1] < stat.st_size:
+                boundaries.append(_record_boundary(data, boundaries[-1] + chunk_size, terminator))
+        chunks = [(str(data_file.path), start, end, delimiter, terminator, fields, stride, max_samples)
+                  for start, end in zip(boundaries, boundaries[1:])]
+    if len(chunks) > 1 and workers != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(_scan_chunk, *zip(*chunks)))
+    else:
+        outcomes = [_scan_chunk(*chunk) for chunk in chunks]
+
+    records, malformed, samples, max_widths = 0, 0, [], [0] * (fields or 0)
+    checkpoints, offsets = array.array('Q'), array.array('Q')
+    for chunk_records, chunk_malformed, chunk_samples, chunk_widths, chunk_checkpoints in outcomes:
+        for local_record, offset in chunk_checkpoints:
+            checkpoints.append(records + local_record)
+            offsets.append(offset)
+        samples.extend((records + local_record, count) for local_record, count in chunk_samples)
+        max_widths = [max(width, chunk_width) for width, chunk_width in zip(max_widths, chunk_widths)]
+        records += chunk_records
+        malformed += chunk_malformed
+    index = RecordIndex(stat.st_size, stat.st_mtime_ns, records, terminator, checkpoints, offsets)
+    if save_index:
+        index.save(RecordIndex.path_for(data_file))
+    return ScanResult(records, fields or 0, malformed, samples[:max_samples], max_widths, index,
+                      time.monotonic() - started)
+
+
+def _record_boundary(data: mmap.mmap, position: int, terminator: bytes) -> int:
+    """This finds the offset just past the first row terminator at or after position, or the end of the data."""
+    if position >= len(data):
+        return len(data)
+    found = data.find(terminator, max(position - len(terminator) + 1, 0))
+    return len(data) if found == -1 else found + len(terminator)
+
+
+def _scan_chunk(path: str, start: int, end: int, delimiter: bytes, terminator: bytes, fields: int, stride: int,
+                max_samples: int) -> tuple:
+    """
+    This function scans the records between two record-aligned offsets, a few megabytes at a time. It runs in a worker
+    process, so it opens and maps the file itself and returns only totals, samples and index checkpoints, numbered
+    from 1 within the chunk.
+    """
+    records, malformed, samples, max_widths, checkpoints = 0, 0, [], [0] * fields, []
+    # replacing the terminators with delimiters can only create a spurious delimiter where a record ends with a prefix
+    # of the delimiter that overlaps with its own suffix, e.g. a record ending in '|~' with the delimiter '|~|'
+    spurious_tails = [delimiter[:length] + terminator for length in range(1, len(delimiter))
+                      if delimiter[length:] == delimiter[:len(delimiter) - length]]
+    with open(path, 'rb') as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = start
+        while position < end:
+            sub_end = min(_record_boundary(data, position + SUB_CHUNK_SIZE, terminator), end)
+            block = data[position:sub_end]
+            if block.endswith(terminator):
+                block = block[:-len(terminator)]
+            lines = block.split(terminator)
+            # checkpoints are every stride-th record of the chunk, located by summing the preceding line lengths
+            next_checkpoint = -records % stride
+            if next_checkpoint < len(lines):
+                offset, line_number = position, 0
+                for checkpoint in range(next_checkpoint, len(lines), stride):
+                    skipped = lines[line_number:checkpoint]
+                    offset += sum(map(len, skipped)) + len(skipped) * len(terminator)
+                    line_number = checkpoint
+                    checkpoints.append((records + checkpoint + 1, offset))
+            counts = [line.count(delimiter) for line in lines]
+            if counts.count(fields - 1) == len(lines) and not any(tail in block for tail in spurious_tails):
+                # every record is well-formed, so the fields of a column are every fields-th value of the block
+                values = block.replace(terminator, delimiter).split(delimiter)
+                columns = [values[column::fields] for column in range(fields)]
+            else:
+                for number, count in enumerate(counts, records + 1):
+                    if count != fields - 1:
+                        malformed += 1
+                        if len(samples) < max_samples:
+                            samples.append((number, count + 1))
+                columns = zip(*[line.split(delimiter) for line, count in zip(lines, counts) if count == fields - 1])
+            for column, values in enumerate(columns):
+                if values:
+                    max_widths[column] = max(max_widths[column], max(map(len, values)))
+            records += len(lines)
+            position = sub_end
+    return records, malformed, samples, max_widths, checkpoints
@@ -0,0 +1,250 @@
+"""
+This module sorts a character data file on one or more of its fields with an external merge sort, so that a file larger
+than memory can be loaded in the order of a table's clustered index, see DataFile.sort(). The file is cut into
+record-aligned runs of about run_size bytes, which are sorted in memory on a process pool and written alongside the
+output file. The runs are then merged with heapq.merge, at most MERGE_WIDTH at a time, so memory use is bounded by the
+run size times the number of workers, whatever the size of the file.
+
+A sorted file remembers the table columns it is sorted on, and loading it passes them to bcp as an ORDER hint, so SQL
+Server does not sort the data again, e.g. in tempdb, before inserting it into a clustered index. A column followed by
+DESC, e.g. 'created_at DESC', is sorted in descending order.
+
+.. note::
+    Fields are compared as bytes by default, which for UTF-8 data is the order of their code points. That matches the
+    order of binary collations and of ISO 8601 dates, but not of other collations or of numbers. An ORDER hint that does
+    not match the data makes the load fail, so when the columns are given, every key needs a key type that converts
+    the field into a value ordered like its column, e.g. int, or bytes to declare that the column is ordered like the
+    bytes. Empty fields, which bcp loads as NULL, sort first, and last in descending order, as NULL does in SQL Server.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn)
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    sorted_file = file.sort(keys=[0, 2], columns=['id', 'created_at DESC'], key_types=[int, bytes])
+    my_bcp.load(input_file=sorted_file, table='table_name')  # loads with -h "ORDER(id, created_at DESC)"
+"""
+import heapq
+import itertools
+import os
+import re
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from .files import DataFile, _next_record_boundary
+
+RUN_SIZE = 1 << 26
+MERGE_WIDTH = 64
+READ_SIZE = 1 << 20
+WRITE_BATCH = 4096
+DIRECTION = re.compile(r'\s+(ASC|DESC)\s*$', re.IGNORECASE)
+
+KeyType = Optional[Callable[[bytes], Any]]
+
+
+def sort(data_file: DataFile, target: DataFile, keys: Sequence[int], columns: Sequence[str] = None,
+         key_types: Sequence[KeyType] = None, workers: int = None, run_size: int = RUN_SIZE) -> DataFile:
+    """
+    This function sorts a character data file into another file, see the module documentation.
+
+    Args:
+        data_file: the file to sort, which must not be compressed
+        target: the file to write the sorted records to, which may be compressed
+        keys: the positions of the fields to sort on, starting at 0, most significant first
+        columns: the table columns that the key fields are loaded into, each optionally followed by ASC or DESC,
+            recorded as the order of the sorted file
+        key_types: a picklable callable per key, e.g. int, that converts the field's bytes into a comparable value, or
+            None to compare the bytes, required for every key when the columns are given
+        workers: the number of worker processes, defaulted to the number of processors, 1 sorts in this process
+        run_size: the approximate number of bytes sorted in memory per run
+
+    Returns:
+        the target, whose order is the columns
+
+    Raises:
+        ValueError: the file is compressed, the keys, columns and key types do not match, or a column has no key type
+    """
+    if data_file.compression is not None:
+        raise ValueError(f'{data_file.path.name} is compressed and cannot be cut into runs')
+    if not keys:
+        raise ValueError('at least one key field is required')
+    if columns is not None and len(columns) != len(keys):
+        raise ValueError('columns must name the table column of every key field')
+    if key_types is not None and len(key_types) != len(keys):
+        raise ValueError('key_types must have a type, or None, for every key field')
+    if columns is not None and (key_types is None or None in key_types):
+        raise ValueError('the order of the columns is declared to the server, so every key needs a key type ordered '
+                         'like its column, e.g. int, or bytes for a column ordered like the bytes')
+    descending = tuple(_is_descending(column) for column in columns or [])
+    key = (data_file.delimiter.encode(), tuple(keys), tuple(key_types or [None] * len(keys)), descending)
+    terminator = data_file.row_terminator.encode()
+    ranges = _runs(data_file, terminator, run_size)
+    tasks = [(str(data_file.path), start, end, terminator, key, str(_run_path(target, index)))
+             for index, (start, end) in enumerate(ranges)]
+    created = [task[-1] for task in tasks]
+    runs = []
+    try:
+        if workers == 1 or len(tasks) <= 1:
+            for task in tasks:
+                runs.append(_sort_run(*task))
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(tasks))) as executor:
+                for run in executor.map(_sort_run, *zip(*tasks)):
+                    runs.append(run)
+        while len(runs) > MERGE_WIDTH:
+            # too many runs to open at once, so they are merged into fewer, longer runs first
+            merged = []
+            for start in range(0, len(runs), MERGE_WIDTH):
+                created.append(str(_run_path(target, len(created))))
+                with open(created[-1], 'wb') as run:
+                    _merge(runs[start:start + MERGE_WIDTH], run, terminator, key)
+                merged.append(created[-1])
+            for path in runs:
+                os.unlink(path)
+            runs = merged
+        with target.open('wb') as output:
+            _merge(runs, output, terminator, key)
+    finally:
+        for path in created:
+            if os.path.exists(path):
+                os.unlink(path)
+    target.order = list(columns) if columns is not None else None
+    return target
+
+
+def _runs(data_file: DataFile, terminator: bytes, run_size: int) -> List[Tuple[int, int]]:
+    """
+    This function cuts a file into record-aligned byte ranges of about run_size bytes.
+    """
+    size = data_file.path.stat().st_size
+    ranges = []
+    with data_file.path.open('rb') as source:
+        start = 0
+        while start < size:
+            end = min(_next_record_boundary(source, start + run_size, terminator), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _run_path(target: DataFile, index: int) -> Path:
+    return target.path.with_name(f'{target.path.name}.run{index:04d}')
+
+
+def _is_descending(column: str) -> bool:
+    direction = DIRECTION.search(column)
+    return direction is not None and direction.group(1).upper() == 'DESC'
+
+
+class _Descending:
+    """This wraps the key of a field that is sorted in descending order, reversing its comparisons."""
+    __slots__ = ('key',)
+
+    def __init__(self, key: tuple):
+        self.key = key
+
+    def __lt__(self, other: '_Descending') -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other: '_Descending') -> bool:
+        return self.key == other.key
+
+
+def _key_function(key: tuple) -> Callable[[bytes], tuple]:
+    """
+    This function builds the function that computes the sort key of a record. Each key field becomes (False,) when it
+    is empty, so that it sorts first, or (True, value) otherwise, wrapped in _Descending for a descending column. A
+    single ascending key, the common case, is computed without looping over the keys, since the key of every record is
+    computed once to sort its run and once to merge it.
+    """
+    delimiter, keys, key_types, descending = key
+    maxsplit = max(keys) + 1
+
+    if len(keys) == 1 and not any(descending):
+        position, key_type = keys[0], key_types[0]
+
+        def single_key(record: bytes) -> tuple:
+            fields = record.split(delimiter, maxsplit)
+            field = fields[position] if position < len(fields) else b''
+            if not field:
+                return (False,)
+            return True, field if key_type is None else key_type(field)
+
+        return single_key
+
+    fields_and_types = tuple(zip(keys, key_types))
+
+    def compound_key(record: bytes) -> tuple:
+        fields = record.split(delimiter, maxsplit)
+        count = len(fields)
+        return tuple((False,) if position >= count or not fields[position] else
+                     (True, fields[position] if key_type is None else key_type(fields[position]))
+                     for position, key_type in fields_and_types)
+
+    if not any(descending):
+        return compound_key
+    directions = tuple(enumerate(descending))
+
+    def directed_key(record: bytes) -> tuple:
+        fields = compound_key(record)
+        return tuple(_Descending(fields[position]) if reverse else fields[position]
+                     for position, reverse in directions)
+
+    return directed_key
+
+
+def _sort_run(path: str, start: int, end: int, terminator: bytes, key: tuple, run_path: str) -> str:
+    """
+    This function sorts one run of a file and writes it to its own file. It runs in a worker process, so it reads the
+    run itself.
+
+    Returns:
+        the path of the sorted run
+    """
+    with open(path, 'rb') as source:
+        source.seek(start)
+        records = source.read(end - start).split(terminator)
+    if records and not records[-1]:
+        records.pop()
+    records.sort(key=_key_function(key))
+    with open(run_path, 'wb') as run:
+        if records:
+            run.write(terminator.join(records))
+            run.write(terminator)
+    return run_path
+
+
+def _records(path: str, terminator: bytes) -> Iterator[bytes]:
+    """
+    This function yields the records of a sorted run, without their terminators.
+    """
+    with open(path, 'rb') as run:
+        tail = b''
+        while True:
+            block = run.read(READ_SIZE)
+            if not block:
+                break
+            records = (tail + block).split(terminator)
+            tail = records.pop()
+            yield from records
+        if tail:
+            yield tail
+
+
+def _merge(runs: List[str], output, terminator: bytes, key: tuple):
+    """
+    This function merges sorted runs into a binary file object. heapq.merge is stable, so records with equal keys keep
+    the order of their runs, i.e. of the file.
+    """
+    merged = heapq.merge(*(_records(run, terminator) for run in runs), key=_key_function(key))
+    while True:
+        batch = list(itertools.islice(merged, WRITE_BATCH))
+        if not batch:
+            break
+        output.write(terminator.join(batch))
+        output.write(terminator)
@@ -0,0 +1,76 @@
+"""
+This module holds what the files kept between runs have in common: checkpoints, tuned settings, watermarks, result cache
+entries, record indexes and cached format files. Each is named after a hash of the things it describes, e.g. the
+connection and the table, and is replaced atomically, through a uniquely named staging file, so that readers never see
+a partial file and concurrent writers never write into each other's.
+"""
+import hashlib
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Union
+
+from .config import ensure_directory
+
+
+def state_key(*parts: Union[str, bytes]) -> str:
+    """
+    This function hashes the parts that identify a state file. Parts are separated by a NUL character, which none of
+    them can contain, so different parts never produce the same key.
+
+    Args:
+        parts: the strings, or bytes, that identify the state
+
+    Returns:
+        the hexadecimal SHA-1 of the parts
+    """
+    encoded = [part if isinstance(part, bytes) else str(part).encode() for part in parts]
+    return hashlib.sha1(b'\0'.join(encoded)).hexdigest()
+
+
+def state_path(directory: Path, *parts: Union[str, bytes], suffix: str = '.json') -> Path:
+    """
+    Args:
+        directory: the directory holding this kind of state, e.g. BCP_CHECKPOINT_DIR
+        parts: the strings, or bytes, that identify the state, see state_key()
+        suffix: the file extension
+
+    Returns:
+        the path of the state file, whose directory is only created when the file is written
+    """
+    return directory / Path(f'{state_key(*parts)}{suffix}')
+
+
+@contextmanager
+def atomic_write(path: Path) -> Iterator[Path]:
+    """
+    This context manager provides a staging path to write a file to, which then replaces the file in a single step. If
+    the block raises, the staging file is removed and the file is left as it was.
+
+    Args:
+        path: the file to replace
+
+    Returns:
+        the staging path, in the same directory as the file, which is created if needed
+    """
+    staging_path = ensure_directory(path.parent) / Path(f'{path.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        yield staging_path
+        os.replace(str(staging_path), str(path))
+    finally:
+        if staging_path.exists():
+            staging_path.unlink()
+
+
+def write_json_atomic(path: Path, data: Any):
+    """
+    This function replaces a file with the JSON of data, atomically, see atomic_write().
+
+    Args:
+        path: the file to replace
+        data: the JSON serializable state
+    """
+    with atomic_write(path) as staging_path:
+        staging_path.write_text(json.dumps(data))
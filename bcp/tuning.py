@@ -0,0 +1,133 @@
+"""
+This module chooses the batch size and network packet size of loads, see BCP.load(autotune=True). The best settings
+depend on the table, its indexes and the network, so they are measured rather than guessed. The first tuned load of a
+table is calibrated: it loads consecutive chunks of its file, each with different settings, and records the throughput
+that bcp reports for each. The batch size is chosen first, with the smallest packet size, and the packet size is then
+chosen for that batch size. The rest of the file is loaded with the fastest settings, which are remembered per table
+under BCP_TUNING_DIR and used by every later tuned load of the table without calibrating again.
+
+The calibration chunks are part of the load, not a rehearsal, so a tuned load copies every row exactly once.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn)
+    file = bcp.DataFile(file_path='path/to/file.csv', delimiter=',')
+    my_bcp.load(input_file=file, table='table_name', autotune=True)
+"""
+import json
+from typing import TYPE_CHECKING, Iterator, Optional, Sequence
+
+from .config import BCP_TUNING_DIR
+from .state import state_path, write_json_atomic
+
+if TYPE_CHECKING:
+    from .connections import Connection
+    from .results import TransferResult
+
+BATCH_SIZES = (5000, 20000, 100000)
+PACKET_SIZES = (4096, 16384, 32768)
+
+
+class LoadTuner:
+    """
+    This measures and remembers the fastest batch size and packet size for loading a table.
+
+    Args:
+        connection: the Connection object the loads run against
+        table: the table being loaded
+        batch_sizes: the batch sizes to try
+        packet_sizes: the network packet sizes to try, in bytes
+        calibration_rows: the number of rows loaded with each setting
+    """
+    def __init__(self, connection: 'Connection', table: str, batch_sizes: Sequence[int] = BATCH_SIZES,
+                 packet_sizes: Sequence[int] = PACKET_SIZES, calibration_rows: int = 50000):
+        self.connection = connection
+        self.table = table
+        self.batch_sizes = list(batch_sizes)
+        self.packet_sizes = list(packet_sizes)
+        self.calibration_rows = calibration_rows
+        self.measurements = {}
+        self.next_row = 1
+        self.exhausted = False
+        self.path = state_path(BCP_TUNING_DIR, connection.driver, connection.host, str(connection.port), table)
+
+    def remembered(self) -> Optional[dict]:
+        """
+        Returns:
+            the batch_size and packet_size remembered for the table, or None if it has not been calibrated
+        """
+        try:
+            state = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return None
+        if state.get('table') != self.table:
+            return None
+        return {'batch_size': state['batch_size'], 'packet_size': state['packet_size']}
+
+    def trials(self) -> Iterator[dict]:
+        """
+        This yields the calibration chunks to load, in order. Each one must be loaded and passed to record() before the
+        next one is requested, since later chunks depend on the throughput of earlier ones. The chunks stop early when
+        one of them reaches the end of the file.
+
+        Returns:
+            the first_row, last_row, batch_size and packet_size of each chunk, as arguments for the dialect's Load
+        """
+        packet_size = self.packet_sizes[0]
+        for batch_size in self.batch_sizes:
+            if self.exhausted:
+                return
+            yield self._trial(batch_size, packet_size)
+        batch_size = self.best()['batch_size']
+        for packet_size in self.packet_sizes[1:]:
+            if self.exhausted:
+                return
+            yield self._trial(batch_size, packet_size)
+
+    def _trial(self, batch_size: int, packet_size: int) -> dict:
+        return {'first_row': self.next_row, 'last_row': self.next_row + self.calibration_rows - 1,
+                'batch_size': batch_size, 'packet_size': packet_size}
+
+    def record(self, trial: dict, result: 'TransferResult'):
+        """
+        This records the throughput of a calibration chunk. A chunk that read fewer rows than it asked for, counting
+        both the rows copied and the rows rejected, reached the end of the file.
+
+        Args:
+            trial: the chunk, as yielded by trials()
+            result: the result of loading it
+        """
+        self.measurements[(trial['batch_size'], trial['packet_size'])] = result.rows_per_second
+        self.next_row = trial['last_row'] + 1
+        if result.rows_copied + result.rows_rejected < trial['last_row'] - trial['first_row'] + 1:
+            self.exhausted = True
+
+    def best(self) -> dict:
+        """
+        Returns:
+            the batch_size and packet_size with the highest throughput measured so far
+        """
+        batch_size, packet_size = max(self.measurements, key=self.measurements.get)
+        return {'batch_size': batch_size, 'packet_size': packet_size}
+
+    def save(self):
+        """
+        This remembers the best settings measured for the table, replacing the file atomically.
+        """
+        state = dict(self.best(), table=self.table,
+                     measurements=[[batch_size, packet_size, rows_per_second]
+                                   for (batch_size, packet_size), rows_per_second in self.measurements.items()])
+        write_json_atomic(self.path, state)
+
+    def forget(self):
+        """This removes the remembered settings, so the next tuned load of the table calibrates again."""
+        if self.path.exists():
+            self.path.unlink()
+
+    def __repr__(self):
+        return f'LoadTuner(table={self.table}, batch_sizes={self.batch_sizes}, packet_sizes={self.packet_sizes})'
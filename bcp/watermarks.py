@@ -0,0 +1,105 @@
+"""
+This module persists the state of incremental dumps, see BCP.dump_incremental(). Each export of a query or table
+records the high-water mark of its watermark column, e.g. a modification time or a rowversion, and the number of the
+last file it wrote, under BCP_WATERMARK_DIR. The next export only copies the rows above that mark, into the next file of
+the sequence. The state is replaced atomically, and only once bcp has succeeded, so a failed export is simply repeated
+by the next one.
+
+.. note::
+    A row is only exported once its watermark is above the previous high-water mark. Rows written by transactions that
+    were still open when an export read the high-water mark, with a lower watermark than rows already committed, are
+    missed; rowversion columns filtered on min_active_rowversion() avoid this.
+
+Example:
+
+.. code-block:: python
+
+    import bcp
+
+    conn = bcp.Connection(host='HOST', driver='mssql', username='USER', password='PASSWORD')
+    my_bcp = bcp.BCP(conn)
+    file = bcp.DataFile(file_path='path/to/orders.csv', delimiter=',')
+    result = my_bcp.dump_incremental(query='dbo.orders', watermark_column='modified_at', output_file=file)
+    print(result.data_file)  # path/to/orders.000001.csv, then path/to/orders.000002.csv, ...
+"""
+import datetime
+import json
+from typing import TYPE_CHECKING, Optional
+
+from .config import BCP_WATERMARK_DIR
+from .files import DataFile
+from .state import state_path, write_json_atomic
+
+if TYPE_CHECKING:
+    from .connections import Connection
+
+
+class Watermark:
+    """
+    This is the state of the incremental dumps of a query, or table, from a connection.
+
+    Args:
+        connection: the Connection object the dumps run against
+        query: the query, or table, being exported
+        column: the watermark column
+    """
+    def __init__(self, connection: 'Connection', query: str, column: str):
+        self.connection = connection
+        self.query = query
+        self.column = column
+        self.path = state_path(BCP_WATERMARK_DIR, connection.driver, connection.host, str(connection.port), query,
+                               column)
+
+    def read(self) -> dict:
+        """
+        Returns:
+            the high_water literal, None before the first export, and the sequence number of the last file written
+        """
+        try:
+            state = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {'high_water': None, 'sequence': 0}
+        return {'high_water': state['high_water'], 'sequence': state['sequence']}
+
+    @property
+    def high_water(self) -> Optional[str]:
+        return self.read()['high_water']
+
+    @property
+    def sequence(self) -> int:
+        return self.read()['sequence']
+
+    def next_file(self, output_file: DataFile) -> DataFile:
+        """
+        This names the file for the next export after the output file, e.g. orders.000042.csv for orders.csv, or
+        orders.csv.000042.gz for a compressed file.
+
+        Args:
+            output_file: the file that names the sequence
+
+        Returns:
+            a DataFile with the same delimiter and row terminator as the output file
+        """
+        file_name = f'{output_file.path.stem}.{self.sequence + 1:06d}{output_file.path.suffix}'
+        return DataFile(file_path=output_file.path.with_name(file_name), delimiter=output_file.delimiter,
+                        row_terminator=output_file.row_terminator)
+
+    def save(self, high_water: str, sequence: int):
+        """
+        This records a successful export, replacing the state atomically.
+
+        Args:
+            high_water: the literal of the high-water mark the export went up to
+            sequence: the sequence number of the file it wrote
+        """
+        state = {'query': self.query, 'column': self.column, 'high_water': high_water, 'sequence': sequence,
+                 'exported_at': datetime.datetime.now().isoformat()}
+        write_json_atomic(self.path, state)
+
+    def reset(self):
+        """This forgets the state, so the next export copies every row again, starting a new sequence."""
+        if self.path.exists():
+            self.path.unlink()
+
+    def __repr__(self):
+        return f'Watermark(query={self.query}, column={self.column})'
@@ -0,0 +1 @@
+"""This package contains the benchmark suite, see run.py."""
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+This is a stand-in for the bcp command line utility, which lets the benchmarks run without a database. It accepts the
+arguments this library passes to bcp, consumes (in) or produces (out/queryout) character data at a controllable rate,
+and writes the same progress and summary messages as bcp, to the -o log file or to stdout.
+
+It is configured through environmental variables:
+
+    - FAKE_BCP_ROWS: the number of rows produced by out/queryout, defaulted to 1000
+    - FAKE_BCP_COLUMNS: the number of columns produced by out/queryout, defaulted to 4
+    - FAKE_BCP_ROWS_PER_SEC: the maximum rate at which rows are consumed or produced, unlimited by default
+    - FAKE_BCP_STARTUP_MS: a delay before any data is transferred, simulating the login, defaulted to 0
+    - FAKE_BCP_FAIL: when set, bcp reports a connection failure and exits with 1
+
+Use install() to put it on the PATH under the name bcp.
+"""
+import os
+import re
+import stat
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+FLAGS = {'-T', '-c', '-n', '-N', '-w', '-x', '-k', '-E', '-q', '-V', '-R', '-K'}
+
+
+def parse_arguments(arguments: list) -> tuple:
+    source, direction, target = arguments[:3]
+    position = 3
+    options = {}
+    while position < len(arguments):
+        argument = arguments[position]
+        if argument in FLAGS:
+            options[argument] = True
+            position += 1
+        else:
+            options[argument] = arguments[position + 1]
+            position += 2
+    return source, direction, target, options
+
+
+def unescape(value: str) -> str:
+    return value.replace('\\t', '\t').replace('\\n', '\n').replace('\\r', '\r')
+
+
+class Throttle:
+    """This sleeps as needed to keep the number of rows per second under a limit."""
+    def __init__(self, rows_per_second: float):
+        self.rows_per_second = rows_per_second
+        self.started = time.monotonic()
+
+    def wait(self, rows: int):
+        if self.rows_per_second:
+            delay = rows / self.rows_per_second - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def copy_in(target: str, options: dict, throttle: Throttle, log) -> int:
+    terminator = unescape(options.get('-r', '\n')).encode()
+    first_row = int(options.get('-F', 1))
+    last_row = int(options.get('-L', 0))
+    batch_size = int(options.get('-b', 1000))
+    rows, sent, tail, unterminated = 0, 0, b'', False
+    with open(target, 'rb') as data:
+        while True:
+            chunk = data.read(1 << 16)
+            if not chunk:
+                break
+            buffer = tail + chunk
+            rows += buffer.count(terminator)
+            tail = buffer[len(buffer) - len(terminator) + 1:] if len(terminator) > 1 else b''
+            unterminated = not buffer.endswith(terminator)
+            loaded = max(0, (min(rows, last_row) if last_row else rows) - first_row + 1)
+            throttle.wait(loaded)
+            while loaded - sent >= batch_size:
+                sent += batch_size
+                print(f'{batch_size} rows sent to SQL Server. Total sent: {sent}', file=log, flush=True)
+            if last_row and rows >= last_row:
+                break
+    rows += unterminated
+    return max(0, (min(rows, last_row) if last_row else rows) - first_row + 1)
+
+
+def copy_out(source: str, target: str, options: dict, throttle: Throttle, log) -> int:
+    delimiter = unescape(options.get('-t', '\t'))
+    terminator = unescape(options.get('-r', '\n'))
+    total = int(os.environ.get('FAKE_BCP_ROWS', 1000))
+    columns = int(os.environ.get('FAKE_BCP_COLUMNS', 4))
+    if re.search(r'select min\(', source, re.IGNORECASE):
+        lines = [f'1{delimiter}{total}']
+    elif 'dm_exec_describe_first_result_set' in source:
+        lines = [f'{column + 1}{delimiter}column_{column}{delimiter}int{delimiter}1' for column in range(columns)]
+    else:
+        lines = None
+    with open(target, 'w', newline='') as data:
+        if lines is not None:
+            data.write(''.join(line + terminator for line in lines))
+            return len(lines)
+        batch = []
+        for row in range(total):
+            batch.append(delimiter.join([str(row)] + [f'value_{row}_{column}' for column in range(1, columns)]))
+            if len(batch) == 1000 or row == total - 1:
+                data.write(terminator.join(batch) + terminator)
+                throttle.wait(row + 1)
+                print(f'{len(batch)} rows successfully bulk-copied to host-file. Total received: {row + 1}',
+                      file=log, flush=True)
+                batch = []
+    return total
+
+
+def main(arguments: list) -> int:
+    source, direction, target, options = parse_arguments(arguments)
+    log = open(options['-o'], 'w') if '-o' in options else sys.stdout
+    try:
+        if os.environ.get('FAKE_BCP_FAIL'):
+            print('SQLState = 08S01, NativeError = 10054', file=log)
+            print('Error = [Microsoft][ODBC Driver 17 for SQL Server]TCP Provider: Error code 0x2746', file=log)
+            return 1
+        time.sleep(int(os.environ.get('FAKE_BCP_STARTUP_MS', 0)) / 1000)
+        started = time.monotonic()
+        throttle = Throttle(float(os.environ.get('FAKE_BCP_ROWS_PER_SEC', 0)))
+        print('\nStarting copy...', file=log, flush=True)
+        if direction == 'in':
+            rows = copy_in(target, options, throttle, log)
+        elif direction in ('out', 'queryout'):
+            rows = copy_out(source, target, options, throttle, log)
+        else:
+            Path(options['-f']).write_text('<?xml version="1.0"?>\n<BCPFORMAT/>\n')
+            return 0
+        clock_ms = max(int((time.monotonic() - started) * 1000), 1)
+        print(f'\n{rows} rows copied.', file=log)
+        print('Network packet size (bytes): 4096', file=log)
+        print(f'Clock Time (ms.) Total     : {clock_ms}      Average : ({rows * 1000 / clock_ms:.2f} rows per sec.)',
+              file=log)
+        return 0
+    finally:
+        if log is not sys.stdout:
+            log.close()
+
+
+def install(directory: Path = None) -> Path:
+    """
+    This creates an executable named bcp that runs this module with the current interpreter.
+
+    Args:
+        directory: where to create it, defaulted to a new temporary directory
+
+    Returns:
+        the directory, which should be put at the front of the PATH
+    """
+    directory = directory or Path(tempfile.mkdtemp(prefix='fake_bcp_'))
+    executable = directory / 'bcp'
+    executable.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).absolute()}" "$@"\n')
+    executable.chmod(executable.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return directory
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,508 @@
+"""
+This is the benchmark suite for the library. It runs against the fake bcp in fake_bcp.py, so it needs no database, and
+measures the cost of the library itself: import time, wrapper overhead per call, command construction, parallel
+load/dump scaling and database to database copies against a rate-limited bcp, file splitting and scanning throughput,
+CSV normalization throughput and the streaming modes. Results are written as JSON so that runs can be compared.
+
+Usage:
+
+.. code-block:: text
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --output after.json --compare before.json
+    python -m benchmarks.run --only split_throughput --scale 4
+
+Everything the benchmarks write goes to a temporary BCP_ROOT_DIR, which is removed afterwards.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from typing import Callable, Dict
+
+PROJECT_ROOT = Path(__file__).absolute().parents[1]
+BENCHMARKS = {}
+
+
+def benchmark(name: str) -> Callable:
+    """This registers a benchmark function, which receives the Settings and returns a dict of measurements."""
+    def register(function: Callable) -> Callable:
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class Settings:
+    """
+    This holds the scale of the run and the scratch directory the benchmarks work in.
+
+    Args:
+        scale: a multiplier for the amount of data each benchmark moves
+        work_dir: a scratch directory for data files
+    """
+    def __init__(self, scale: float, work_dir: Path):
+        self.scale = scale
+        self.work_dir = work_dir
+
+    def rows(self, base: int) -> int:
+        return max(int(base * self.scale), 1)
+
+
+def write_data_file(path: Path, rows: int, delimiter: str = '|~|', columns: int = 4) -> Path:
+    with path.open('w') as data:
+        for row in range(rows):
+            data.write(delimiter.join([str(row)] + [f'value_{row}_{column}' for column in range(1, columns)]) + '\n')
+    return path
+
+
+def fake_environment(**settings) -> Dict[str, str]:
+    """This sets the fake bcp's environmental variables for the duration of a benchmark, see fake_bcp.py."""
+    previous = {}
+    for name, value in settings.items():
+        key = f'FAKE_BCP_{name.upper()}'
+        previous[key] = os.environ.get(key)
+        os.environ[key] = str(value)
+    return previous
+
+
+def restore_environment(previous: Dict[str, str]):
+    for key, value in previous.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+
+
+def best_of(function: Callable, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+IMPORT_PROBE = """
+import json, sys, time
+preloaded = set(sys.modules)
+started = time.perf_counter()
+import bcp
+imported = time.perf_counter()
+loaded = sorted(set(sys.modules) - preloaded)
+from bcp import dialects
+for index in range({dialects}):
+    dialects.register(f'benchmark_dialect_{{index}}', f'benchmark_dialects.dialect_{{index}}')
+str(bcp.Connection(driver='mssql', host='fake'))
+print(json.dumps({{'import': imported - started, 'first_connection': time.perf_counter() - imported,
+                  'modules': len(sys.modules), 'asyncio': 'asyncio' in sys.modules, 'loaded': loaded}}))
+"""
+# the modules of the library that `import bcp` may load, the rest are imported when they are first used
+IMPORTED_MODULES = frozenset(['bcp', 'bcp.config', 'bcp.connections', 'bcp.core', 'bcp.dialects', 'bcp.exceptions',
+                              'bcp.files', 'bcp.results'])
+# the standard library modules that only some transfers need, which `import bcp` must not load
+DEFERRED_MODULES = frozenset(['asyncio', 'concurrent.futures', 'hashlib', 'json', 'logging', 'mmap', 'shutil',
+                              'tempfile', 'uuid'])
+
+
+@benchmark('import_time')
+def import_time(settings: Settings) -> dict:
+    """
+    This measures `import bcp` in a fresh interpreter, with 0 and 100 extra dialects registered, and checks that the
+    import creates no directories. Registered dialects are not imported, so the cost should not grow with their number.
+    It fails if the import loads any module of the library outside IMPORTED_MODULES, or any of the DEFERRED_MODULES.
+    """
+    root = settings.work_dir / 'import_root'
+    environment = dict(os.environ, BCP_ROOT_DIR=str(root), PYTHONPATH=str(PROJECT_ROOT))
+    results = {}
+    for dialects in (0, 100):
+        probes = []
+        for _ in range(max(settings.rows(10), 3)):
+            output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(dialects=dialects)], env=environment,
+                                    check=True, stdout=subprocess.PIPE).stdout
+            probes.append(json.loads(output))
+        loaded = set(probes[0]['loaded'])
+        unexpected = sorted(module for module in loaded if module.split('.')[0] == 'bcp' and
+                            module not in IMPORTED_MODULES) + sorted(loaded & DEFERRED_MODULES)
+        if unexpected:
+            raise AssertionError(f'import bcp loaded {", ".join(unexpected)}, which should be imported on first use')
+        results[f'{dialects}_dialects'] = {
+            'import_seconds': min(probe['import'] for probe in probes),
+            'first_connection_seconds': min(probe['first_connection'] for probe in probes),
+            'modules_loaded': probes[0]['modules'],
+            'imports_asyncio': probes[0]['asyncio'],
+        }
+    results['creates_directories'] = root.exists()
+    return results
+
+
+@benchmark('wrapper_overhead')
+def wrapper_overhead(settings: Settings) -> dict:
+    """This compares BCP.load on a tiny file with running the (fake) bcp directly with the same arguments."""
+    import bcp
+    from bcp.dialects import mssql
+    data_file = bcp.DataFile(file_path=write_data_file(settings.work_dir / 'tiny.dat', 10), delimiter='|~|')
+    connection = bcp.Connection(driver='mssql', host='fake')
+    my_bcp = bcp.BCP(connection)
+    calls = settings.rows(20)
+    direct_load = mssql.MSSQLLoad(connection, data_file, 'table')
+    arguments = direct_load.arguments
+    direct_load.artifacts.create()
+    direct = best_of(lambda: [subprocess.run(arguments, check=True) for _ in range(calls)]) / calls
+    wrapped = best_of(lambda: [my_bcp.load(data_file, 'table') for _ in range(calls)]) / calls
+    return {'direct_seconds_per_call': direct, 'wrapped_seconds_per_call': wrapped,
+            'overhead_seconds_per_call': wrapped - direct}
+
+
+@benchmark('command_construction')
+def command_construction(settings: Settings) -> dict:
+    """This measures building the argument vector for a load and a dump."""
+    import bcp
+    from bcp.dialects import mssql
+    connection = bcp.Connection(driver='mssql', host='fake', username='user', password='password')
+    data_file = bcp.DataFile(file_path=settings.work_dir / 'input.dat', delimiter='|~|')
+    number = settings.rows(20000)
+    load = timeit.timeit(lambda: mssql.MSSQLLoad(connection, data_file, 'db.dbo.table').arguments, number=number)
+    dump = timeit.timeit(lambda: mssql.MSSQLDump(connection, 'select * from t', data_file).arguments, number=number)
+    return {'load_microseconds': load / number * 1e6, 'dump_microseconds': dump / number * 1e6}
+
+
+@benchmark('parallel_load_scaling')
+def parallel_load_scaling(settings: Settings) -> dict:
+    """This loads the same file with increasing parallelism into a bcp that consumes a fixed number of rows/sec."""
+    import bcp
+    rows = settings.rows(200000)
+    data_file = bcp.DataFile(file_path=write_data_file(settings.work_dir / 'load.dat', rows), delimiter='|~|')
+    my_bcp = bcp.BCP(bcp.Connection(driver='mssql', host='fake'))
+    previous = fake_environment(rows_per_sec=200000)
+    try:
+        results = {}
+        for parallelism in (1, 2, 4, 8):
+            seconds = best_of(lambda: my_bcp.load(data_file, 'table', parallelism=parallelism), repeat=1)
+            results[str(parallelism)] = {'seconds': seconds, 'rows_per_second': rows / seconds}
+        return results
+    finally:
+        restore_environment(previous)
+
+
+@benchmark('parallel_dump_scaling')
+def parallel_dump_scaling(settings: Settings) -> dict:
+    """This dumps with an increasing number of partitions from a bcp that produces a fixed number of rows/sec."""
+    import bcp
+    rows = settings.rows(200000)
+    my_bcp = bcp.BCP(bcp.Connection(driver='mssql', host='fake'))
+    output_file = bcp.DataFile(file_path=settings.work_dir / 'dump.dat', delimiter='|~|')
+    results = {}
+    for partitions in (1, 2, 4, 8):
+        # every partition of the fake produces its share of the rows, at the same per-process rate
+        previous = fake_environment(rows=rows // partitions, rows_per_sec=200000)
+        try:
+            if partitions == 1:
+                seconds = best_of(lambda: my_bcp.dump('select * from t', output_file), repeat=1)
+            else:
+                boundaries = list(range(1, partitions))
+                seconds = best_of(lambda: my_bcp.dump('select * from t', output_file, partition_column='id',
+                                                      boundaries=boundaries), repeat=1)
+        finally:
+            restore_environment(previous)
+        results[str(partitions)] = {'seconds': seconds, 'rows_per_second': rows / seconds}
+    return results
+
+
+@benchmark('dump_cache')
+def dump_cache(settings: Settings) -> dict:
+    """
+    This compares a dump that runs bcp, from a bcp that logs in for 200ms and produces a fixed number of rows/sec, with
+    the same dump answered from a ResultCache.
+    """
+    import bcp
+    rows = settings.rows(200000)
+    my_bcp = bcp.BCP(bcp.Connection(driver='mssql', host='fake'))
+    output_file = bcp.DataFile(file_path=settings.work_dir / 'cached.dat', delimiter='|~|')
+    cache = bcp.ResultCache(ttl=3600, directory=settings.work_dir / 'cache')
+    previous = fake_environment(rows=rows, rows_per_sec=500000, startup_ms=200)
+    try:
+        uncached = best_of(lambda: my_bcp.dump('select * from t', output_file), repeat=1)
+        my_bcp.dump('select * from t', output_file, cache=cache)
+        cached = best_of(lambda: my_bcp.dump('select  *  from t', output_file, cache=cache))
+    finally:
+        restore_environment(previous)
+    return {'bytes': output_file.path.stat().st_size, 'uncached_seconds': uncached, 'cached_seconds': cached,
+            'speedup': uncached / cached}
+
+
+@benchmark('copy')
+def copy(settings: Settings) -> dict:
+    """
+    This compares copying between two connections through a file, dump() then load(), with copy() streaming through a
+    named pipe, unpartitioned and in 4 ranges, against a bcp that moves a fixed number of rows/sec in each direction.
+    """
+    import bcp
+    if not hasattr(os, 'mkfifo'):
+        return {'skipped': 'named pipes require a POSIX platform'}
+    rows = settings.rows(200000)
+    my_bcp = bcp.BCP(bcp.Connection(driver='mssql', host='fake'))
+    target = bcp.Connection(driver='mssql', host='fake_target')
+    staging_file = bcp.DataFile(file_path=settings.work_dir / 'copy.dat')
+
+    def through_file():
+        my_bcp.dump('select * from t', staging_file, data_format='character')
+        bcp.BCP(target).load(staging_file, 'table')
+
+    results = {}
+    for name, partitions, function in [
+            ('dump_then_load', 1, through_file),
+            ('copy', 1, lambda: my_bcp.copy('select * from t', target, 'table', data_format='character')),
+            ('copy_4_ranges', 4, lambda: my_bcp.copy('select * from t', target, 'table', partition_column='id',
+                                                     boundaries=[1, 2, 3], data_format='character'))]:
+        previous = fake_environment(rows=rows // partitions, rows_per_sec=200000)
+        try:
+            seconds = best_of(function, repeat=1)
+        finally:
+            restore_environment(previous)
+        results[name] = {'seconds': seconds, 'rows_per_second': rows / seconds}
+    return results
+
+
+@benchmark('split_throughput')
+def split_throughput(settings: Settings) -> dict:
+    """This measures DataFile.split() on a file of a few hundred MB at scale 1."""
+    import bcp
+    path = write_data_file(settings.work_dir / 'split.dat', settings.rows(4000000))
+    data_file = bcp.DataFile(file_path=path, delimiter='|~|')
+    size = path.stat().st_size
+
+    def split():
+        data_file.remove_parts(data_file.split(8))
+
+    seconds = best_of(split)
+    return {'bytes': size, 'seconds': seconds, 'megabytes_per_second': size / seconds / 1e6}
+
+
+@benchmark('scan_throughput')
+def scan_throughput(settings: Settings) -> dict:
+    """This measures DataFile.scan() in a single process and with a process pool, on the same file as split."""
+    import bcp
+    path = write_data_file(settings.work_dir / 'scan.dat', settings.rows(4000000))
+    data_file = bcp.DataFile(file_path=path, delimiter='|~|')
+    size = path.stat().st_size
+    results = {'bytes': size}
+    for workers in sorted({1, os.cpu_count() or 1}):
+        seconds = best_of(lambda: data_file.scan(workers=workers), repeat=2)
+        results[f'{workers}_workers'] = {'seconds': seconds, 'megabytes_per_second': size / seconds / 1e6}
+    return results
+
+
+def write_csv_file(path: Path, rows: int) -> Path:
+    """This writes a CSV file in which a third of the rows have quoted fields holding commas, quotes and line breaks."""
+    import csv
+    with path.open('w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        for row in range(rows):
+            note = f'note {row}, with "quotes"\nand a line break' if row % 3 == 0 else f'note_{row}'
+            writer.writerow([row, f'value_{row}', note, row * 1.5])
+    return path
+
+
+@benchmark('csv_normalize')
+def csv_normalize(settings: Settings) -> dict:
+    """
+    This measures the rewriting of quoted CSV into bcp's character format, in a single process and with a process pool,
+    and BCP.load_csv() streaming the rewritten data into an unthrottled bcp.
+    """
+    import bcp
+    from bcp.normalize import normalize
+    path = write_csv_file(settings.work_dir / 'normalize.csv', settings.rows(2000000))
+    data_file = bcp.DataFile(file_path=path, delimiter=',')
+    size = path.stat().st_size
+    results = {'bytes': size}
+    for workers in sorted({1, os.cpu_count() or 1}):
+        with open(os.devnull, 'wb') as target:
+            seconds = best_of(lambda: normalize(data_file, target, workers=workers), repeat=2)
+        results[f'{workers}_workers'] = {'seconds': seconds, 'megabytes_per_second': size / seconds / 1e6}
+    if hasattr(os, 'mkfifo'):
+        my_bcp = bcp.BCP(bcp.Connection(driver='mssql', host='fake'))
+        seconds = best_of(lambda: my_bcp.load_csv(data_file, 'table'), repeat=2)
+        results['load_csv'] = {'seconds': seconds, 'megabytes_per_second': size / seconds / 1e6}
+    return results
+
+
+@benchmark('external_sort')
+def external_sort(settings: Settings) -> dict:
+    """This measures DataFile.sort() on an integer key, in a single process and with a process pool."""
+    import bcp
+    rows = settings.rows(1000000)
+    path = settings.work_dir / 'unsorted.dat'
+    with path.open('w') as data:
+        for row in range(rows):
+            data.write(f'{(row * 7919) % rows}|~|value_{row}_1|~|value_{row}_2|~|value_{row}_3\n')
+    data_file = bcp.DataFile(file_path=path, delimiter='|~|')
+    size = path.stat().st_size
+    results = {'bytes': size}
+    for workers in sorted({1, os.cpu_count() or 1}):
+        seconds = best_of(lambda: data_file.sort(keys=[0], key_types=[int], workers=workers, run_size=size // 8 + 1),
+                          repeat=2)
+        results[f'{workers}_workers'] = {'seconds': seconds, 'megabytes_per_second': size / seconds / 1e6}
+    return results
+
+
+@benchmark('row_reader')
+def row_reader(settings: Settings) -> dict:
+    """
+    This compares reading a dumped file with readlines() and split() against DataFile.rows(), decoded and raw, for all
+    columns and for one, with the peak memory traced by python for each. Raw rows are expected to trace the least
+    memory, not to be the fastest.
+    """
+    import tracemalloc
+    import bcp
+    path = write_data_file(settings.work_dir / 'rows.dat', settings.rows(200000))
+    data_file = bcp.DataFile(file_path=path, delimiter='|~|')
+
+    def readlines():
+        with path.open() as data:
+            return sum(1 for line in data.readlines() for _ in [line.rstrip('\n').split('|~|')])
+
+    readers = {
+        'readlines': readlines,
+        'rows': lambda: sum(1 for _ in data_file.rows()),
+        'rows_one_column': lambda: sum(1 for _ in data_file.rows(columns=[0])),
+        'raw_rows': lambda: sum(1 for _ in data_file.rows(raw=True)),
+        'raw_rows_one_column': lambda: sum(1 for _ in data_file.rows(columns=[0], raw=True)),
+    }
+    results = {'bytes': path.stat().st_size}
+    for name, read in readers.items():
+        seconds = best_of(read, repeat=2)
+        tracemalloc.start()
+        try:
+            read()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        results[name] = {'seconds': seconds, 'peak_megabytes': peak / 1e6}
+    return results
+
+
+@benchmark('columns')
+def columns(settings: Settings) -> dict:
+    """
+    This compares decoding a dumped file of integers, floats and strings into lists of python values, parsed row by
+    row, against DataFile.to_columns() in this process and on a process pool, with the peak memory traced by python
+    for each, which includes the decoded result.
+    """
+    import tracemalloc
+    import bcp
+    rows = settings.rows(200000)
+    path = settings.work_dir / 'columns.dat'
+    with path.open('w') as data:
+        for row in range(rows):
+            data.write(f'{row}\t{"" if row % 10 == 0 else row * 1.25}\tname_{row % 1000}\t{row * 31 % 997}\n')
+    data_file = bcp.DataFile(file_path=path)
+    schema = [('id', int), ('amount', float), ('name', str), ('quantity', int)]
+
+    def naive():
+        decoded = [[], [], [], []]
+        with path.open() as data:
+            for line in data:
+                id_, amount, name, quantity = line.rstrip('\n').split('\t')
+                decoded[0].append(int(id_))
+                decoded[1].append(float(amount) if amount else None)
+                decoded[2].append(name or None)
+                decoded[3].append(int(quantity))
+        return decoded
+
+    decoders = {
+        'naive': naive,
+        'columns': lambda: data_file.to_columns(schema, workers=1),
+        'columns_parallel': lambda: data_file.to_columns(schema),
+    }
+    results = {'bytes': path.stat().st_size, 'cpus': os.cpu_count()}
+    for name, decode in decoders.items():
+        seconds = best_of(decode, repeat=2)
+        tracemalloc.start()
+        try:
+            decode()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        results[name] = {'seconds': seconds, 'peak_megabytes': peak / 1e6}
+    return results
+
+
+@benchmark('streaming')
+def streaming(settings: Settings) -> dict:
+    """This measures BCP.load_rows() and BCP.dump_iter() against an unthrottled bcp."""
+    import bcp
+    if not hasattr(os, 'mkfifo'):
+        return {'skipped': 'named pipes require a POSIX platform'}
+    rows = settings.rows(200000)
+    my_bcp = bcp.BCP(bcp.Connection(driver='mssql', host='fake'))
+    load_seconds = best_of(lambda: my_bcp.load_rows(((row, f'name_{row}', row * 1.5) for row in range(rows)),
+                                                    'table'))
+    previous = fake_environment(rows=rows)
+    try:
+        dump_seconds = best_of(lambda: sum(1 for _ in my_bcp.dump_iter('select * from t')))
+        batch_seconds = best_of(lambda: sum(len(batch) for batch in my_bcp.dump_iter('select * from t',
+                                                                                    batch_rows=10000)))
+    finally:
+        restore_environment(previous)
+    return {'load_rows_per_second': rows / load_seconds, 'dump_iter_rows_per_second': rows / dump_seconds,
+            'dump_iter_batch_rows_per_second': rows / batch_seconds}
+
+
+def compare(results: dict, baseline: dict, prefix: str = '') -> list:
+    """This pairs every numeric measurement with the same measurement in a previous run."""
+    lines = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        if isinstance(value, dict) and isinstance(baseline[name], dict):
+            lines.extend(compare(value, baseline[name], f'{prefix}{name}.'))
+        elif isinstance(value, (int, float)) and isinstance(baseline[name], (int, float)) and baseline[name]:
+            lines.append(f'{prefix}{name}: {baseline[name]:.6g} -> {value:.6g} ({value / baseline[name]:.2f}x)')
+    return lines
+
+
+def main(arguments: list = None) -> dict:
+    parser = argparse.ArgumentParser(description='Benchmarks for the bcp library, run against a fake bcp.')
+    parser.add_argument('--output', type=Path, help='the JSON file to write the results to')
+    parser.add_argument('--compare', type=Path, help='a JSON file from a previous run to compare against')
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    parser.add_argument('--scale', type=float, default=1.0, help='a multiplier for the amount of data moved')
+    options = parser.parse_args(arguments)
+
+    with tempfile.TemporaryDirectory(prefix='bcp_benchmarks_') as work_dir:
+        work_dir = Path(work_dir)
+        os.environ['BCP_ROOT_DIR'] = str(work_dir / 'bcp')
+        sys.path.insert(0, str(PROJECT_ROOT))
+        from benchmarks import fake_bcp
+        (work_dir / 'bin').mkdir()
+        os.environ['PATH'] = os.pathsep.join([str(fake_bcp.install(work_dir / 'bin')), os.environ.get('PATH', '')])
+        settings = Settings(options.scale, work_dir)
+        results = {}
+        for name in options.only or BENCHMARKS:
+            started = time.perf_counter()
+            results[name] = BENCHMARKS[name](settings)
+            print(f'{name}: {time.perf_counter() - started:.2f}s {json.dumps(results[name])}')
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scale': options.scale,
+        'results': results,
+    }
+    if options.output:
+        options.output.write_text(json.dumps(report, indent=2))
+    if options.compare:
+        for line in compare(results, json.loads(options.compare.read_text())['results']):
+            print(line)
+    return report
+
+
+if __name__ == '__main__':
+    main()
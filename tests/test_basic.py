@@ -1,5 +1,8 @@
+import itertools
 import pathlib
 import os
+import sys
+import time
 
 import pytest
 
@@ -57,12 +60,46 @@ class TestFiles:
         assert expected_data_file_path.absolute() == data_file.path
         assert '\t' == data_file.delimiter
 
+    @pytest.mark.freeze_time('2017-08-01 01:00:00')
+    def test_scratch_files_created_at_the_same_time_do_not_collide(self):
+        first, second = files.DataFile.scratch(), files.DataFile.scratch(delimiter=',')
+        try:
+            assert first.path != second.path
+            assert (self.user_profile / pathlib.Path('bcp/data')).absolute() == first.path.parent
+            assert b'' == first.path.read_bytes() == second.path.read_bytes()
+            assert ',' == second.delimiter
+        finally:
+            first.path.unlink()
+            second.path.unlink()
+
 
 def test_connection_creation_with_unsupported_driver_raises_exception():
     with pytest.raises(exceptions.DriverNotSupportedException):
         assert Connection(host=HOST, driver='unsupported')
 
 
+def test_connection_uses_a_registered_dialect(monkeypatch):
+    from bcp import dialects
+    from bcp.dialects import mssql
+    monkeypatch.setitem(dialects._registry, 'mssql_alias', 'bcp.dialects.mssql')
+    conn = Connection(host=HOST, driver='mssql_alias', port=PORT)
+    assert 'mssql_alias' in dialects.drivers()
+    assert mssql is BCP(conn).dialect
+    assert f'-S {HOST},{PORT} -T' == str(conn)
+
+
+def test_import_is_lazy_and_creates_no_directories(tmp_path):
+    import subprocess
+    import sys
+    root = tmp_path / 'bcp'
+    deferred = ('asyncio', 'bcp.dialects.mssql', 'bcp.jobs', 'bcp.pipes', 'bcp.scan', 'json', 'mmap')
+    probe = f'import sys, bcp; print(sorted(m for m in {deferred} if m in sys.modules))'
+    environment = dict(os.environ, BCP_ROOT_DIR=str(root), PYTHONPATH=str(pathlib.Path(__file__).parents[1]))
+    output = subprocess.run([sys.executable, '-c', probe], env=environment, stdout=subprocess.PIPE, check=True).stdout
+    assert b'[]' == output.strip()
+    assert not root.exists()
+
+
 def test_auth_has_correct_repr():
     auth = connections.Auth(username='user', password='pass')
     assert f'Auth(username={USERNAME}, password={len(PASSWORD)})' == repr(auth)
@@ -79,3 +116,1011 @@ def test_bcp_has_correct_repr():
     my_bcp = BCP(conn)
     assert f'BCP(connection=Connection(driver={DRIVER}, host={HOST}, port={PORT}, auth=Auth(username={USERNAME},' \
            f' password={len(PASSWORD)})))' == repr(my_bcp)
+
+
+class TestDataFileSplit:
+
+    @staticmethod
+    def _write_records(path: pathlib.Path, count: int) -> bytes:
+        content = ''.join(f'dbo|~|table_{i}\n' for i in range(count)).encode()
+        path.write_bytes(content)
+        return content
+
+    def test_split_produces_record_aligned_parts(self, tmp_path):
+        content = self._write_records(tmp_path / 'input.dat', 1000)
+        data_file = files.DataFile(file_path=tmp_path / 'input.dat', delimiter='|~|')
+        parts = data_file.split(4)
+        try:
+            assert 4 == len(parts)
+            assert all('|~|' == part.delimiter for part in parts)
+            part_contents = [part.path.read_bytes() for part in parts]
+            assert all(part_content.endswith(b'\n') for part_content in part_contents)
+            assert content == b''.join(part_contents)
+        finally:
+            data_file.remove_parts(parts)
+
+    def test_split_returns_fewer_parts_for_small_files(self, tmp_path):
+        content = self._write_records(tmp_path / 'input.dat', 2)
+        data_file = files.DataFile(file_path=tmp_path / 'input.dat', delimiter='|~|')
+        parts = data_file.split(8)
+        try:
+            assert 2 == len(parts)
+            assert content == b''.join(part.path.read_bytes() for part in parts)
+        finally:
+            data_file.remove_parts(parts)
+
+    def test_splits_of_files_with_the_same_name_do_not_collide(self, tmp_path):
+        data_files = []
+        for directory in ('first', 'second'):
+            (tmp_path / directory).mkdir()
+            self._write_records(tmp_path / directory / 'input.dat', 10)
+            data_files.append(files.DataFile(file_path=tmp_path / directory / 'input.dat', delimiter='|~|'))
+        first_parts, second_parts = (data_file.split(2) for data_file in data_files)
+        assert first_parts[0].path.name == second_parts[0].path.name
+        assert first_parts[0].path.parent != second_parts[0].path.parent
+        data_files[0].remove_parts(first_parts)
+        assert not first_parts[0].path.parent.exists()
+        assert all(part.path.is_file() for part in second_parts)
+        data_files[1].remove_parts(second_parts)
+        assert data_files[1].path.is_file()
+
+    def test_parts_know_the_number_of_their_first_record(self, tmp_path):
+        path = tmp_path / 'input.dat'
+        path.write_bytes(''.join(f'{i}|~|table_{i}\r\n' for i in range(1, 101)).encode())
+        data_file = files.DataFile(file_path=path, delimiter='|~|', row_terminator='\r\n')
+        parts = data_file.split(3)
+        try:
+            first_records = [part.first_record for part in parts]
+            assert [int(part.path.read_bytes().split(b'|~|')[0]) for part in parts] == first_records
+            assert 1 == data_file.first_record
+            with path.open('rb') as source:
+                # terminators straddling the chunks are counted once
+                assert 100 == files._count_records(source, path.stat().st_size, b'\r\n', chunk_size=3)
+        finally:
+            data_file.remove_parts(parts)
+
+    def test_split_into_one_part_returns_the_file(self):
+        data_file = files.DataFile(file_path=STATIC_FILES / pathlib.Path('input.dat'), delimiter='|~|')
+        assert [data_file] == data_file.split(1)
+
+    def test_merge_concatenates_parts_in_order(self, tmp_path):
+        content = self._write_records(tmp_path / 'input.dat', 100)
+        data_file = files.DataFile(file_path=tmp_path / 'input.dat', delimiter='|~|')
+        parts = data_file.split(3)
+        try:
+            merged = files.DataFile(file_path=tmp_path / 'merged.dat', delimiter='|~|')
+            merged.merge(parts)
+            assert content == merged.path.read_bytes()
+        finally:
+            data_file.remove_parts(parts)
+
+    @pytest.mark.parametrize('kernel_copy', [True, False])
+    def test_a_copy_that_runs_out_of_source_raises(self, tmp_path, monkeypatch, kernel_copy):
+        if not kernel_copy:
+            monkeypatch.delattr(files.os, 'copy_file_range', raising=False)
+            monkeypatch.delattr(files.os, 'sendfile', raising=False)
+        (tmp_path / 'source.dat').write_bytes(b'0123456789')
+        with (tmp_path / 'source.dat').open('rb') as source, (tmp_path / 'target.dat').open('wb') as target:
+            with pytest.raises(OSError, match='ended at byte 10 with 5 bytes still to be copied'):
+                files._copy_range(source.fileno(), target.fileno(), 5, 10)
+
+    def test_compressed_parts_merge_into_a_single_stream(self, tmp_path):
+        data_file = files.DataFile(file_path=tmp_path / 'output.dat.gz', delimiter='|~|')
+        parts = [data_file.part(index) for index in range(2)]
+        for index, part in enumerate(parts):
+            with part.open('wb') as target:
+                target.write(f'{index}|~|part\n'.encode())
+        data_file.merge(parts)
+        assert tmp_path / 'output.dat.part0000.gz' == parts[0].path
+        with data_file.open() as source:
+            assert b'0|~|part\n1|~|part\n' == source.read()
+        with pytest.raises(ValueError):
+            data_file.split(2)
+
+    def test_part_is_created_alongside_the_file(self, tmp_path):
+        data_file = files.DataFile(file_path=tmp_path / 'output.csv', delimiter=',')
+        part = data_file.part(3)
+        assert tmp_path / 'output.part0003.csv' == part.path
+        assert ',' == part.delimiter
+
+    def test_paths_given_as_strings_are_converted(self, tmp_path):
+        self._write_records(tmp_path / 'input.dat.gz', 1)
+        data_file = files.DataFile(file_path=str(tmp_path / 'input.dat.gz'), delimiter='|~|')
+        assert tmp_path / 'input.dat.gz' == data_file.path
+        assert '.gz' == data_file.compression
+        assert tmp_path / 'output.log' == files.LogFile(file_path=str(tmp_path / 'output.log')).path
+
+
+class TestDataFileScan:
+
+    @staticmethod
+    def make_file(tmp_path, lines):
+        path = tmp_path / 'data.dat'
+        path.write_bytes(b''.join(line + b'\n' for line in lines))
+        return files.DataFile(file_path=path, delimiter='|~|')
+
+    def test_scan_counts_records_widths_and_malformed_rows(self, tmp_path):
+        from bcp.scan import scan
+        lines = [f'{i}|~|name_{i}|~|{"x" * (i % 7)}'.encode() for i in range(1, 1001)]
+        lines[499] = b'500|~|missing a field'
+        data_file = self.make_file(tmp_path, lines)
+        result = scan(data_file, chunk_size=1000, stride=16, workers=2)
+        assert 1000 == result.records
+        assert 3 == result.fields
+        assert [(500, 2)] == result.samples
+        assert not result.valid
+        assert [4, 9, 6] == result.max_widths
+        assert (tmp_path / 'data.dat.idx').exists()
+
+    @pytest.mark.parametrize('delimiter', [',', '|~|', '<>'])
+    def test_scan_measures_widths_of_well_formed_files(self, tmp_path, delimiter):
+        from bcp.scan import scan
+        path = tmp_path / 'data.dat'
+        lines = [f'{i}{delimiter}{"z" * (i % 5)}<{delimiter}>end{"|~"[:i % 3]}\n' for i in range(1, 301)]
+        path.write_text(''.join(lines))
+        result = scan(files.DataFile(file_path=path, delimiter=delimiter), chunk_size=500, workers=1)
+        assert (300, 3, 0) == (result.records, result.fields, result.malformed)
+        assert [3, 5, 6] == result.max_widths
+
+    def test_index_locates_records_and_is_reused_by_split(self, tmp_path):
+        from bcp.scan import scan
+        lines = [f'{i}|~|{"y" * (i % 13)}'.encode() for i in range(1, 2001)]
+        data_file = self.make_file(tmp_path, lines)
+        scan(data_file, chunk_size=4096, stride=100)
+        index = data_file.index
+        assert 2000 == index.records
+        contents = data_file.path.read_bytes()
+        for record in (1, 100, 101, 1234, 2000):
+            assert contents[index.offset(data_file, record):].startswith(lines[record - 1] + b'\n')
+        assert [(1, 666), (667, 1333), (1334, 2000)] == index.ranges(3)
+        parts = data_file.split(4)
+        assert contents == b''.join(part.path.read_bytes() for part in parts)
+        split_points = itertools.accumulate(part.path.stat().st_size for part in parts[:-1])
+        assert all(contents[point - 1:point] == b'\n' for point in split_points)
+        data_file.remove_parts(parts)
+        data_file.path.write_bytes(contents + b'2001|~|\n')
+        assert data_file.index is None
+
+    def test_split_of_an_indexed_file_divides_it_evenly(self, tmp_path):
+        from bcp.scan import scan
+        lines = [f'{i}|~|{"y" * (i % 13)}'.encode() for i in range(1, 100001)]
+        data_file = self.make_file(tmp_path, lines)
+        scan(data_file)
+        assert data_file.index is not None
+        parts = data_file.split(8)
+        size = data_file.path.stat().st_size
+        sizes = [part.path.stat().st_size for part in parts]
+        data_file.remove_parts(parts)
+        assert 8 == len(parts)
+        assert size == sum(sizes)
+        assert all(abs(part_size - size / 8) < 2 * max(len(line) + 1 for line in lines) for part_size in sizes)
+
+
+def test_equal_width_boundaries_for_integer_column(tmp_path):
+    from bcp.core import equal_width_boundaries
+    bounds_file = files.DataFile(file_path=tmp_path / 'bounds.tsv')
+    bounds_file.path.write_text('1\t100\n')
+    assert [34, 67] == equal_width_boundaries(bounds_file, 'id', 3)
+
+
+def test_equal_width_boundaries_for_empty_results(tmp_path):
+    from bcp.core import equal_width_boundaries
+    bounds_file = files.DataFile(file_path=tmp_path / 'bounds.tsv')
+    bounds_file.path.write_text('\t\n')
+    assert [] == equal_width_boundaries(bounds_file, 'id', 3)
+
+
+@pytest.mark.freeze_time('2019-05-01 01:00:00')
+def test_partition_boundaries_are_queried_into_files_of_their_own(monkeypatch):
+    from bcp import TransferResult
+    from bcp.dialects import mssql
+    bounds_files = []
+
+    def execute(dump):
+        bounds_files.append(dump.file.path)
+        dump.file.path.write_text('1\t100\n')
+        return TransferResult(data_file=dump.file)
+
+    monkeypatch.setattr(mssql.MSSQLDump, 'execute', execute)
+    my_bcp = BCP(Connection(driver='mssql', host=HOST))
+    assert [34, 67] == my_bcp._partition_boundaries('select * from t', 'id', 3)
+    assert [34, 67] == my_bcp._partition_boundaries('select * from t', 'id', 3)
+    assert 2 == len(set(bounds_files))
+    assert not any(path.exists() for path in bounds_files)
+
+
+def test_transfer_limiter_bounds_concurrency_per_host():
+    import asyncio
+    from bcp import TransferLimiter
+    limiter = TransferLimiter(max_transfers=4, max_per_host=2)
+    conn = Connection(driver='mssql', host=HOST)
+    active = []
+    peak = []
+
+    async def transfer():
+        async with limiter.acquire(conn):
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    async def main():
+        await asyncio.gather(*[transfer() for _ in range(6)])
+
+    asyncio.run(main())
+    assert 2 == max(peak)
+
+
+class TestNamedPipe:
+
+    pytestmark = pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='named pipes require a POSIX platform')
+
+    def test_write_rows_serializes_batches_into_the_pipe(self):
+        import threading
+        from bcp.pipes import NamedPipe, write_rows
+        rows = ((i, None, True) for i in range(5))
+        received = []
+        with NamedPipe() as pipe:
+            reader = threading.Thread(target=lambda: received.append(pipe.open_reader().read()))
+            reader.start()
+            write_rows(pipe, rows, '|~|', batch_rows=2)
+            reader.join()
+        assert b''.join(f'{i}|~||~|1\n'.encode() for i in range(5)) == received[0]
+
+    def test_fields_round_trip_through_format_and_parse(self):
+        from bcp.pipes import format_field, parse_field
+        assert ['', '\0', 'a', '1', '\0'] == [format_field(value) for value in (None, '', 'a', True, b'')]
+        for value in (None, '', 'a', ' '):
+            assert value == parse_field(format_field(value))
+
+    def test_release_unblocks_a_pending_open(self):
+        import threading
+        from bcp.pipes import NamedPipe, write_rows
+        with NamedPipe() as pipe:
+            writer = threading.Thread(target=write_rows, args=(pipe, [(1, 2)], '\t'))
+            writer.start()
+            pipe.release()
+            writer.join(timeout=5)
+            assert not writer.is_alive()
+        assert not pipe.path.exists()
+
+    @pytest.mark.parametrize('suffix', ['.gz', '.bz2', '.xz'])
+    def test_compressed_files_round_trip_through_a_pipe(self, tmp_path, suffix):
+        import threading
+        from bcp.pipes import NamedPipe, compress_from, decompress_into
+        data = b''.join(f'{i}|~|value_{i}\n'.encode() for i in range(10000))
+        compressed = files.DataFile(file_path=tmp_path / f'data.dat{suffix}', delimiter='|~|')
+        with NamedPipe() as pipe:
+            writer = threading.Thread(target=lambda: pipe.open_writer().write(data))
+            writer.start()
+            compress_from(pipe, compressed)
+            writer.join()
+        assert suffix == compressed.compression
+        assert data != compressed.path.read_bytes()
+        received = []
+        with NamedPipe() as pipe:
+            reader = threading.Thread(target=lambda: received.append(pipe.open_reader().read()))
+            reader.start()
+            decompress_into(pipe, compressed)
+            reader.join()
+        assert data == received[0]
+
+
+class TestNormalize:
+
+    @staticmethod
+    def write_csv(path, rows):
+        import csv
+        with path.open('w', newline='') as csv_file:
+            csv.writer(csv_file, lineterminator='\r\n').writerows(rows)
+
+    @pytest.mark.parametrize('workers, chunk_size', [(1, 16), (2, 16), (2, 1 << 20)])
+    def test_normalize_rewrites_quoted_fields_across_chunks(self, tmp_path, workers, chunk_size):
+        import io
+        from bcp.normalize import NORMALIZED_DELIMITER, NORMALIZED_ROW_TERMINATOR, normalize
+        rows = [['id', 'name', 'note']] + [[str(i), f'name, {i}', 'line\nbreak "quoted"' if i % 3 else '']
+                                           for i in range(200)]
+        self.write_csv(tmp_path / 'data.csv', rows)
+        target = io.BytesIO()
+        data_file = files.DataFile(file_path=tmp_path / 'data.csv', delimiter=',')
+        assert 200 == normalize(data_file, target, workers=workers, header=True, chunk_size=chunk_size)
+        records = target.getvalue().decode().split(NORMALIZED_ROW_TERMINATOR)
+        assert rows[1:] == [record.split(NORMALIZED_DELIMITER) for record in records[:-1]]
+        assert '' == records[-1]
+
+    def test_normalize_rejects_data_containing_separators(self, tmp_path):
+        import io
+        from bcp.normalize import normalize
+        self.write_csv(tmp_path / 'data.csv', [['1', 'unit\x1fseparator']])
+        with pytest.raises(ValueError):
+            normalize(files.DataFile(file_path=tmp_path / 'data.csv', delimiter=','), io.BytesIO(), workers=1)
+
+    @pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='named pipes require a POSIX platform')
+    def test_load_csv_streams_the_normalized_file_into_bcp(self, monkeypatch, tmp_path):
+        from bcp.dialects import mssql
+        received = []
+
+        def execute(load):
+            received.append((load.config, load.file.path.read_bytes()))
+            return load.result(load.arguments, 0, 1.0)
+
+        monkeypatch.setattr(mssql.MSSQLLoad, 'execute', execute)
+        self.write_csv(tmp_path / 'data.csv', [['id', 'name'], ['1', 'a, "b"']])
+        data_file = files.DataFile(file_path=tmp_path / 'data.csv', delimiter=',')
+        result = BCP(Connection(driver='mssql', host=HOST)).load_csv(data_file, 't', header=True, workers=1)
+        assert [('-c -t "\x1f" -r "\x1e" -b 10000', b'1\x1fa, "b"\x1e')] == received
+        assert data_file is result.data_file
+
+
+class TestCopy:
+
+    pytestmark = pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='named pipes require a POSIX platform')
+
+    @staticmethod
+    def fake_bcp(monkeypatch, fail_load=False):
+        from bcp import TransferResult
+        from bcp.dialects import mssql
+        loaded = []
+
+        def dump(operation):
+            with operation.file.path.open('w') as pipe:
+                pipe.write(''.join(f'{row}\t{operation.query}\n' for row in range(1000)))
+            return TransferResult(rows_copied=1000)
+
+        def load(operation):
+            if fail_load:
+                raise exceptions.BCPExecutionException(1, ['bcp'], result=TransferResult(exit_code=1))
+            with operation.file.path.open() as pipe:
+                rows = pipe.read().splitlines()
+            loaded.append((operation.connection.host, operation.table, len(rows)))
+            return TransferResult(rows_copied=len(rows))
+
+        monkeypatch.setattr(mssql.MSSQLDump, 'execute', dump)
+        monkeypatch.setattr(mssql.MSSQLLoad, 'execute', load)
+        return loaded
+
+    def test_copy_streams_each_range_through_its_own_pipe(self, monkeypatch):
+        loaded = self.fake_bcp(monkeypatch)
+        my_bcp = BCP(Connection(driver='mssql', host=HOST))
+        result = my_bcp.copy('select * from t', Connection(driver='mssql', host='TARGET'), 'target_table',
+                             data_format='character')
+        assert 1000 == result.rows_copied
+        result = my_bcp.copy('select * from t', Connection(driver='mssql', host='TARGET'), 'target_table',
+                             partition_column='id', boundaries=[10, 20], data_format='character')
+        assert 3000 == result.rows_copied
+        assert 3 == len(result.parts)
+        assert [('TARGET', 'target_table', 1000)] * 4 == loaded
+
+    def test_copy_unblocks_the_export_when_the_load_fails_first(self, monkeypatch):
+        self.fake_bcp(monkeypatch, fail_load=True)
+        my_bcp = BCP(Connection(driver='mssql', host=HOST))
+        with pytest.raises(exceptions.BCPExecutionException):
+            my_bcp.copy('select * from t', Connection(driver='mssql', host='TARGET'), 't', data_format='character')
+
+
+def test_read_rows_parses_rows_across_chunk_boundaries():
+    import io
+    from bcp.pipes import read_rows
+    stream = io.BytesIO('dbo|~|table_1\ndbo|~|\n|~|\0\ndbo|~|täble_3'.encode())
+    rows = list(read_rows(stream, '|~|', chunk_size=4))
+    assert [('dbo', 'table_1'), ('dbo', None), (None, ''), ('dbo', 'täble_3')] == rows
+
+
+class TestBCPBatch:
+
+    def test_is_transient_reads_the_log_file(self, tmp_path):
+        from bcp.batch import is_transient
+        log_file = files.LogFile(file_path=tmp_path / 'bcp.log')
+        log_file.path.write_text('SQLState = 08S01, NativeError = 10054\nError = TCP Provider: Connection reset\n')
+        assert is_transient(exceptions.BCPExecutionException(1, ['bcp'], log_file))
+        log_file.path.write_text('SQLState = 42S02, NativeError = 208\nError = Invalid object name\n')
+        assert not is_transient(exceptions.BCPExecutionException(1, ['bcp'], log_file))
+        assert not is_transient(ValueError())
+
+    def test_batch_runs_by_priority_and_retries_transient_failures(self, monkeypatch):
+        from bcp import batch
+        started = []
+
+        def execute(job):
+            started.append(job.arguments['table'])
+            if job.arguments['table'] == 'flaky' and job.attempts == 1:
+                raise exceptions.ParallelTransferException({0: RuntimeError()})
+            return job.arguments['table']
+
+        monkeypatch.setattr(batch.Job, 'execute', execute)
+        monkeypatch.setattr(batch, 'is_transient', lambda error: True)
+        conn = Connection(driver='mssql', host=HOST)
+        bcp_batch = batch.BCPBatch(max_workers=1, retries=1, backoff=0.01)
+        for table, priority in [('low', 0), ('flaky', 5), ('high', 10)]:
+            bcp_batch.add_load(conn, input_file=files.DataFile(), table=table, priority=priority)
+        results = bcp_batch.run()
+        assert ['high', 'flaky', 'low', 'flaky'] == started
+        assert [True, True, True] == [result.succeeded for result in results]
+        assert [1, 2, 1] == [result.attempts for result in results]
+        assert ['low', 'flaky', 'high'] == [result.value for result in results]
+
+    def test_batch_stops_on_an_exception_that_is_not_an_error(self, monkeypatch):
+        from bcp import batch
+        started = []
+
+        def execute(job):
+            started.append(job.arguments['table'])
+            if job.arguments['table'] == 'exits':
+                raise SystemExit(1)
+            return job.arguments['table']
+
+        monkeypatch.setattr(batch.Job, 'execute', execute)
+        conn = Connection(driver='mssql', host=HOST)
+        bcp_batch = batch.BCPBatch(max_workers=1)
+        for table, priority in [('low', 0), ('exits', 5), ('high', 10)]:
+            bcp_batch.add_load(conn, input_file=files.DataFile(), table=table, priority=priority)
+        with pytest.raises(SystemExit):
+            bcp_batch.run()
+        assert ['high', 'exits'] == started
+        bcp_batch.add_load(conn, input_file=files.DataFile(), table='next')
+        assert ['next'] == [result.value for result in bcp_batch.run()]
+
+
+def test_resumable_load_restarts_after_the_last_committed_batch(monkeypatch, tmp_path):
+    from bcp import checkpoints
+    from bcp.dialects import mssql
+    monkeypatch.setattr(checkpoints, 'BCP_CHECKPOINT_DIR', tmp_path / 'checkpoints')
+    data_file = files.DataFile(file_path=tmp_path / 'data.csv')
+    data_file.path.write_text('1,a\n' * 25)
+    first_rows = []
+
+    def execute(load):
+        first_rows.append(load.first_row)
+        load.artifacts.create()
+        if len(first_rows) == 1:
+            load.log_file.path.write_text('10000 rows sent to SQL Server. Total sent: 10000\n'
+                                          '10000 rows sent to SQL Server. Total sent: 20000\n'
+                                          '1000 rows sent to SQL Server. Total sent: 21000\n')
+            raise exceptions.BCPExecutionException(1, load.arguments, load.log_file)
+        return load.result(load.arguments, 0, 0.0)
+
+    monkeypatch.setattr(mssql.MSSQLLoad, 'execute', execute)
+    conn = Connection(driver='mssql', host=HOST)
+    with pytest.raises(exceptions.BCPExecutionException):
+        BCP(conn).load(input_file=data_file, table='t', resume=True)
+    checkpoint = checkpoints.LoadCheckpoint(conn, data_file, 't')
+    assert 20001 == checkpoint.read()['first_row']
+    BCP(conn).load(input_file=data_file, table='t', resume=True)
+    assert [None, 20001] == first_rows
+    assert checkpoint.read() is None
+    with pytest.raises(ValueError):
+        BCP(conn).load(input_file=data_file, table='t', parallelism=2, resume=True)
+    with pytest.raises(ValueError):
+        BCP(conn).load(input_file=data_file, table='t', resume=True, hints=mssql.LoadHints(kilobytes_per_batch=64))
+    assert [None, 20001] == first_rows
+
+
+def test_tuned_load_calibrates_once_and_remembers_the_fastest_settings(monkeypatch, tmp_path):
+    from bcp import TransferResult, tuning
+    from bcp.dialects import mssql
+    monkeypatch.setattr(tuning, 'BCP_TUNING_DIR', tmp_path / 'tuning')
+    throughput = {(5000, 4096): 100.0, (20000, 4096): 300.0, (100000, 4096): 200.0, (20000, 16384): 400.0,
+                  (20000, 32768): 350.0}
+    loads = []
+
+    def execute(load):
+        loads.append((load.first_row, load.last_row, load.batch_size, load.packet_size))
+        rows = 50000 if load.last_row else 1000
+        return TransferResult(rows_copied=rows, rows_per_second=throughput.get((load.batch_size, load.packet_size)))
+
+    monkeypatch.setattr(mssql.MSSQLLoad, 'execute', execute)
+    conn = Connection(driver='mssql', host=HOST)
+    result = BCP(conn).load(input_file=files.DataFile(), table='t', autotune=True)
+    assert [(1, 50000, 5000, 4096), (50001, 100000, 20000, 4096), (100001, 150000, 100000, 4096),
+            (150001, 200000, 20000, 16384), (200001, 250000, 20000, 32768), (250001, None, 20000, 16384)] == loads
+    assert 251000 == result.rows_copied
+    assert 6 == len(result.parts)
+    del loads[:]
+    BCP(conn).load(input_file=files.DataFile(), table='t', autotune=True)
+    assert [(None, None, 20000, 16384)] == loads
+    with pytest.raises(ValueError):
+        BCP(conn).load(input_file=files.DataFile(), table='t', batch_size=1000, autotune=True)
+    with pytest.raises(ValueError):
+        BCP(conn).load(input_file=files.DataFile(), table='t', hints=mssql.LoadHints(rows_per_batch=1000),
+                       autotune=True)
+
+
+def test_tuned_load_does_not_mistake_rejected_rows_for_the_end_of_the_file(monkeypatch, tmp_path):
+    from bcp import TransferResult, tuning
+    from bcp.dialects import mssql
+    monkeypatch.setattr(tuning, 'BCP_TUNING_DIR', tmp_path / 'tuning')
+    loads = []
+
+    def execute(load):
+        loads.append((load.first_row, load.last_row))
+        if load.last_row is None:
+            return TransferResult(rows_copied=1000, rows_per_second=100.0)
+        # the first chunk rejects 3 of its rows
+        rejected = 3 if load.first_row == 1 else 0
+        return TransferResult(rows_copied=50000 - rejected, rows_rejected=rejected, rows_per_second=100.0)
+
+    monkeypatch.setattr(mssql.MSSQLLoad, 'execute', execute)
+    result = BCP(Connection(driver='mssql', host=HOST)).load(input_file=files.DataFile(), table='t', autotune=True)
+    assert 6 == len(loads)
+    assert (250001, None) == loads[-1]
+    assert 3 == result.rows_rejected
+    assert 250997 == result.rows_copied
+
+
+def test_async_tuned_load_runs_the_same_job_as_bcp(monkeypatch, tmp_path):
+    import asyncio
+    from bcp import AsyncBCP, TransferResult, aio, tuning
+    monkeypatch.setattr(tuning, 'BCP_TUNING_DIR', tmp_path / 'tuning')
+    loads = []
+
+    async def run(self, load):
+        loads.append((load.first_row, load.last_row, load.batch_size, load.packet_size))
+        return TransferResult(rows_copied=50000 if load.last_row else 1000, rows_per_second=100.0)
+
+    monkeypatch.setattr(aio.AsyncBCP, '_run', run)
+    notified = []
+    my_bcp = AsyncBCP(Connection(driver='mssql', host=HOST), hooks=[notified.append])
+    result = asyncio.run(my_bcp.load(input_file=files.DataFile(), table='t', autotune=True))
+    assert 6 == len(loads)
+    assert (250001, None) == loads[-1][:2]
+    assert [result] == notified
+    assert 251000 == result.rows_copied
+
+
+def test_async_format_files_are_generated_within_the_transfer_limits(monkeypatch, tmp_path):
+    import asyncio
+    from bcp import AsyncBCP, TransferResult, aio
+    from bcp.dialects import mssql
+    monkeypatch.setattr(mssql, 'BCP_FORMAT_DIR', tmp_path / 'formats')
+    operations = []
+
+    async def run_process(self, operation):
+        operations.append(type(operation).__name__)
+        if isinstance(operation, mssql.MSSQLDump):
+            operation.file.path.write_text('1\tid\tint\t0\n')
+        elif isinstance(operation, mssql.MSSQLFormat):
+            operation.format_file.path.write_text('<BCPFORMAT/>')
+        return TransferResult(rows_copied=1)
+
+    # every bcp process, including those reading the schema and writing the format file, goes through _run_process,
+    # which holds a transfer slot and kills bcp if it is cancelled
+    monkeypatch.setattr(aio.AsyncBCP, '_run_process', run_process)
+    my_bcp = AsyncBCP(Connection(driver='mssql', host=HOST))
+    data_file = files.DataFile(file_path=tmp_path / 'data.dat')
+    for _ in range(2):
+        asyncio.run(my_bcp.load(input_file=data_file, table='t', data_format='native'))
+    assert ['MSSQLDump', 'MSSQLFormat', 'MSSQLLoad', 'MSSQLDump', 'MSSQLLoad'] == operations
+    assert 1 == len(list((tmp_path / 'formats').iterdir()))
+
+
+def test_parallel_load_gathers_rejected_rows_into_the_quarantine_file(monkeypatch, tmp_path):
+    from bcp.dialects import mssql
+
+    def execute(load):
+        arguments = load.arguments
+        load.artifacts.create()
+        # each part rejects its second row, which bcp numbers within the part
+        record = load.file.path.read_text().splitlines()[1]
+        load.error_file.path.write_text(f'#@ Row 2, Column 2: Invalid character value @#\n{record}\n')
+        return load.result(arguments, 0, 1.0)
+
+    monkeypatch.setattr(mssql.MSSQLLoad, 'execute', execute)
+    data_file = files.DataFile(file_path=tmp_path / 'data.tsv')
+    data_file.path.write_text(''.join(f'{row}\tb\n' for row in range(1, 11)))
+    quarantine_file = files.DataFile(file_path=tmp_path / 'quarantine.tsv')
+    my_bcp = BCP(Connection(driver='mssql', host=HOST))
+    result = my_bcp.load(input_file=data_file, table='t', parallelism=2, max_errors=5, quarantine_file=quarantine_file)
+    assert 2 == result.rows_rejected
+    assert quarantine_file is result.quarantine_file
+    expected = ['2\t2\tInvalid character value\t2\tb', '8\t2\tInvalid character value\t8\tb']
+    assert expected == quarantine_file.path.read_text().splitlines()
+    # the rows are numbered the same way when the starts of the parts are found through the record index
+    data_file.scan(workers=1, stride=3)
+    my_bcp.load(input_file=data_file, table='t', parallelism=2, max_errors=5, quarantine_file=quarantine_file)
+    assert expected == quarantine_file.path.read_text().splitlines()
+
+
+def test_incremental_dumps_export_new_rows_into_a_sequence_of_files(monkeypatch, tmp_path):
+    from bcp import TransferResult, watermarks
+    from bcp.dialects import mssql
+    monkeypatch.setattr(watermarks, 'BCP_WATERMARK_DIR', tmp_path / 'watermarks')
+    high_water, exported = ['0x00000000000007D1'], []
+
+    def execute(dump):
+        if 'system_type_name' in dump.query:
+            dump.file.path.write_text('timestamp\n')
+        elif 'max(rv)' in dump.query:
+            dump.file.path.write_text(f'{high_water[0]}\n')
+        elif high_water[0] == 'fail':
+            raise exceptions.BCPExecutionException(1, ['bcp'], result=TransferResult(exit_code=1))
+        else:
+            exported.append((dump.file.path.name, dump.query))
+        return TransferResult(data_file=dump.file)
+
+    monkeypatch.setattr(mssql.MSSQLDump, 'execute', execute)
+    my_bcp = BCP(Connection(driver='mssql', host=HOST))
+    output_file = files.DataFile(file_path=tmp_path / 'orders.csv', delimiter=',')
+    result = my_bcp.dump_incremental('dbo.orders', 'rv', output_file)
+    assert tmp_path / 'orders.000001.csv' == result.data_file.path
+    assert my_bcp.dump_incremental('dbo.orders', 'rv', output_file).data_file is None
+    high_water[0] = 'fail'
+    with pytest.raises(exceptions.BCPExecutionException):
+        my_bcp.dump_incremental('dbo.orders', 'rv', output_file)
+    high_water[0] = '0x0000000000000BB8'
+    my_bcp.dump_incremental('dbo.orders', 'rv', output_file)
+    assert [('orders.000001.csv', 'select * from (select * from dbo.orders) as bcp_incremental '
+                                  'where rv <= 0x00000000000007D1'),
+            ('orders.000002.csv', 'select * from (select * from dbo.orders) as bcp_incremental '
+                                  'where rv > 0x00000000000007D1 and rv <= 0x0000000000000BB8')] == exported
+    watermark = watermarks.Watermark(my_bcp.connection, 'dbo.orders', 'rv')
+    assert {'high_water': '0x0000000000000BB8', 'sequence': 2} == watermark.read()
+
+
+class TestProgress:
+
+    @staticmethod
+    def bcp_printing(*lines: str, then_sleep: float = 0) -> list:
+        script = f'import sys, time\nfor line in {list(lines)!r}:\n    print(line, flush=True)\n' \
+                 f'time.sleep({then_sleep})\n'
+        return [sys.executable, '-c', script]
+
+    def test_progress_is_reported_after_every_batch(self, tmp_path):
+        from bcp.dialects import mssql
+        from bcp.progress import ProgressTracker
+        reported = []
+        tracker = ProgressTracker(reported.append, total_rows=4000)
+        lines = ['Starting copy...'] + [f'1000 rows sent to SQL Server. Total sent: {rows}' for rows in (1000, 2000)]
+        assert 0 == tracker.run('load', self.bcp_printing(*lines), tmp_path / 'bcp.log', mssql.progress_rows)
+        assert [1000, 2000] == [progress.rows for progress in reported]
+        assert 0.5 == reported[-1].fraction and reported[-1].eta > 0
+        assert '\n'.join(lines) + '\n' == (tmp_path / 'bcp.log').read_text()
+
+    def test_stalled_bcp_is_stopped(self, tmp_path):
+        from bcp.dialects import mssql
+        from bcp.progress import ProgressTracker
+        tracker = ProgressTracker(stall_timeout=0.5)
+        arguments = self.bcp_printing('1000 rows sent to SQL Server. Total sent: 1000', then_sleep=60)
+        started = time.monotonic()
+        assert 0 != tracker.run('load', arguments, tmp_path / 'bcp.log', mssql.progress_rows)
+        assert time.monotonic() - started < 10
+        assert 'was stopped' in (tmp_path / 'bcp.log').read_text()
+        assert 1000 == tracker.rows
+
+    def test_callback_can_stop_the_transfer(self, tmp_path):
+        from bcp.dialects import mssql
+        from bcp.progress import ProgressTracker
+
+        def cancel(progress):
+            raise RuntimeError('cancelled')
+
+        arguments = self.bcp_printing('1000 rows sent to SQL Server. Total sent: 1000', then_sleep=60)
+        with pytest.raises(RuntimeError):
+            ProgressTracker(cancel).run('load', arguments, tmp_path / 'bcp.log', mssql.progress_rows)
+
+    def test_progress_is_reported_by_async_transfers(self, tmp_path):
+        import asyncio
+        from bcp.dialects import mssql
+        from bcp.progress import ProgressTracker
+        tracker = ProgressTracker(stall_timeout=0.5)
+        lines = [f'1000 rows successfully bulk-copied to host-file. Total received: {rows}' for rows in (1000, 2000)]
+        run = tracker.run_async('dump', self.bcp_printing(*lines), tmp_path / 'bcp.log', mssql.progress_rows)
+        assert 0 == asyncio.run(run)
+        assert 2000 == tracker.rows
+
+    def test_rows_are_estimated_from_a_sample_of_the_file(self, tmp_path):
+        from bcp.progress import estimate_rows
+        data_file = files.DataFile(file_path=tmp_path / 'data.csv', delimiter=',')
+        data_file.path.write_text(''.join(f'{row},value\n' for row in range(1000, 3000)))
+        assert 2000 == estimate_rows(data_file)
+        assert 2000 == estimate_rows(data_file, sample_size=1100)
+        assert estimate_rows(files.DataFile(file_path=tmp_path / 'data.csv.gz')) is None
+
+
+class TestDataFileRows:
+
+    @pytest.fixture
+    def data_file(self, tmp_path):
+        data_file = files.DataFile(file_path=tmp_path / 'data.dat', delimiter='|~|', row_terminator='\r\n')
+        data_file.path.write_bytes(b'1|~|a|~||~|x\r\n2|~|b|~|\x00\r\n3\r\n\r\n4|~|d|~|e|~|f')
+        return data_file
+
+    def test_rows_are_decoded_with_nulls(self, data_file):
+        expected = [('1', 'a', None, 'x'), ('2', 'b', ''), ('3',), (None,), ('4', 'd', 'e', 'f')]
+        assert expected == list(data_file.rows())
+        assert [(None, '1'), ('', '2'), (None, '3'), (None, None), ('e', '4')] == list(data_file.rows(columns=[2, 0]))
+
+    def test_rows_are_read_across_blocks(self, data_file):
+        from bcp import reader
+        assert list(data_file.rows()) == list(reader.rows(data_file, block_size=3))
+        for columns in (None, [3, 1]):
+            expected = [tuple(None if field is None else bytes(field) for field in row)
+                        for row in data_file.rows(columns=columns, raw=True)]
+            assert expected == [tuple(None if field is None else bytes(field) for field in row)
+                                for row in reader.rows(data_file, columns=columns, raw=True, block_size=3)]
+
+    def test_raw_rows_are_views_of_the_file(self, data_file):
+        rows = list(data_file.rows(columns=[2, 0], raw=True))
+        assert all(isinstance(field, memoryview) for row in rows for field in row if field is not None)
+        assert [(b'', b'1'), (b'\x00', b'2'), (None, b'3'), (None, b''), (b'e', b'4')] == \
+            [tuple(None if field is None else bytes(field) for field in row) for row in rows]
+        assert [b'1', b'a', b'', b'x'] == [bytes(field) for field in next(data_file.rows(raw=True))]
+
+    def test_batches_hold_up_to_the_requested_rows(self, data_file):
+        assert [[('1',), ('2',)], [('3',), (None,)], [('4',)]] == list(data_file.batches(2, columns=[0]))
+
+    def test_empty_files_have_no_rows(self, tmp_path):
+        data_file = files.DataFile(file_path=tmp_path / 'empty.dat')
+        data_file.path.write_bytes(b'')
+        assert [] == list(data_file.batches(2))
+
+
+class TestSort:
+
+    @staticmethod
+    def write_unsorted(path: pathlib.Path, rows: int) -> files.DataFile:
+        records = [f'{(row * 7919) % rows}|name_{row % 13}|{"" if row % 10 == 0 else row % 5}\n' for row in range(rows)]
+        path.write_text(''.join(records))
+        return files.DataFile(file_path=path, delimiter='|')
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_sort_orders_records_across_runs(self, tmp_path, monkeypatch, workers):
+        from bcp import sorting
+        monkeypatch.setattr(sorting, 'MERGE_WIDTH', 3)
+        data_file = self.write_unsorted(tmp_path / 'data.dat', 1000)
+        sorted_file = data_file.sort(keys=[2, 0], columns=['bucket', 'id'], key_types=[int, int], workers=workers,
+                                     run_size=1000)
+        records = [line.split('|') for line in sorted_file.path.read_text().splitlines()]
+        expected = sorted((line.split('|') for line in data_file.path.read_text().splitlines()),
+                          key=lambda fields: (fields[2] != '', int(fields[2] or 0), int(fields[0])))
+        assert expected == records
+        assert tmp_path / 'data.sorted.dat' == sorted_file.path and ['bucket', 'id'] == sorted_file.order
+        assert ['data.dat', 'data.sorted.dat'] == sorted(path.name for path in tmp_path.iterdir())
+
+    def test_sort_is_stable_and_compares_bytes_by_default(self, tmp_path):
+        data_file = files.DataFile(file_path=tmp_path / 'data.csv', delimiter=',')
+        data_file.path.write_text('b,1\na,2\nB,3\nb,4\n,5\na,6')
+        sorted_file = data_file.sort(keys=[0], target=files.DataFile(file_path=tmp_path / 'out.csv', delimiter=','))
+        assert ',5\nB,3\na,2\na,6\nb,1\nb,4\n' == sorted_file.path.read_text()
+        assert sorted_file.order is None
+
+    def test_sorted_files_are_loaded_with_an_order_hint(self, monkeypatch, tmp_path):
+        from bcp import LoadHints
+        from bcp.dialects import mssql
+        hints = []
+        monkeypatch.setattr(mssql.MSSQLLoad, 'execute', lambda load: hints.append(str(load.hints)))
+        data_file = self.write_unsorted(tmp_path / 'data.dat', 10).sort(keys=[0], columns=['id'], key_types=[int])
+        my_bcp = BCP(Connection(driver='mssql', host=HOST))
+        my_bcp.load(data_file, 'table')
+        my_bcp.load(data_file, 'table', hints=LoadHints(tablock=True))
+        my_bcp.load(data_file, 'table', hints=LoadHints(order=['id DESC']))
+        assert ['ORDER(id)', 'TABLOCK, ORDER(id)', 'ORDER(id DESC)'] == hints
+
+    def test_ordered_columns_need_a_key_type(self, tmp_path):
+        data_file = self.write_unsorted(tmp_path / 'data.dat', 10)
+        with pytest.raises(ValueError):
+            data_file.sort(keys=[1], columns=['name'])
+        with pytest.raises(ValueError):
+            data_file.sort(keys=[0, 1], columns=['id', 'name'], key_types=[int, None])
+        assert ['name'] == data_file.sort(keys=[1], columns=['name'], key_types=[bytes]).order
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_descending_columns_sort_in_descending_order(self, tmp_path, monkeypatch, workers):
+        from bcp import sorting
+        monkeypatch.setattr(sorting, 'MERGE_WIDTH', 3)
+        data_file = self.write_unsorted(tmp_path / 'data.dat', 1000)
+        sorted_file = data_file.sort(keys=[2, 0], columns=['bucket desc', 'id ASC'], key_types=[int, int],
+                                     workers=workers, run_size=1000)
+        records = [line.split('|') for line in sorted_file.path.read_text().splitlines()]
+        # NULL buckets sort last in descending order
+        expected = sorted((line.split('|') for line in data_file.path.read_text().splitlines()),
+                          key=lambda fields: (fields[2] == '', -int(fields[2] or 0), int(fields[0])))
+        assert expected == records
+        assert ['bucket desc', 'id ASC'] == sorted_file.order
+        single = data_file.sort(keys=[0], columns=['id DESC'], key_types=[int], workers=workers, run_size=1000)
+        assert list(range(999, -1, -1)) == [int(line.split('|')[0]) for line in single.path.read_text().splitlines()]
+
+
+class TestColumns:
+    SCHEMA = [('id', int), ('name', str), ('amount', float), ('created', 'datetime')]
+
+    @staticmethod
+    def write_rows(path: pathlib.Path, rows: int) -> files.DataFile:
+        records = [f'{row}\t{"" if row % 7 == 0 else "" if row % 5 == 0 else f"né_{row}"}\t'
+                   f'{"" if row % 3 == 0 else row / 4}\t2020-01-{row % 28 + 1:02d}\n' for row in range(rows)]
+        path.write_text(''.join(records).replace('\t\t', '\t\0\t', 1), encoding='utf-8')
+        return files.DataFile(file_path=path)
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_columns_match_the_rows_across_chunks(self, tmp_path, workers):
+        data_file = self.write_rows(tmp_path / 'data.dat', 500)
+        columns = data_file.to_columns(self.SCHEMA, workers=workers, chunk_size=1000)
+        assert ['id', 'name', 'amount', 'created'] == list(columns)
+        expected = [(int(id_), name, None if amount is None else float(amount), created)
+                    for id_, name, amount, created in data_file.rows()]
+        assert expected == list(zip(*(columns[name] for name, _ in self.SCHEMA)))
+        assert '' == columns['name'][0] and None is columns['name'][5] and 'né_499' == columns['name'][-1]
+        assert 167 == columns['amount'].null_count and 0 == columns['id'].null_count
+        assert 'q' == columns['id'].values.typecode and 'd' == columns['amount'].values.typecode
+        assert 500 * 8 + 63 == columns['id'].nbytes
+
+    def test_empty_files_have_empty_columns(self, tmp_path):
+        data_file = files.DataFile(file_path=tmp_path / 'empty.dat')
+        data_file.path.write_bytes(b'')
+        columns = data_file.to_columns(self.SCHEMA)
+        assert all(0 == len(column) for column in columns.values())
+
+    def test_ragged_and_invalid_records_are_rejected(self, tmp_path):
+        data_file = files.DataFile(file_path=tmp_path / 'data.csv', delimiter=',')
+        data_file.path.write_text('1,a\n2\n')
+        with pytest.raises(ValueError, match='has 1 fields, expected 2'):
+            data_file.to_columns([('id', int), ('name', str)])
+        data_file.path.write_text('1,a\nx,b\n')
+        with pytest.raises(ValueError):
+            data_file.to_columns([('id', int), ('name', str)])
+
+    def test_schemas_are_read_from_format_files(self, monkeypatch, tmp_path):
+        from bcp.dialects import mssql
+        format_file = files.FormatFile(file_path=tmp_path / 'table.xml')
+        format_file.path.write_text(
+            '<?xml version="1.0"?>\n'
+            '<BCPFORMAT xmlns="http://schemas.microsoft.com/sqlserver/2004/bulkload/format" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+            ' <RECORD><FIELD ID="1" xsi:type="NativeFixed" LENGTH="8"/></RECORD>\n'
+            ' <ROW>\n'
+            '  <COLUMN SOURCE="1" NAME="id" xsi:type="SQLBIGINT" NULLABLE="NO"/>\n'
+            '  <COLUMN SOURCE="2" NAME="name" xsi:type="SQLNVARCHAR" NULLABLE="YES"/>\n'
+            '  <COLUMN SOURCE="3" NAME="amount" xsi:type="SQLDECIMAL" NULLABLE="YES"/>\n'
+            '  <COLUMN SOURCE="4" NAME="flag" xsi:type="SQLBIT" NULLABLE="YES"/>\n'
+            ' </ROW>\n'
+            '</BCPFORMAT>\n')
+        monkeypatch.setattr(BCP, '_format_file', lambda self, source, data_format: format_file)
+        schema = BCP(Connection(driver='mssql', host=HOST)).schema('dbo.table')
+        assert [('id', int), ('name', str), ('amount', float), ('flag', int)] == schema
+
+
+class TestRetentionPolicy:
+
+    @staticmethod
+    def make_job(directory, started, size):
+        import datetime
+        from bcp.artifacts import JobArtifacts
+        job_dir = directory / started.strftime('%Y_%m_%d') / (started.strftime('%Y_%m_%d_%H_%M_%S_%f') + '_0000abcd')
+        artifacts = JobArtifacts(job_dir)
+        artifacts.create()
+        artifacts.release()
+        artifacts.file('bcp.log').write_bytes(b'x' * size)
+        timestamp = (started + datetime.timedelta(seconds=1)).timestamp()
+        os.utime(str(artifacts.file('bcp.log')), (timestamp, timestamp))
+        return job_dir
+
+    def test_prune_removes_expired_days_and_jobs(self, tmp_path):
+        import datetime
+        from bcp.artifacts import RetentionPolicy, job_directories
+        now = datetime.datetime.now()
+        old_day = self.make_job(tmp_path, now - datetime.timedelta(days=10), 10)
+        old_job = self.make_job(tmp_path, now - datetime.timedelta(hours=3), 10)
+        new_job = self.make_job(tmp_path, now - datetime.timedelta(hours=1), 10)
+        assert 2 == RetentionPolicy(max_age=2 * 60 * 60, min_age=0, directory=tmp_path).prune()
+        assert [new_job] == job_directories(tmp_path)
+        assert not old_day.parent.exists()
+        assert not old_job.exists()
+
+    def test_prune_enforces_size_caps_oldest_first_and_skips_active_jobs(self, tmp_path):
+        import datetime
+        from bcp.artifacts import JobArtifacts, RetentionPolicy, job_directories
+        now = datetime.datetime.now()
+        jobs = [self.make_job(tmp_path, now - datetime.timedelta(minutes=minutes), 100) for minutes in (50, 40, 30)]
+        active = JobArtifacts(jobs[0])
+        active.create()
+        try:
+            assert 1 == RetentionPolicy(max_bytes=250, min_age=0, directory=tmp_path).prune()
+        finally:
+            active.release()
+        assert [jobs[0], jobs[2]] == job_directories(tmp_path)
+        assert 1 == RetentionPolicy(max_files=1, min_age=0, directory=tmp_path).prune()
+        assert [jobs[2]] == job_directories(tmp_path)
+        assert 0 == RetentionPolicy(max_files=0, min_age=3600, directory=tmp_path).prune()
+
+    def test_prune_removes_abandoned_scratch_files(self, tmp_path):
+        import time
+        from bcp.artifacts import RetentionPolicy
+        data_dir = tmp_path / 'data'
+        data_dir.mkdir()
+        abandoned, recent, output = (data_dir / name for name in ('scratch.1.dat', 'scratch.2.dat', 'output.dat'))
+        for path in (abandoned, recent, output):
+            path.write_text('1\n')
+        hour_ago = time.time() - 3600
+        for path in (abandoned, output):
+            os.utime(str(path), (hour_ago, hour_ago))
+        policy = RetentionPolicy(min_age=600, directory=tmp_path / 'jobs', data_directory=data_dir)
+        assert 0 == policy.prune()
+        assert [output, recent] == sorted(data_dir.iterdir())
+
+
+def test_state_files_are_keyed_on_their_parts_and_replaced_atomically(tmp_path):
+    import hashlib
+    from bcp import state
+    path = state.state_path(tmp_path / 'state', 'mssql', 'host', 'table')
+    key = hashlib.sha1(b'mssql\0host\0table').hexdigest()
+    assert tmp_path / 'state' / f'{key}.json' == path
+    assert hashlib.sha1(b'a\0\xff').hexdigest() == state.state_key('a', b'\xff')
+    state.write_json_atomic(path, {'sequence': 1})
+    with pytest.raises(RuntimeError):
+        with state.atomic_write(path) as staging_path:
+            staging_path.write_text('{"sequence": 2')
+            raise RuntimeError
+    assert '{"sequence": 1}' == path.read_text()
+    assert [path] == list(path.parent.iterdir())
+
+
+class TestResultCache:
+
+    @staticmethod
+    def fill(path: pathlib.Path, size: int) -> files.DataFile:
+        path.write_bytes(b'x' * (size - 1) + b'\n')
+        return files.DataFile(file_path=path)
+
+    def test_repeated_dumps_are_answered_from_the_cache(self, monkeypatch, tmp_path):
+        from bcp import ResultCache, TransferResult
+        from bcp.dialects import mssql
+        queries = []
+
+        def execute(dump):
+            queries.append(dump.query)
+            dump.file.path.write_text(f'{len(queries)}\tdata\n')
+            return TransferResult(rows_copied=1, data_file=dump.file)
+
+        monkeypatch.setattr(mssql.MSSQLDump, 'execute', execute)
+        notified = []
+        my_bcp = BCP(Connection(driver='mssql', host=HOST), hooks=[lambda result: notified.append(result.cached)])
+        cache = ResultCache(ttl=60, directory=tmp_path / 'cache')
+        first, second = files.DataFile(file_path=tmp_path / 'a.tsv'), files.DataFile(file_path=tmp_path / 'b.tsv')
+        assert not my_bcp.dump('select *  from t\nwhere x = \'a  b\';', first, cache=cache).cached
+        result = my_bcp.dump(' select * from t where x = \'a  b\'', second, cache=cache)
+        assert result.cached and 1 == result.rows_copied and second is result.data_file
+        assert '1\tdata\n' == second.path.read_text()
+        assert [False, True] == notified
+        my_bcp.dump('select * from t where x = \'a b\'', second, cache=cache)
+        assert 2 == len(queries) and '2\tdata\n' == second.path.read_text()
+        # files cloned from the cache are replaced, not overwritten, by later dumps
+        my_bcp.dump('select *  from t\nwhere x = \'a  b\';', second, cache=cache)
+        my_bcp.dump('select * from u', second)
+        assert '1\tdata\n' == first.path.read_text() and '3\tdata\n' == second.path.read_text()
+        assert my_bcp.dump('select * from t where x = \'a  b\'', second, cache=cache).cached
+        assert 3 == len(queries)
+
+    def test_entries_expire_and_are_evicted_least_recently_used_first(self, tmp_path):
+        from bcp import ResultCache, TransferResult
+        cache = ResultCache(ttl=60, max_bytes=250, directory=tmp_path / 'cache')
+        for key in ('a', 'b'):
+            assert cache.put(key, self.fill(tmp_path / f'{key}.dat', 100), TransferResult())
+        os.utime(str(tmp_path / 'cache' / 'b.json'), (time.time() - 10, time.time() - 10))
+        assert cache.put('c', self.fill(tmp_path / 'c.dat', 100), TransferResult())
+        assert not cache.put('d', self.fill(tmp_path / 'd.dat', 300), TransferResult())
+        output_file = files.DataFile(file_path=tmp_path / 'out.dat')
+        assert cache.get('b', output_file) is None
+        assert cache.get('a', output_file).cached and cache.get('c', output_file).cached
+        assert 2 == len(list((tmp_path / 'cache').glob('*.data')))
+        assert 2 == ResultCache(ttl=-1, directory=tmp_path / 'cache').evict()
+        assert [] == list((tmp_path / 'cache').iterdir())
+
+    def test_entries_modified_since_they_were_cached_are_missed(self, tmp_path):
+        from bcp import ResultCache, TransferResult
+        cache = ResultCache(directory=tmp_path / 'cache')
+        cache.put('a', self.fill(tmp_path / 'a.dat', 10), TransferResult())
+        data_path = next((tmp_path / 'cache').glob('*.data'))
+        with data_path.open('ab') as data:
+            data.write(b'more\n')
+        assert cache.get('a', files.DataFile(file_path=tmp_path / 'out.dat')) is None
+
+
+def test_transfer_result_combines_parts():
+    from bcp import TransferResult
+    parts = [TransferResult(rows_copied=100, elapsed=1.0, packet_size=4096),
+             TransferResult(rows_copied=300, elapsed=2.0, packet_size=4096, exit_code=1)]
+    result = TransferResult.combine(parts, elapsed=2.0)
+    assert 400 == result.rows_copied
+    assert 200.0 == result.rows_per_second
+    assert 4096 == result.packet_size
+    assert not result.succeeded
+    assert parts == result.parts
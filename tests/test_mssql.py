@@ -85,21 +85,21 @@ class TestMSSQLLoad:
     @pytest.mark.freeze_time
     def test_mssql_load_builds_expected_command_with_defaults(self, mssql_load_defaults):
         data_file = files.DataFile()
-        log_file = files.LogFile()
-        error_file = files.ErrorFile()
+        log_file = mssql_load_defaults.artifacts.file('bcp.log')
+        error_file = mssql_load_defaults.artifacts.file('bcp.err')
         table = 'database.schema.table'
         config = '-c -t "\t" -b 10000'
-        expected = f'{table} in "{data_file.path}" -S {HOST} -T {config} -o "{log_file.path}" -e "{error_file.path}"'
+        expected = f'{table} in "{data_file.path}" -S {HOST} -T {config} -o "{log_file}" -e "{error_file}"'
         assert expected == mssql_load_defaults.command
 
     @pytest.mark.freeze_time
     def test_mssql_load_builds_expected_command_with_batch_provided(self, mssql_load_with_batch):
         data_file = files.DataFile()
-        log_file = files.LogFile()
-        error_file = files.ErrorFile()
+        log_file = mssql_load_with_batch.artifacts.file('bcp.log')
+        error_file = mssql_load_with_batch.artifacts.file('bcp.err')
         table = 'database.schema.table'
         config = '-c -t "\t" -b 20000'
-        expected = f'{table} in "{data_file.path}" -S {HOST} -T {config} -o "{log_file.path}" -e "{error_file.path}"'
+        expected = f'{table} in "{data_file.path}" -S {HOST} -T {config} -o "{log_file}" -e "{error_file}"'
         assert expected == mssql_load_with_batch.command
 
     def test_mssql_load_builds_expected_config_with_defaults(self, mssql_load_defaults):
@@ -118,16 +118,36 @@ class TestMSSQLLoad:
         assert expected == mssql_load_with_no_character_data.config
 
     @pytest.mark.freeze_time('2019-05-01 01:00:00')
-    def test_mssql_load_builds_expected_logging_string(self, mssql_load_defaults):
-        log_file_path = BCP_ROOT_DIR / pathlib.Path('logs/2019_05_01_01_00_00_000000.log')
-        expected = f'-o "{log_file_path.absolute()}"'
-        assert expected == mssql_load_defaults.logging
+    def test_mssql_load_builds_expected_logging_string(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        mssql_load = mssql.MSSQLLoad(connection=conn, file=files.DataFile(), table='database.schema.table')
+        job_dir = mssql_load.artifacts.path
+        assert BCP_ROOT_DIR / pathlib.Path('jobs/2019_05_01') == job_dir.parent
+        assert job_dir.name.startswith('2019_05_01_01_00_00_000000_')
+        assert job_dir / pathlib.Path('bcp.log') == mssql_load.log_file.path
+        expected = f'-o "{job_dir / pathlib.Path("bcp.log")}"'
+        assert expected == mssql_load.logging
+        assert not job_dir.exists()
 
     @pytest.mark.freeze_time('2019-07-01 01:00:00')
-    def test_mssql_load_builds_expected_error_string(self, mssql_load_defaults):
-        error_file_path = BCP_ROOT_DIR / pathlib.Path('data/2019_07_01_01_00_00_000000.err')
-        expected = f'-e "{error_file_path.absolute()}"'
-        assert expected == mssql_load_defaults.error
+    def test_mssql_load_builds_expected_error_string(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        mssql_load = mssql.MSSQLLoad(connection=conn, file=files.DataFile(), table='database.schema.table')
+        job_dir = mssql_load.artifacts.path
+        assert BCP_ROOT_DIR / pathlib.Path('jobs/2019_07_01') == job_dir.parent
+        expected = f'-e "{job_dir / pathlib.Path("bcp.err")}"'
+        assert expected == mssql_load.error
+
+    def test_mssql_loads_get_unique_artifact_directories(self, mssql_load_defaults):
+        conn = Connection(host=HOST, driver=DRIVER)
+        other_load = mssql.MSSQLLoad(connection=conn, file=files.DataFile(), table='database.schema.table')
+        job_dir = mssql_load_defaults.artifacts.path
+        assert job_dir != other_load.artifacts.path
+        for _ in range(2):
+            assert f'-o "{job_dir / pathlib.Path("bcp.log")}"' in mssql_load_defaults.command
+        assert job_dir == mssql_load_defaults.artifacts.path
+        assert str(job_dir) not in other_load.command
+        assert not job_dir.exists()
 
 
 class TestMSSQLDump:
@@ -135,10 +155,10 @@ class TestMSSQLDump:
     @pytest.mark.freeze_time
     def test_mssql_dump_builds_expected_command_with_defaults(self, mssql_dump_defaults):
         data_file = files.DataFile()
-        log_file = files.LogFile()
+        log_file = mssql_dump_defaults.artifacts.file('bcp.log')
         query = 'query'
         config = '-c -t "\t"'
-        expected = f'"{query}" queryout "{data_file.path}" -S {HOST} -T {config} -o "{log_file.path}"'
+        expected = f'"{query}" queryout "{data_file.path}" -S {HOST} -T {config} -o "{log_file}"'
         assert expected == mssql_dump_defaults.command
 
     def test_mssql_dump_builds_expected_config_with_defaults(self, mssql_dump_defaults):
@@ -157,8 +177,237 @@ class TestMSSQLDump:
         assert expected == mssql_dump_with_no_character_data.config
 
     @pytest.mark.freeze_time('2019-05-01 01:00:00')
-    def test_mssql_dump_builds_expected_logging_string(self, mssql_dump_defaults):
-        log_file_path = BCP_ROOT_DIR / pathlib.Path('logs/2019_05_01_01_00_00_000000.log')
-        expected = f'-o "{log_file_path.absolute()}"'
-        assert expected == mssql_dump_defaults.logging
+    def test_mssql_dump_builds_expected_logging_string(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        mssql_dump = mssql.MSSQLDump(connection=conn, query='query', file=files.DataFile())
+        job_dir = mssql_dump.artifacts.path
+        assert BCP_ROOT_DIR / pathlib.Path('jobs/2019_05_01') == job_dir.parent
+        expected = f'-o "{job_dir / pathlib.Path("bcp.log")}"'
+        assert expected == mssql_dump.logging
+
+
+
+class TestMSSQLPartitioning:
+
+    def test_literal_renders_numbers_strings_and_dates(self):
+        import datetime
+        assert '42' == mssql.literal(42)
+        assert '1.5' == mssql.literal(1.5)
+        assert "'O''Brien'" == mssql.literal("O'Brien")
+        assert "'2019-05-01'" == mssql.literal(datetime.date(2019, 5, 1))
+
+    def test_partition_queries_cover_all_ranges(self):
+        queries = mssql.partition_queries('select * from t', 'id', [10, 20])
+        assert [
+            'select * from (select * from t) as bcp_partition where id < 10 or id is null',
+            'select * from (select * from t) as bcp_partition where id >= 10 and id < 20',
+            'select * from (select * from t) as bcp_partition where id >= 20',
+        ] == queries
+
+    def test_partition_queries_without_boundaries_returns_query(self):
+        assert ['select * from t'] == mssql.partition_queries('select * from t', 'id', [])
+
+    def test_bounds_query(self):
+        expected = 'select min(id), max(id) from (select * from t) as bcp_bounds'
+        assert expected == mssql.bounds_query('select * from t', 'id')
+
+
+def test_mssql_load_builds_arguments_without_shell_quoting():
+    conn = Connection(host=HOST, driver=DRIVER)
+    data_file = files.DataFile(file_path=pathlib.Path('/path with spaces/input.dat'), delimiter='|~|')
+    mssql_load = mssql.MSSQLLoad(connection=conn, file=data_file, table='database.schema.table')
+    arguments = mssql_load.arguments
+    assert ['bcp', 'database.schema.table', 'in', str(data_file.path)] == arguments[:4]
+    assert ['-t', '|~|'] == arguments[arguments.index('-t'):arguments.index('-t') + 2]
+
+
+class TestMSSQLLoadHints:
+
+    def test_mssql_load_builds_expected_config_with_hints_and_packet_size(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        hints = mssql.LoadHints(tablock=True, order=['id', 'created DESC'], check_constraints=True)
+        mssql_load = mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', packet_size=32768, hints=hints)
+        expected = '-c -t "\t" -b 10000 -a 32768 -h "TABLOCK, ORDER(id, created DESC), CHECK_CONSTRAINTS"'
+        assert expected == mssql_load.config
+        assert ['-h', 'TABLOCK, ORDER(id, created DESC), CHECK_CONSTRAINTS'] == mssql_load.arguments[-6:-4]
+
+    def test_batch_sizing_hints_replace_the_batch_size(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        hints = mssql.LoadHints(rows_per_batch=500000)
+        mssql_load = mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', hints=hints)
+        assert '-c -t "\t" -h "ROWS_PER_BATCH=500000"' == mssql_load.config
+        with pytest.raises(ValueError):
+            mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', batch_size=1000, hints=hints)
+        with pytest.raises(ValueError):
+            mssql.LoadHints(rows_per_batch=500000, kilobytes_per_batch=1024)
+
+    def test_mssql_load_rejects_out_of_range_packet_size(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        with pytest.raises(ValueError):
+            mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', packet_size=65536)
+
+
+class TestMSSQLNative:
+
+    def test_mssql_load_builds_expected_config_with_row_range(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        mssql_load = mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', first_row=1001, last_row=2000)
+        assert '-c -t "\t" -b 10000 -F 1001 -L 2000' == mssql_load.config
+
+    def test_mssql_load_builds_expected_config_with_native_data(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        mssql_load = mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', data_format='native')
+        assert '-n -b 10000' == mssql_load.config
+
+    def test_mssql_dump_builds_expected_config_with_format_file(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        format_file = files.FormatFile(file_path=pathlib.Path('table.xml'))
+        mssql_dump = mssql.MSSQLDump(conn, 'query', files.DataFile(), data_format='unicode_native',
+                                     format_file=format_file)
+        assert f'-f "{format_file.path}"' == mssql_dump.config
+
+    def test_mssql_load_rejects_unknown_data_format(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        with pytest.raises(ValueError):
+            mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', data_format='binary')
+
+    @pytest.mark.freeze_time('2019-05-01 01:00:00')
+    def test_mssql_format_builds_expected_command(self):
+        conn = Connection(host=HOST, driver=DRIVER)
+        format_file = files.FormatFile(file_path=pathlib.Path('table.xml'))
+        mssql_format = mssql.MSSQLFormat(conn, 'database.schema.table', format_file, data_format='unicode_native')
+        log_file_path = mssql_format.artifacts.file('bcp.log')
+        expected = f'database.schema.table format nul -S {HOST} -T -N -f "{format_file.path}" -x ' \
+                   f'-o "{log_file_path}"'
+        assert expected == mssql_format.command
+
+    def test_fingerprint_query_describes_tables_and_queries(self):
+        assert "N'select * from database.schema.table'" in mssql.fingerprint_query('database.schema.table')
+        assert "N'select name from t where x = ''a'''" in mssql.fingerprint_query("select name from t where x = 'a'")
+
+
+def test_parse_output_reads_the_bcp_summary():
+    output = '\nStarting copy...\n1000 rows sent to SQL Server. Total sent: 1000\n\n1500 rows copied.\n' \
+             'Network packet size (bytes): 4096\n' \
+             'Clock Time (ms.) Total     : 250    Average : (6000.00 rows per sec.)\n'
+    expected = {'rows_copied': 1500, 'packet_size': 4096, 'elapsed': 0.25, 'rows_per_second': 6000.0}
+    assert expected == mssql.parse_output(output)
 
+
+def test_parse_output_of_a_failed_run_is_empty():
+    output = 'SQLState = 08001, NativeError = 2\nError = [Microsoft][ODBC Driver 17 for SQL Server]Named Pipes Provider'
+    assert {} == mssql.parse_output(output)
+
+
+def test_failed_bcp_does_not_reveal_the_password():
+    conn = Connection(host=HOST, driver=DRIVER, username=USERNAME, password='s3cret-password')
+    load = mssql.MSSQLLoad(connection=conn, file=files.DataFile(), table='database.schema.table')
+    arguments = load.arguments
+    with pytest.raises(exceptions.BCPExecutionException) as error:
+        load.result(arguments, 1, 0.0)
+    assert 's3cret-password' in arguments
+    assert 's3cret-password' not in str(error.value)
+    assert 's3cret-password' not in error.value.cmd
+    assert '********' == error.value.cmd[error.value.cmd.index('-P') + 1]
+
+
+def test_committed_rows_counts_whole_batches():
+    output = '1000 rows sent to SQL Server. Total sent: 1000\n1000 rows sent to SQL Server. Total sent: 2000\n' \
+             '1000 rows sent to SQL Server. Total sent: 3000\n'
+    assert 2000 == mssql.committed_rows(output, batch_size=2000)
+    assert 3000 == mssql.committed_rows(output, batch_size=1000)
+    assert 0 == mssql.committed_rows('SQLState = 08001, NativeError = 2\n', batch_size=1000)
+
+
+def test_load_result_quarantines_rejected_rows(tmp_path):
+    from bcp.artifacts import JobArtifacts
+    conn = Connection(host=HOST, driver=DRIVER)
+    mssql_load = mssql.MSSQLLoad(conn, files.DataFile(delimiter=','), 'database.schema.table', max_errors=100)
+    mssql_load.artifacts = JobArtifacts(tmp_path)
+    mssql_load.error_file = files.ErrorFile(file_path=tmp_path / 'bcp.err')
+    arguments = mssql_load.arguments
+    assert ['-m', '100'] == arguments[arguments.index('-m'):arguments.index('-m') + 2]
+    mssql_load.error_file.path.write_text('#@ Row 2, Column 3: Invalid character value for cast specification @#\r\n'
+                                          '2,second,not a number\r\n'
+                                          '#@ Row 7, Column 1: String data, right truncation @#\r\n'
+                                          '7,x,y\r\n')
+    result = mssql_load.result(arguments, 0, 1.0)
+    assert 2 == result.rows_rejected
+    assert ['2,3,Invalid character value for cast specification,2,second,not a number',
+            '7,1,String data  right truncation,7,x,y'] == result.quarantine_file.path.read_text().splitlines()
+
+
+def test_incremental_query_bounds_the_watermark():
+    assert 'select * from dbo.orders' == mssql.incremental_query('dbo.orders', 'modified_at')
+    expected = "select * from (select * from dbo.orders) as bcp_incremental " \
+               "where modified_at > '2019-05-01T01:00:00' and modified_at <= '2019-05-02T01:00:00'"
+    assert expected == mssql.incremental_query('dbo.orders', 'modified_at', "'2019-05-01T01:00:00'",
+                                               "'2019-05-02T01:00:00'")
+    assert 'max(row_version) as high_water from (select id from t) as bcp_watermark' \
+        in mssql.watermark_query('select id from t', 'row_version', 'timestamp')
+
+
+def test_watermark_query_renders_each_type_as_a_literal_of_its_own_type():
+    def literal(column_type):
+        query = mssql.watermark_query('dbo.orders', 'modified_at', column_type)
+        assert query.endswith(' from (select max(modified_at) as high_water from (select * from dbo.orders) '
+                              'as bcp_watermark) as bcp_high_water')
+        return query[len('select '):query.index(' from (select max(')]
+
+    assert "'''' + convert(varchar(max), convert(datetime, high_water), 126) + ''''" == literal('datetime')
+    assert "'''' + convert(varchar(max), convert(datetimeoffset, high_water), 126) + ''''" \
+        == literal('datetimeoffset(7)')
+    assert "'''' + convert(varchar(max), convert(time, high_water), 126) + ''''" == literal('time(3)')
+    assert "'''' + convert(varchar(max), high_water) + ''''" == literal('uniqueidentifier')
+    assert 'convert(varchar(max), convert(money, high_water), 2)' == literal('money')
+    # rowversions cannot be held in a sql_variant, so they are rendered from their own type
+    assert 'convert(varchar(max), convert(varbinary(max), high_water), 1)' == literal('timestamp')
+    assert 'convert(varchar(max), convert(varbinary(max), high_water), 1)' == literal('binary(8)')
+    # integers and decimals are rendered unquoted as they are
+    assert 'convert(varchar(max), high_water)' == literal('decimal(18,2)')
+
+
+def test_watermark_query_rejects_types_that_cannot_be_compared():
+    for column_type in ('xml', 'varchar(max)', 'nvarchar(MAX)', 'varbinary(max)', 'text', 'geography'):
+        with pytest.raises(ValueError):
+            mssql.watermark_query('dbo.orders', 'modified_at', column_type)
+
+
+def test_column_type_query_finds_the_column_by_name():
+    expected = ("select system_type_name from sys.dm_exec_describe_first_result_set(N'select * from dbo.orders', "
+                "null, 0) where name = N'row version'")
+    assert expected == mssql.column_type_query('dbo.orders', '[row version]')
+
+
+def test_arguments_pass_quotes_and_spaces_through_unchanged(tmp_path):
+    conn = Connection(host=HOST, port=PORT, driver=DRIVER, username=USERNAME, password='pa"ss word')
+    data_file = files.DataFile(file_path=tmp_path / 'my "quoted" file.dat', delimiter='\\')
+    query = 'select "name", \'it\'\'s\' from t'
+    mssql_dump = mssql.MSSQLDump(conn, query, data_file)
+    arguments = mssql_dump.arguments
+    expected = ['bcp', query, 'queryout', str(data_file.path), '-S', f'{HOST},{PORT}', '-U', USERNAME, '-P',
+                'pa"ss word', '-c', '-t', '\\', '-o', str(mssql_dump.log_file.path)]
+    assert expected == arguments
+    assert '-P ********' in mssql_dump.command and 'pa"ss' not in mssql_dump.command
+
+
+def test_argument_templates_are_shared_by_jobs_with_the_same_options():
+    conn = Connection(host=HOST, driver=DRIVER)
+    data_file = files.DataFile()
+    loads = [mssql.MSSQLLoad(conn, data_file, 'database.schema.table', batch_size=5000) for _ in range(2)]
+    mssql.argument_template.cache_clear()
+    first, second = (load.arguments for load in loads)
+    assert 1 == mssql.argument_template.cache_info().hits
+    assert first[:-4] == second[:-4] and ['-b', '5000', '-o'] == first[-6:-3]
+    assert ['-e', str(loads[1].error_file.path)] == second[-2:]
+
+
+def test_tracked_transfers_read_progress_from_stdout():
+    from bcp.progress import ProgressTracker
+    conn = Connection(host=HOST, driver=DRIVER)
+    mssql_load = mssql.MSSQLLoad(conn, files.DataFile(), 'database.schema.table', progress=ProgressTracker())
+    assert '-o' not in mssql_load.arguments and '-e' in mssql_load.arguments
+    assert f'-o "{mssql_load.log_file.path}"' == mssql_load.logging
+    assert 5000 == mssql.progress_rows('1000 rows sent to SQL Server. Total sent: 5000\n')
+    assert 7 == mssql.progress_rows('1 rows successfully bulk-copied to host-file. Total received: 7')
+    assert mssql.progress_rows('Starting copy...') is None